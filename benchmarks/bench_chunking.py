@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# benchmarks/bench_chunking.py - Banc d'essai du magasin de blocs
+"""
+Mesure le découpage en blocs définis par le contenu utilisé par le magasin de blocs
+('update.chunks') : débit du découpage et de la compression gzip resynchronisable, et
+taux de déduplication entre builds consécutifs.
+
+Deux modes :
+  - synthétique (par défaut) : un contenu de référence (fichier binaire peu compressible et
+    export texte) est modifié légèrement à chaque build (insertion, écrasement, lignes
+    changées) ; chaque build est archivé (tar + gzip resynchronisable) puis découpé ;
+  - scripts réels (--scripts ANCIEN NOUVEAU) : découpe deux scripts générés comme le fait
+    le builder et calcule la part du nouveau script téléchargée par une mise à jour.
+
+La reconstruction (plan à partir de l'index de l'ancien build, assemblage, vérification
+SHA256) est simulée en Python pour chaque build.
+
+Utilisation:
+    python benchmarks/bench_chunking.py [--binary-mb 32] [--text-mb 16] [--builds 5] [--json résultats.json]
+    python benchmarks/bench_chunking.py --scripts ancien.sh nouveau.sh
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import random
+import sys
+import tarfile
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nvbuilder.chunker import iter_chunks, RsyncableGzipWriter, _region_blocks, _script_parts  # noqa: E402
+from nvbuilder.delta import read_script_layout  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def make_content(rng: random.Random, binary_mb: int, text_mb: int) -> Dict[str, bytearray]:
+    """Contenu de référence : binaire aléatoire (modèle) et export SQL (texte répétitif)."""
+    binary = bytearray(rng.randbytes(binary_mb * MB))
+    lines, size, i = [], 0, 0
+    while size < text_mb * MB:
+        line = f"INSERT INTO mesures VALUES ({i}, 'capteur_{i % 977}', {rng.random() * 1000:.4f});\n"
+        lines.append(line)
+        size += len(line)
+        i += 1
+    return {'data/model.bin': binary, 'data/dump.sql': bytearray("".join(lines).encode('utf-8'))}
+
+
+def mutate(rng: random.Random, content: Dict[str, bytearray]):
+    """Modifie légèrement le contenu : une insertion et un écrasement dans le binaire, quelques lignes du texte."""
+    binary = content['data/model.bin']
+    pos = rng.randrange(len(binary))
+    binary[pos:pos] = rng.randbytes(rng.randrange(1, 4096))
+    pos = rng.randrange(len(binary) - 512)
+    binary[pos:pos + 512] = rng.randbytes(512)
+    text = content['data/dump.sql']
+    for _ in range(3):
+        pos = text.find(b"\n", rng.randrange(len(text) - 200)) + 1
+        end = text.find(b"\n", pos) + 1
+        text[pos:end] = f"UPDATE mesures SET valeur = {rng.random():.6f} WHERE id = {rng.randrange(10**6)};\n".encode('utf-8')
+
+
+def archive(content: Dict[str, bytearray], build: int, level: int) -> Tuple[bytes, float, int]:
+    """
+    Archive le contenu comme le builder (tar + gzip resynchronisable).
+
+    Returns:
+        Tuple: (archive compressée, durée de compression, taille d'une archive gzip classique)
+    """
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode='w|') as tar:
+        for name in sorted(content):
+            info = tarfile.TarInfo(name)
+            info.size = len(content[name])
+            info.mtime = 1_700_000_000 + build
+            tar.addfile(info, io.BytesIO(bytes(content[name])))
+    raw = tar_buffer.getvalue()
+
+    out = io.BytesIO()
+    start = time.perf_counter()
+    with RsyncableGzipWriter(out, level) as writer:
+        for offset in range(0, len(raw), tarfile.RECORDSIZE):
+            writer.write(raw[offset:offset + tarfile.RECORDSIZE])
+    duration = time.perf_counter() - start
+    return out.getvalue(), duration, len(gzip.compress(raw, level, mtime=0))
+
+
+def chunk(data: bytes) -> Tuple[List[Tuple[str, int, int]], float]:
+    """Découpe un flux. Retourne les blocs (sha256, offset, taille) et la durée du découpage."""
+    start = time.perf_counter()
+    chunks, offset = [], 0
+    for piece in iter_chunks(data[i:i + MB] for i in range(0, len(data), MB)):
+        chunks.append((hashlib.sha256(piece).hexdigest(), offset, len(piece)))
+        offset += len(piece)
+    return chunks, time.perf_counter() - start
+
+
+def reconstruct(old_data: bytes, old_chunks: List[Tuple[str, int, int]], new_data: bytes,
+                new_chunks: List[Tuple[str, int, int]]) -> Dict[str, Any]:
+    """
+    Simule la mise à jour côté cible : plages locales fusionnées, blocs manquants
+    « téléchargés » (lus dans le nouveau flux), assemblage puis vérification du SHA256.
+    """
+    start = time.perf_counter()
+    local = {sha: offset for sha, offset, _ in old_chunks}
+    plan: List[Tuple[str, int, int]] = []
+    fetched_bytes, fetched_count, requested = 0, 0, set()
+    for sha, offset, size in new_chunks:
+        if sha in local:
+            source = local[sha]
+            if plan and plan[-1][0] == 'local' and plan[-1][1] + plan[-1][2] == source:
+                plan[-1] = ('local', plan[-1][1], plan[-1][2] + size)
+            else:
+                plan.append(('local', source, size))
+        else:
+            plan.append(('fetch', offset, size))
+            if sha not in requested:
+                requested.add(sha)
+                fetched_bytes += size
+                fetched_count += 1
+    rebuilt = hashlib.sha256()
+    for kind, offset, size in plan:
+        rebuilt.update(old_data[offset:offset + size] if kind == 'local' else new_data[offset:offset + size])
+    if rebuilt.hexdigest() != hashlib.sha256(new_data).hexdigest():
+        raise RuntimeError("reconstruction incorrecte")
+    return {
+        'fetched_bytes': fetched_bytes,
+        'fetched_chunks': fetched_count,
+        'local_ranges': sum(1 for kind, _, _ in plan if kind == 'local'),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def run_synthetic(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    print(f"Contenu de référence : {args.binary_mb} Mo binaires + {args.text_mb} Mo texte, {args.builds} builds")
+    content = make_content(rng, args.binary_mb, args.text_mb)
+    results: Dict[str, Any] = {'mode': 'synthetic', 'binary_mb': args.binary_mb, 'text_mb': args.text_mb,
+                               'level': args.level, 'builds': []}
+    previous = None
+    print(f"{'build':>5} {'archive':>10} {'surcoût':>8} {'gzip':>9} {'découpage':>10} {'blocs':>6} "
+          f"{'moyenne':>8} {'à télécharger':>14} {'dédup':>7} {'reconstr.':>10}")
+    for build in range(args.builds):
+        if build:
+            mutate(rng, content)
+        data, gzip_seconds, plain_size = archive(content, build, args.level)
+        chunks, chunk_seconds = chunk(data)
+        entry: Dict[str, Any] = {
+            'build': build,
+            'archive_size': len(data),
+            'plain_gzip_size': plain_size,
+            'gzip_mb_s': len(data) / MB / gzip_seconds,
+            'chunking_mb_s': len(data) / MB / chunk_seconds,
+            'chunks': len(chunks),
+            'average_chunk': len(data) // max(len(chunks), 1),
+        }
+        if previous:
+            update = reconstruct(previous[0], previous[1], data, chunks)
+            entry.update({
+                'fetched_bytes': update['fetched_bytes'],
+                'fetched_chunks': update['fetched_chunks'],
+                'local_ranges': update['local_ranges'],
+                'dedup_ratio': 1 - update['fetched_bytes'] / len(data),
+                'reconstruction_mb_s': len(data) / MB / update['seconds'],
+            })
+        results['builds'].append(entry)
+        previous = (data, chunks)
+        overhead = (entry['archive_size'] / entry['plain_gzip_size'] - 1) * 100
+        line = (f"{build:>5} {entry['archive_size'] / MB:>8.2f}Mo {overhead:>+7.2f}% {entry['gzip_mb_s']:>6.1f}Mo/s "
+                f"{entry['chunking_mb_s']:>7.1f}Mo/s {entry['chunks']:>6} {entry['average_chunk'] / 1024:>6.0f}Ko")
+        if 'dedup_ratio' in entry:
+            line += (f" {entry['fetched_bytes'] / 1024:>11.0f}Ko {entry['dedup_ratio'] * 100:>6.2f}%"
+                     f" {entry['reconstruction_mb_s']:>6.0f}Mo/s")
+        print(line)
+
+    updates = [b for b in results['builds'] if 'dedup_ratio' in b]
+    if updates:
+        results['mean_dedup_ratio'] = sum(b['dedup_ratio'] for b in updates) / len(updates)
+        results['mean_chunking_mb_s'] = sum(b['chunking_mb_s'] for b in results['builds']) / len(results['builds'])
+        print(f"Déduplication moyenne : {results['mean_dedup_ratio'] * 100:.2f}% - "
+              f"découpage moyen : {results['mean_chunking_mb_s']:.1f} Mo/s")
+    return results
+
+
+def script_chunks(script_path: Path) -> Tuple[List[Tuple[str, int]], int, float]:
+    """Découpe un script généré région par région, comme write_chunk_index."""
+    layout = read_script_layout(script_path)
+    if not layout:
+        raise SystemExit(f"Script nvBuilder illisible: {script_path}")
+    chunks, total = [], 0
+    start = time.perf_counter()
+    with open(script_path, 'rb') as f:
+        for part in _script_parts(layout):
+            blocks = _region_blocks(f, part['offset'], part['length'], part['kind'] == 'b64')
+            for piece in iter_chunks(blocks):
+                chunks.append((hashlib.sha256(piece).hexdigest(), len(piece)))
+                total += len(piece)
+    return chunks, total, time.perf_counter() - start
+
+
+def run_scripts(args) -> Dict[str, Any]:
+    old_path, new_path = (Path(p) for p in args.scripts)
+    old_chunks, _, _ = script_chunks(old_path)
+    new_chunks, new_total, seconds = script_chunks(new_path)
+    known = {sha for sha, _ in old_chunks}
+    missing = {sha: size for sha, size in new_chunks if sha not in known}
+    fetched = sum(missing.values())
+    results = {
+        'mode': 'scripts',
+        'old_script': str(old_path),
+        'new_script': str(new_path),
+        'script_size': new_path.stat().st_size,
+        'decoded_size': new_total,
+        'chunks': len(new_chunks),
+        'chunking_mb_s': new_total / MB / seconds,
+        'fetched_chunks': len(missing),
+        'fetched_bytes': fetched,
+        'dedup_ratio': 1 - fetched / max(new_total, 1),
+    }
+    print(f"{new_path.name} : {len(new_chunks)} blocs ({new_total / MB:.2f} Mo décodés, "
+          f"découpage {results['chunking_mb_s']:.1f} Mo/s)")
+    print(f"  À télécharger depuis {old_path.name} : {len(missing)} blocs, {fetched / 1024:.0f} Ko "
+          f"(déduplication {results['dedup_ratio'] * 100:.2f}%, script complet {results['script_size'] / MB:.2f} Mo)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai du magasin de blocs (découpage défini par le contenu).")
+    parser.add_argument('--binary-mb', type=int, default=32, help="Taille du fichier binaire de référence (Mo)")
+    parser.add_argument('--text-mb', type=int, default=16, help="Taille de l'export texte de référence (Mo)")
+    parser.add_argument('--builds', type=int, default=5, help="Nombre de builds consécutifs")
+    parser.add_argument('--level', type=int, default=9, help="Niveau de compression gzip")
+    parser.add_argument('--seed', type=int, default=42, help="Graine des modifications")
+    parser.add_argument('--scripts', nargs=2, metavar=('ANCIEN', 'NOUVEAU'), help="Compare deux scripts générés")
+    parser.add_argument('--json', metavar='FICHIER', help="Écrit les résultats au format JSON")
+    args = parser.parse_args()
+
+    results = run_scripts(args) if args.scripts else run_synthetic(args)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2) + "\n", encoding='utf-8')
+        print(f"Résultats écrits dans {args.json}")
+
+
+if __name__ == "__main__":
+    main()
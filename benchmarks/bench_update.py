@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+# benchmarks/bench_update.py - Banc d'essai du parcours de mise à jour
+"""
+Mesure le coût du parcours de mise à jour des scripts générés : vérification de version,
+extraction des champs de version.json ('_json_extract'), vérification du jeton de mot de
+passe, téléchargement et vérification du checksum, remplacement et relance par 'exec'.
+
+Deux builds consécutifs sont générés (une variante par valeur de UPDATE_MODES, publiées
+dans un dépôt local par 'publish'), puis le script du premier build de chaque variante est
+exécuté (sous un pseudo-terminal, le mot de passe étant saisi automatiquement) face au
+serveur de 'nvbuilder serve', avec latence, débit limité et pannes injectées.
+
+Les durées par phase sont relevées à l'affichage des messages du script ; les octets
+transférés sont comptés par le serveur (version.json, script, paquet différentiel, blocs).
+
+Utilisation:
+    python benchmarks/bench_update.py [--content-mb 16] [--runs 3] [--transfer full|delta|chunks]
+        [--encrypted] [--latency-ms 20] [--bandwidth-mb-s 50] [--fail-rate 0.2] [--json résultats.json]
+"""
+
+import argparse
+import codecs
+import contextlib
+import io
+import json
+import os
+import platform
+import pty
+import random
+import re
+import select
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nvbuilder.builder import NvBuilder  # noqa: E402
+from nvbuilder.constants import UPDATE_MODES, VERSION  # noqa: E402
+from nvbuilder.server import UpdateServer, UpdateRequestHandler  # noqa: E402
+
+MB = 1024 * 1024
+PASSWORD = "bench-update-password"
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+# Saisies du mot de passe : vérification du jeton de mise à jour, puis déchiffrement du contenu
+PASSWORD_PROMPTS = {'password': "Entrez le mot de passe", 'decrypt_password': "Mot de passe déchiffrement"}
+PROMPT_PATTERN = re.compile("|".join(re.escape(p) for p in PASSWORD_PROMPTS.values()))
+# Repères affichés par le script : (nom, début de la ligne après suppression des couleurs)
+MARKERS = [
+    ('started', "Démarrage de "),
+    ('check', "• Vérification des mises à jour"),
+    ('version', "• Actuelle:"),
+    ('token', "Vérification mot de passe OK"),
+    ('downloaded', "Checksum script OK"),
+    ('relaunch', "Relance du script"),
+]
+PHASES = ['startup', 'version_check', 'token_check', 'download', 'replace', 'relaunch', 'extraction', 'total']
+
+
+class BenchRequestHandler(UpdateRequestHandler):
+    """Serveur de mise à jour avec latence par requête, débit limité et coupures injectées."""
+
+    def do_GET(self):
+        self.request_started = time.perf_counter()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        super().do_GET()
+
+    def do_HEAD(self):
+        self.request_started = time.perf_counter()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        super().do_HEAD()
+
+    def send_body(self, f, start: int, length: int) -> int:
+        # Panne injectée : connexion fermée après la moitié du corps annoncé
+        cut = length // 2 if self.server.inject_failure() else length
+        if not self.server.bandwidth:
+            sent = super().send_body(f, start, cut) if cut else 0
+        else:
+            f.seek(start)
+            sent, began = 0, time.perf_counter()
+            while sent < cut:
+                block = f.read(min(64 * 1024, cut - sent))
+                if not block:
+                    break
+                self.connection.sendall(block)
+                sent += len(block)
+                delay = sent / self.server.bandwidth - (time.perf_counter() - began)
+                if delay > 0:
+                    time.sleep(delay)
+        if cut < length:
+            self.close_connection = True
+            self.server.failures += 1
+        return sent
+
+    def record_transfer(self, path: Optional[Path], status: int, sent: int):
+        super().record_transfer(path, status, sent)
+        name = path.relative_to(self.server.root).as_posix() if path else self.path
+        with self.server.transfers_lock:
+            self.server.transfers.append({
+                'path': name, 'status': status, 'bytes': sent,
+                'seconds': time.perf_counter() - getattr(self, 'request_started', time.perf_counter()),
+            })
+
+
+class BenchServer(UpdateServer):
+    """UpdateServer conservant le détail des transferts et injectant les conditions réseau."""
+
+    def __init__(self, root: Path, latency_ms: float, bandwidth_mb_s: float, fail_rate: float, seed: int):
+        self.latency = latency_ms / 1000
+        self.bandwidth = bandwidth_mb_s * MB
+        self.fail_rate = fail_rate
+        self.failures = 0
+        self.transfers: List[Dict[str, Any]] = []
+        self.transfers_lock = threading.Lock()
+        self._rng = random.Random(seed)
+        super().__init__(root, '127.0.0.1', 0, BenchRequestHandler)
+
+    def inject_failure(self) -> bool:
+        with self.transfers_lock:
+            return self.fail_rate > 0 and self._rng.random() < self.fail_rate
+
+    def reset(self) -> None:
+        with self.transfers_lock:
+            self.transfers.clear()
+            self.failures = 0
+
+
+def make_content(content_dir: Path, content_mb: int, rng: random.Random):
+    """Contenu de référence : un gros fichier de données et une petite application modifiée à chaque build."""
+    (content_dir / 'data').mkdir(parents=True, exist_ok=True)
+    (content_dir / 'app').mkdir(parents=True, exist_ok=True)
+    (content_dir / 'data' / 'model.bin').write_bytes(rng.randbytes(content_mb * MB))
+    (content_dir / 'start.sh').write_text("#!/bin/bash\necho \"Application $(cat app/version.txt)\"\n", encoding='utf-8')
+    os.chmod(content_dir / 'start.sh', 0o755)
+
+
+def write_config(work_dir: Path, base_url: str, args) -> Path:
+    """Configuration du banc : une variante par mode de mise à jour, publiée dans work_dir/repo."""
+    encrypted = args.encrypted
+    variants = []
+    for mode in UPDATE_MODES:
+        variants.append({
+            'name': mode,
+            'output': {'path': f"build/bench-{mode}.sh"},
+            'update': {
+                'mode': mode,
+                'version_url': f"{base_url}/version-{mode}.json",
+                'package_url': f"{base_url}/bench-{mode}.sh",
+                'version_file_path': f"build/version-{mode}.json",
+            },
+        })
+    config = {
+        'content': './content',
+        'script': 'start.sh',
+        # Segments inchangés repris du build précédent à ce chemin (paquets différentiels)
+        'output': {'path': f"build/bench-{UPDATE_MODES[0]}.sh"},
+        'compression': {'method': 'gz', 'level': 6, 'encrypted': encrypted},
+        'payload': {'segmentation': 'directory'},
+        'update': {
+            'enabled': True,
+            'delta': args.transfer == 'delta',
+            'chunks': args.transfer == 'chunks',
+            'max_time': args.max_time,
+        },
+        'publish': {'enabled': True, 'repo_dir': 'repo', 'keep': 0},
+        'variants': variants,
+        'generate_metadata_file': True,
+    }
+    config_path = work_dir / 'bench.yaml'
+    config_path.write_text(yaml.safe_dump(config, sort_keys=False), encoding='utf-8')
+    return config_path
+
+
+def build(config_path: Path, previous_version: Optional[str]) -> str:
+    """Génère et publie un build. Retourne sa version (unique à la seconde près)."""
+    while previous_version and time.strftime("%Y%m%d%H%M%S") <= previous_version:
+        time.sleep(0.05)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        builder = NvBuilder(str(config_path))
+        builder._prompt_password = lambda label=None: PASSWORD
+        script_path = builder.build()
+    if not script_path:
+        sys.stderr.write(output.getvalue())
+        raise SystemExit("Build échoué")
+    return builder.build_version
+
+
+def run_script(script_path: Path, env: Dict[str, str], timeout: float) -> Tuple[Dict[str, List[float]], float, int, str]:
+    """
+    Exécute un script sous un pseudo-terminal ('/dev/tty' disponible pour la saisie du mot de passe).
+
+    Returns:
+        Tuple: (instants de chaque repère, durée totale, code de sortie, sortie sans couleurs)
+        ; les repères 'password' et 'decrypt_password' sont les instants des saisies du mot de passe
+    """
+    marks: Dict[str, List[float]] = {}
+    started = time.perf_counter()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(script_path.parent)
+        os.execvpe('bash', ['bash', str(script_path)], env)
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending, stream, transcript, answered = "", "", [], 0
+    deadline = started + timeout
+    try:
+        while time.perf_counter() < deadline:
+            ready, _, _ = select.select([fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                break
+            if not data:
+                break
+            now = time.perf_counter() - started
+            text = decoder.decode(data)
+            pending += ANSI_ESCAPE.sub('', text).replace('\r', '')
+            *lines, pending = pending.split('\n')
+            for line in lines:
+                transcript.append(line)
+                for name, prefix in MARKERS:
+                    if line.strip().startswith(prefix):
+                        marks.setdefault(name, []).append(now)
+            # Une réponse par invite affichée (l'invite n'est pas suivie d'un saut de ligne)
+            stream += text
+            for prompt in PROMPT_PATTERN.findall(ANSI_ESCAPE.sub('', stream))[answered:]:
+                os.write(fd, (PASSWORD + "\n").encode('utf-8'))
+                name = next(n for n, p in PASSWORD_PROMPTS.items() if p == prompt)
+                marks.setdefault(name, []).append(time.perf_counter() - started)
+                answered += 1
+        else:
+            os.kill(pid, signal.SIGKILL)
+    finally:
+        _, status = os.waitpid(pid, 0)
+        os.close(fd)
+    total = time.perf_counter() - started
+    return marks, total, os.waitstatus_to_exitcode(status), "\n".join(transcript + [pending])
+
+
+def phases_from_marks(marks: Dict[str, List[float]], total: float) -> Dict[str, Optional[float]]:
+    """Durées des phases (secondes) à partir des repères ; None pour une phase absente."""
+    first = {name: times[0] for name, times in marks.items()}
+    relaunched = marks.get('started', [])[1] if len(marks.get('started', [])) > 1 else None
+
+    def span(start: Optional[float], end: Optional[float]) -> Optional[float]:
+        return round(end - start, 4) if start is not None and end is not None else None
+
+    after_version = first.get('token', first.get('version'))
+    last_update_mark = relaunched or first.get('downloaded') or first.get('version') or first.get('check')
+    return {
+        'startup': span(0.0, first.get('check')),
+        'version_check': span(first.get('check'), first.get('version')),
+        'token_check': span(first.get('password'), first.get('token')),
+        'download': span(after_version, first.get('downloaded')),
+        'replace': span(first.get('downloaded'), first.get('relaunch')),
+        'relaunch': span(first.get('relaunch'), relaunched),
+        'extraction': span(last_update_mark, total),
+        'total': round(total, 4),
+    }
+
+
+def transfer_bytes(transfers: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Octets envoyés par le serveur, par type de fichier."""
+    totals = {'version': 0, 'script': 0, 'delta': 0, 'chunks': 0}
+    for item in transfers:
+        path = item['path']
+        if path.endswith('.json'):
+            kind = 'version'
+        elif path.endswith('.delta'):
+            kind = 'delta'
+        elif path.endswith('.chunks') or path.startswith('chunks/'):
+            kind = 'chunks'
+        else:
+            kind = 'script'
+        totals[kind] += item['bytes']
+    totals['total'] = sum(totals.values())
+    return totals
+
+
+def bench_json_extract(script_path: Path, version_file: Path, iterations: int) -> Optional[float]:
+    """
+    Durée (ms) de l'extraction des champs de version.json par '_json_extract', reprise du
+    script généré et appelée comme lors de la vérification (trois champs).
+    """
+    with open(script_path, 'rb') as f:
+        header = f.read(512 * 1024).decode('utf-8', errors='replace')
+    match = re.search(r"^[ \t]*_json_extract\(\) \{[ \t]*\n.*?\n[ \t]*\}\n", header, re.S | re.M)
+    if not match:
+        return None
+    program = match.group(0) + f"""
+set -o pipefail
+json=$(cat "$1")
+start=$EPOCHREALTIME
+for ((i = 0; i < {iterations}; i++)); do
+    _json_extract "$json" build_version >/dev/null
+    _json_extract "$json" script_checksum_sha256 >/dev/null
+    _json_extract "$json" password_check_token_b64 >/dev/null
+done
+echo "$start $EPOCHREALTIME"
+"""
+    result = subprocess.run(['bash', '-c', program, 'bench', str(version_file)], capture_output=True, text=True,
+                            env=dict(os.environ, LC_ALL='C'), check=True)
+    start, end = (float(v) for v in result.stdout.split())
+    return round((end - start) / iterations * 1000, 3)
+
+
+def tool_version(command: List[str]) -> str:
+    try:
+        return subprocess.run(command, capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        return "absent"
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Médiane des phases et moyenne des octets par mode."""
+    summary = {}
+    for mode in UPDATE_MODES:
+        mode_runs = [r for r in runs if r['mode'] == mode]
+        if not mode_runs:
+            continue
+        phases = {}
+        for phase in PHASES:
+            values = [r['phases'][phase] for r in mode_runs if r['phases'][phase] is not None]
+            phases[phase] = round(statistics.median(values), 4) if values else None
+        summary[mode] = {
+            'runs': len(mode_runs),
+            'updated': sum(1 for r in mode_runs if r['updated']),
+            'phases_median': phases,
+            'bytes_mean': {k: int(statistics.mean(r['bytes'][k] for r in mode_runs)) for k in mode_runs[0]['bytes']},
+            'injected_failures': sum(r['injected_failures'] for r in mode_runs),
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, Any]):
+    def cell(value: Optional[float]) -> str:
+        return f"{value * 1000:>9.0f}" if value is not None else f"{'-':>9}"
+
+    print(f"\n{'mode':<20} {'MàJ':>5} " + " ".join(f"{p[:9]:>9}" for p in PHASES) + f" {'version':>8} {'paquet':>9}")
+    print(f"{'':<20} {'':>5} " + " ".join(f"{'ms':>9}" for _ in PHASES) + f" {'Ko':>8} {'Ko':>9}")
+    for mode, entry in summary.items():
+        transferred = entry['bytes_mean']
+        package = transferred['script'] + transferred['delta'] + transferred['chunks']
+        print(f"{mode:<20} {entry['updated']:>2}/{entry['runs']:<2} "
+              + " ".join(cell(entry['phases_median'][p]) for p in PHASES)
+              + f" {transferred['version'] / 1024:>8.1f} {package / 1024:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai du parcours de mise à jour des scripts générés.")
+    parser.add_argument('--content-mb', type=int, default=16, help="Taille du contenu de référence (Mo)")
+    parser.add_argument('--runs', type=int, default=3, help="Exécutions par mode de mise à jour")
+    parser.add_argument('--transfer', choices=['full', 'delta', 'chunks'], default='full',
+                        help="Téléchargement complet, paquet différentiel ou magasin de blocs")
+    parser.add_argument('--encrypted', action='store_true', help="Scripts chiffrés (vérification du jeton de mot de passe)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latence ajoutée à chaque requête (ms)")
+    parser.add_argument('--bandwidth-mb-s', type=float, default=0, help="Débit maximal par connexion (Mo/s, 0 : illimité)")
+    parser.add_argument('--fail-rate', type=float, default=0, help="Probabilité qu'un transfert soit coupé à mi-parcours")
+    parser.add_argument('--max-time', type=int, default=30, help="update.max_time des scripts générés (s)")
+    parser.add_argument('--json-iterations', type=int, default=200, help="Appels de '_json_extract' mesurés")
+    parser.add_argument('--timeout', type=float, default=300, help="Durée maximale d'une exécution (s)")
+    parser.add_argument('--seed', type=int, default=42, help="Graine du contenu et des pannes injectées")
+    parser.add_argument('--work-dir', help="Répertoire de travail conservé (temporaire sinon)")
+    parser.add_argument('--json', metavar='FICHIER', help="Écrit les résultats au format JSON")
+    args = parser.parse_args()
+    if args.encrypted and args.transfer != 'full':
+        parser.error("--encrypted n'est compatible qu'avec --transfer full")
+
+    with contextlib.ExitStack() as stack:
+        if args.work_dir:
+            work_dir = Path(args.work_dir).resolve()
+            shutil.rmtree(work_dir, ignore_errors=True)
+            work_dir.mkdir(parents=True)
+        else:
+            work_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="nvb_bench_")))
+        rng = random.Random(args.seed)
+        (work_dir / 'repo').mkdir()
+        server = stack.enter_context(BenchServer(work_dir / 'repo', args.latency_ms, args.bandwidth_mb_s,
+                                                 args.fail_rate, args.seed))
+        server.start()
+
+        # Deux builds publiés : les scripts du premier se mettent à jour vers le second
+        make_content(work_dir / 'content', args.content_mb, rng)
+        config_path = write_config(work_dir, server.url, args)
+        versions = []
+        for build_number in (1, 2):
+            (work_dir / 'content' / 'app').mkdir(exist_ok=True)
+            (work_dir / 'content' / 'app' / 'version.txt').write_text(f"{build_number}\n", encoding='utf-8')
+            started = time.perf_counter()
+            versions.append(build(config_path, versions[-1] if versions else None))
+            print(f"Build {versions[-1]} publié ({len(UPDATE_MODES)} variantes, {args.content_mb} Mo, "
+                  f"{time.perf_counter() - started:.1f}s)")
+
+        old_release = work_dir / 'repo' / 'releases' / versions[0]
+        json_extract_ms = bench_json_extract(old_release / f"bench-{UPDATE_MODES[0]}.sh",
+                                             work_dir / 'repo' / f"version-{UPDATE_MODES[0]}.json", args.json_iterations)
+        if json_extract_ms is not None:
+            print(f"_json_extract (3 champs) : {json_extract_ms:.2f} ms")
+
+        runs = []
+        for mode in UPDATE_MODES:
+            for run in range(args.runs):
+                run_dir = work_dir / 'runs' / f"{mode}-{run}"
+                run_dir.mkdir(parents=True)
+                script_path = run_dir / f"bench-{mode}.sh"
+                shutil.copy2(old_release / script_path.name, script_path)
+                env = dict(os.environ, XDG_CACHE_HOME=str(run_dir / 'cache'), TMPDIR=str(run_dir))
+                server.reset()
+                marks, total, exit_code, output = run_script(script_path, env, args.timeout)
+                with server.transfers_lock:
+                    transfers = list(server.transfers)
+                    failures = server.failures
+                updated = 'downloaded' in marks
+                runs.append({
+                    'mode': mode,
+                    'run': run,
+                    'exit_code': exit_code,
+                    'updated': updated,
+                    'phases': phases_from_marks(marks, total),
+                    'bytes': transfer_bytes(transfers),
+                    'requests': len(transfers),
+                    'injected_failures': failures,
+                    'transfers': transfers,
+                })
+                if exit_code != 0 or not updated:
+                    print(f"  {mode} #{run}: code {exit_code}, mise à jour {'OK' if updated else 'absente'}")
+                    if exit_code != 0:
+                        print("    " + "\n    ".join(output.splitlines()[-8:]))
+
+        summary = summarize(runs)
+        print_summary(summary)
+
+        results = {
+            'nvbuilder_version': VERSION,
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'parameters': {k: v for k, v in vars(args).items() if k not in ('json', 'work_dir')},
+            'environment': {
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'bash': tool_version(['bash', '--version']),
+                'curl': tool_version(['curl', '--version']),
+            },
+            'build_versions': versions,
+            'json_extract_ms': json_extract_ms,
+            'summary': summary,
+            'runs': runs,
+        }
+        if args.json:
+            Path(args.json).write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n", encoding='utf-8')
+            print(f"Résultats écrits dans {args.json}")
+
+
+if __name__ == "__main__":
+    main()
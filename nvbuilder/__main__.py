@@ -11,7 +11,7 @@ from pathlib import Path
 
 # Imports relatifs au package
 from .builder import NvBuilder
-from .constants import VERSION, DEFAULT_CONFIG_FILENAME
+from .constants import VERSION, DEFAULT_CONFIG_FILENAME, DEFAULT_SERVE_HOST, DEFAULT_SERVE_PORT, DEFAULT_SERVE_METRICS_INTERVAL
 from .exceptions import NvBuilderError
 from .utils import get_standard_exclusions
 
@@ -105,6 +105,52 @@ def run_interactive_config(config_path_arg: str, debug=False):
         traceback.print_exc() if debug else None
         sys.exit(1)
 
+def run_publish(args) -> int:
+    """Publie le dernier build dans le dépôt de mises à jour (ou réactive une publication conservée)."""
+    from .config import ConfigLoader
+    from .logging_setup import setup_logging
+    from .publisher import Publisher
+    
+    config_loader = ConfigLoader(args.config)
+    config = config_loader.load()
+    if args.debug:
+        config['logging']['level'] = 'DEBUG'
+    setup_logging(config.get('logging', {}), config_loader.config_path.parent)
+    
+    publisher = Publisher(config, repo_dir=args.repo, debug_mode=args.debug)
+    result = publisher.publish(config_loader.get_variant_configs(), release=args.release)
+    
+    print(f"{SUCCESS_COLOR}{HIGHLIGHT_STYLE}✅ Publication {result['build_version']} active{RESET_STYLE} -> {PATH_COLOR}{result['repo_dir']}{RESET_STYLE}")
+    files = result['files']
+    print(f"   • {HIGHLIGHT_STYLE}Fichiers     :  {RESET_STYLE}{files['reflink']} clonés, {files['hardlink']} liés, "
+          f"{files['copy']} copiés, {files['skipped']} inchangés")
+    if result['removed']:
+        print(f"   • {HIGHLIGHT_STYLE}Supprimées   :  {RESET_STYLE}{', '.join(result['removed'])}")
+    print(f"   • {HIGHLIGHT_STYLE}Conservées   :  {RESET_STYLE}{', '.join(publisher.releases())}")
+    return 0
+
+def run_serve(args) -> int:
+    """Sert le dépôt de mises à jour ('publish.repo_dir' ou --root) jusqu'à interruption."""
+    from .config import ConfigLoader
+    from .logging_setup import setup_logging
+    from .server import serve
+    from .utils import get_absolute_path
+    
+    if args.root:
+        root = Path(args.root)
+        setup_logging({}, Path.cwd())
+    else:
+        config_loader = ConfigLoader(args.config)
+        config = config_loader.load()
+        base_dir = config_loader.config_path.parent
+        setup_logging(config.get('logging', {}), base_dir)
+        if not config['publish'].get('repo_dir'):
+            raise NvBuilderError("Répertoire à servir non défini ('publish.repo_dir' ou --root).")
+        root = get_absolute_path(config['publish']['repo_dir'], base_dir)
+    
+    serve(root, args.host, args.port, args.metrics_interval)
+    return 0
+
 def show_progress_spinner(message="Traitement en cours", duration=3):
     """Affiche un spinner de progression pour les démos."""
     # Ne pas utiliser en production
@@ -125,11 +171,20 @@ def main():
     parser = argparse.ArgumentParser(description=f"NVBuilder v{VERSION} - Créateur d'archives auto-extractibles Bash.", 
                                      formatter_class=argparse.RawTextHelpFormatter, 
                                      prog="nvbuilder")
+    parser.add_argument('command', nargs='?', choices=['build', 'publish', 'serve'], default='build',
+                        help="build (défaut): génère le(s) script(s).\npublish: publie le dernier build dans le dépôt de mises à jour ('publish.repo_dir').\nserve: sert le dépôt de mises à jour en HTTP.")
     parser.add_argument('--config', '-c', default=DEFAULT_CONFIG_FILENAME, help=f"Fichier config YAML (défaut: {DEFAULT_CONFIG_FILENAME}).")
     parser.add_argument('--interactive', '-i', action='store_true', help="Mode interactif pour config.")
     parser.add_argument('--exclude-standard', '-e', action='store_true', help="Ajoute exclusions standard.")
     parser.add_argument('--list-standard-exclusions', '-l', action='store_true', help="Liste exclusions standard.")
     parser.add_argument('--debug', '-d', action='store_true', help="Active le mode debug (logs détaillés).")
+    parser.add_argument('--repo', help="publish: répertoire du dépôt (remplace 'publish.repo_dir').")
+    parser.add_argument('--release', metavar='BUILD_VERSION', help="publish: réactive une publication conservée (retour arrière).")
+    parser.add_argument('--root', help="serve: répertoire servi (défaut: 'publish.repo_dir').")
+    parser.add_argument('--host', default=DEFAULT_SERVE_HOST, help=f"serve: adresse d'écoute (défaut: {DEFAULT_SERVE_HOST}).")
+    parser.add_argument('--port', type=int, default=DEFAULT_SERVE_PORT, help=f"serve: port d'écoute (défaut: {DEFAULT_SERVE_PORT}).")
+    parser.add_argument('--metrics-interval', type=int, default=DEFAULT_SERVE_METRICS_INTERVAL, metavar='SECONDES',
+                        help=f"serve: intervalle d'affichage des compteurs (défaut: {DEFAULT_SERVE_METRICS_INTERVAL}, 0: jamais).")
     parser.add_argument('--version', '-v', action='version', version=f'%(prog)s v{VERSION}')
     args = parser.parse_args()
 
@@ -153,6 +208,13 @@ def main():
     # Mode Build 
     exit_code = 1 # Défaut = échec
     try:
+        if args.command == 'publish':
+            exit_code = run_publish(args)
+            return
+        if args.command == 'serve':
+            exit_code = run_serve(args)
+            return
+        
         if args.debug:
             print(f"{DETAIL_COLOR}• Mode debug activé")
             if args.exclude_standard:
@@ -175,7 +237,13 @@ def main():
             final_size_mb = output_script_path.stat().st_size / (1024 * 1024)
             print("\n")
             print(f"{SUCCESS_COLOR}{HIGHLIGHT_STYLE}✅ Build terminé avec succès !{RESET_STYLE}")
-            print(f"   • {HIGHLIGHT_STYLE}Script généré : {INFO_COLOR}{output_script_path}{RESET_STYLE} ({final_size_mb:.2f} Mo)")
+            if len(builder.variants) > 1:
+                for variant in builder.variants:
+                    variant_size_mb = variant['output_path'].stat().st_size / (1024 * 1024)
+                    variant_enc = "chiffrée" if variant['metadata'].get('encryption_enabled') else "non chiffrée"
+                    print(f"   • {HIGHLIGHT_STYLE}Variante {variant['name']} : {INFO_COLOR}{variant['output_path']}{RESET_STYLE} ({variant_size_mb:.2f} Mo, {variant_enc})")
+            else:
+                print(f"   • {HIGHLIGHT_STYLE}Script généré : {INFO_COLOR}{output_script_path}{RESET_STYLE} ({final_size_mb:.2f} Mo)")
             
             if builder.metadata_manager.get('encryption_enabled'):
                 print(f"   • {HIGHLIGHT_STYLE}Chiffrement  :  {SUCCESS_COLOR}Activé{RESET_STYLE} ({builder.metadata_manager.get('encryption_tool', 'openssl')})")
@@ -7,14 +7,18 @@ import tempfile
 import shutil
 import logging
 from pathlib import Path
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, Tuple, Optional, List
 from datetime import datetime
 import stat
 import sys # Pour sys.stdout.write
+from contextlib import ExitStack
 
 from .metadata import MetadataManager
-from .utils import calculate_checksum, check_exclusion, get_absolute_path
+from .chunker import RsyncableGzipWriter
+from .encryptor import Encryptor
+from .utils import calculate_checksum, check_exclusion, get_absolute_path, open_artifact, HashingFile, TeeWriter
 from .exceptions import ArchiveError
+from .constants import DEFAULT_SEGMENTATION, DEFAULT_SEGMENT_SIZE_MB, MAX_SEGMENT_PREFIXES, COMMON_PLATFORM_KEY
 
 # Import des couleurs sémantiques
 from .colors import (
@@ -35,23 +39,40 @@ class Archiver:
         self.temp_dir_path: Optional[Path] = None
         self.debug_mode = config.get('debug_mode', False)
 
-    def create(self) -> Tuple[Path, str, str, str]:
-        """Crée l'archive tar compressée (ou non)."""
-        content_dir_str = self.config.get('content', './content')
-        config_dir = self.config.get('_config_dir', Path('.'))
-        content_dir = get_absolute_path(content_dir_str, config_dir)
-
-        if not content_dir.is_dir():
-            raise ArchiveError(f"Source '{content_dir}' inexistante.")
+    def create(self, encryptions: Optional[List[Tuple[Encryptor, str, int, bool]]] = None,
+               keep_plain: bool = True) -> Tuple[List[Dict[str, Any]], str, str]:
+        """
+        Crée le ou les segments d'archive tar compressés (ou non).
         
-        if not any(content_dir.iterdir()):
-            if self.debug_mode:
-                logger.warning(f"Source '{content_dir}' vide.")
-            try: 
-                (content_dir / "README_NVBUILDER_EMPTY.txt").write_text(f"NVB Src vide {datetime.now():%F %T}\n", encoding='utf-8')
-            except Exception as e:
+        Chaque segment est une archive tar indépendante : le script généré peut
+        ainsi les décompresser en parallèle ou n'en décoder qu'une partie.
+        
+        Args:
+            encryptions: Jeux chiffrés au fil de la compression (chiffrement interne,
+                         voir Encryptor.open_stream) : (encryptor, mot de passe, rang du jeu,
+                         artefact 'encrypted_archive'). Chaque segment reçoit alors
+                         'encrypted' : [(fichier chiffré, SHA256)] dans le même ordre.
+            keep_plain: Écrit les segments en clair (sinon 'path' vaut None et seuls
+                        leur SHA256 et leur taille sont calculés)
+        
+        Returns:
+            Tuple: (liste des segments, extension d'archive, flag tar)
+        """
+        encryptions = encryptions or []
+        content_roots = self._content_roots()
+
+        for _, content_dir in content_roots:
+            if not content_dir.is_dir():
+                raise ArchiveError(f"Source '{content_dir}' inexistante.")
+            
+            if not any(content_dir.iterdir()):
                 if self.debug_mode:
-                    logger.error(f"Création README échouée: {e}")
+                    logger.warning(f"Source '{content_dir}' vide.")
+                try: 
+                    (content_dir / "README_NVBUILDER_EMPTY.txt").write_text(f"NVB Src vide {datetime.now():%F %T}\n", encoding='utf-8')
+                except Exception as e:
+                    if self.debug_mode:
+                        logger.error(f"Création README échouée: {e}")
 
         try: 
             self.temp_dir_path = Path(tempfile.mkdtemp(prefix="nvb_archive_"))
@@ -72,7 +93,6 @@ class Archiver:
         
         mode, ext = modes[method]
         archive_basename = "content"
-        archive_path = self.temp_dir_path / f"{archive_basename}{ext}"
         tar_flags_map = {'gz': 'z', 'bz2': 'j', 'xz': 'J', 'none': ''}
         tar_flag = tar_flags_map[method]
 
@@ -87,46 +107,76 @@ class Archiver:
                     logger.warning(f"Niveau compression invalide -> 9.")
             details += f", niveau: {level}"
         
+        payload_cfg = self.config.get('payload', {})
+        segmentation = payload_cfg.get('segmentation', DEFAULT_SEGMENTATION)
+        segment_size_mb = payload_cfg.get('segment_size_mb', DEFAULT_SEGMENT_SIZE_MB)
+        if segmentation != 'none':
+            details += f", segmentation: {segmentation}"
+        platforms = [plat for plat, _ in content_roots if plat]
+        if platforms:
+            details += f", plateformes: {', '.join(platforms)}"
+        
         if self.debug_mode:
-            logger.info(f"Création archive '{archive_path.name}' ({details})")
+            logger.info(f"Création archive '{archive_basename}{ext}' ({details})")
         else:
-            print(f"{INFO_COLOR}{HIGHLIGHT_STYLE}Archivage en cours...  ", end=" ", flush=True)
+            label = "Archivage et chiffrement..." if encryptions else "Archivage en cours...  "
+            print(f"{INFO_COLOR}{HIGHLIGHT_STYLE}{label}", end=" ", flush=True)
 
         try:
             exclude_patterns = self.config['exclude']['patterns']
             ignore_case = self.config['exclude']['ignore_case']
-            tar_args = {'name': str(archive_path), 'mode': mode, 'encoding': 'utf-8', 'errorlevel': 1}
+            tar_args = {'mode': mode, 'encoding': 'utf-8', 'errorlevel': 1}
             if method in ['gz', 'bz2']: 
                 tar_args['compresslevel'] = level
+            # Magasin de blocs : gzip resynchronisable, un fichier modifié ne change que quelques blocs
+            rsyncable = method == 'gz' and self._chunked_updates()
+            if rsyncable:
+                tar_args = {'mode': 'w|', 'encoding': 'utf-8', 'errorlevel': 1}
+                if self.debug_mode:
+                    logger.debug("Compression gzip resynchronisable (magasin de blocs).")
             
-            num_files, total_size, excluded_dirs, progress_count = 0, 0, set(), 0
-
-            with tarfile.open(**tar_args) as tar:
-                for root, dirs, files in os.walk(content_dir, topdown=True, onerror=lambda e: logger.warning(f"os.walk err: {e}")):
-                    current_path = Path(root)
-                    rel_root = current_path.relative_to(content_dir)
-                    
-                    if any(str(p) in excluded_dirs for p in current_path.parents):
-                        dirs[:], files[:] = [], []
-                        continue
-                    
-                    orig_dirs = list(dirs)
-                    dirs[:] = []
-                    
-                    for d in orig_dirs: 
-                        d_abs, d_rel = current_path/d, (rel_root/d).as_posix()
-                        if check_exclusion(d_rel+'/', exclude_patterns, ignore_case): 
-                            self.metadata.add_excluded_file({'path':d_rel+'/', 'reason':'Pattern'})
-                            excluded_dirs.add(str(d_abs))
-                        else: 
-                            dirs.append(d)
-                    
-                    for f in files:
-                        f_abs, f_rel = current_path/f, (rel_root/f).as_posix()
-                        if check_exclusion(f_rel, exclude_patterns, ignore_case):
-                            self.metadata.add_excluded_file({'path':f_rel, 'reason':'Pattern'})
-                            continue
-                        
+            # Segments communs d'abord, puis ceux de chaque plateforme
+            groups: List[Tuple[str, List[Tuple[Path, str]]]] = []
+            for plat, content_dir in content_roots:
+                candidates = self._collect_files(content_dir, exclude_patterns, ignore_case)
+                for group in self._plan_segments(candidates, segmentation, segment_size_mb * 1024 * 1024):
+                    groups.append((plat, group))
+
+            num_files, total_size, progress_count = 0, 0, 0
+            segments: List[Dict[str, Any]] = []
+            
+            # Artefact archive : copie du flux compressé écrite en même temps que les segments
+            archive_artifact = open_artifact(self.config, 'archive')
+            # Checksum global : SHA256 de la concaténation ordonnée des segments
+            # (identique au checksum de l'archive lorsqu'il n'y a qu'un segment)
+            archive_hash = HashingFile(None)
+            # Archive chiffrée détachée : copie du flux chiffré d'un payload en un seul segment
+            encrypted_artifact = None
+            if len(groups) == 1 and any(with_artifact for _, _, _, with_artifact in encryptions):
+                encrypted_artifact = open_artifact(self.config, 'encrypted_archive')
+
+            for seg_id, (plat, group) in enumerate(groups):
+                if len(groups) == 1:
+                    archive_path = self.temp_dir_path / f"{archive_basename}{ext}"
+                else:
+                    archive_path = self.temp_dir_path / f"{archive_basename}.{seg_id:03d}{ext}"
+                seg_files, seg_size = 0, 0
+                seg_file = HashingFile(archive_path if keep_plain else None)
+                outputs = [seg_file, archive_hash, archive_artifact]
+                with ExitStack() as seg_stack:
+                    seg_stack.enter_context(seg_file)
+                    # Flux chiffrés : fermés après la fin du chiffrement (dernier bloc)
+                    enc_files = []
+                    for encryptor, password, set_index, with_artifact in encryptions:
+                        enc_file = seg_stack.enter_context(HashingFile(self._encrypted_path(archive_path, set_index)))
+                        enc_files.append(enc_file)
+                        tee = encrypted_artifact if with_artifact else None
+                        outputs.append(seg_stack.enter_context(encryptor.open_stream(TeeWriter([enc_file, tee]), password)))
+                    stream = TeeWriter(outputs)
+                    if rsyncable:
+                        stream = seg_stack.enter_context(RsyncableGzipWriter(stream, level))
+                    tar = seg_stack.enter_context(tarfile.open(fileobj=stream, **tar_args))
+                    for f_abs, f_rel in group:
                         try:
                             f_stat = f_abs.lstat()
                             is_link = stat.S_ISLNK(f_stat.st_mode)
@@ -138,13 +188,18 @@ class Archiver:
                             self.metadata.add_included_file({
                                 'path': f_rel, 
                                 'size': f_size, 
+                                'mode': stat.S_IMODE(f_stat.st_mode),
                                 'checksum_sha256': f_sum, 
                                 'mtime': f_stat.st_mtime, 
-                                'is_link': is_link
+                                'is_link': is_link,
+                                'segment': seg_id,
+                                'platform': plat or None
                             })
                             
                             num_files += 1
                             total_size += f_size
+                            seg_files += 1
+                            seg_size += f_size
                             
                             progress_count += 1
                             if progress_count % 50 == 0 and not self.debug_mode:
@@ -157,6 +212,28 @@ class Archiver:
                             if self.debug_mode:
                                 logger.warning(f"Ajout échoué '{f_rel}': {e}")
 
+                segment = {
+                    'id': seg_id,
+                    'path': archive_path if keep_plain else None,
+                    'platform': plat,
+                    'prefixes': self._segment_prefixes([f_rel for _, f_rel in group]),
+                    'files_count': seg_files,
+                    'uncompressed_size': seg_size,
+                    'size': seg_file.size,
+                    'checksum_sha256': seg_file.hexdigest(),
+                }
+                if encryptions:
+                    segment['encrypted'] = [(f.path, f.hexdigest()) for f in enc_files]
+                segments.append(segment)
+
+            if archive_artifact:
+                archive_artifact.close()
+                self.metadata.add_artifact('archive', archive_artifact.path, archive_artifact.size, archive_artifact.hexdigest())
+            if encrypted_artifact:
+                encrypted_artifact.close()
+                self.metadata.add_artifact('encrypted_archive', encrypted_artifact.path,
+                                           encrypted_artifact.size, encrypted_artifact.hexdigest())
+
             if not self.debug_mode:
                 print(f" {SUCCESS_COLOR}Terminé.{RESET_STYLE}", flush=True)
 
@@ -165,6 +242,10 @@ class Archiver:
             
             if self.debug_mode:
                 logger.info(f"•  {num_files} fichiers inclus ({size_mb:.2f} Mo){', ' + str(excluded_count) + ' exclus' if excluded_count else '.'}")
+                if len(segments) > 1:
+                    logger.info(f"•  {len(segments)} segments ({segmentation})")
+                if platforms:
+                    logger.info(f"•  Plateformes: {', '.join(platforms)}")
                 
                 if excluded_count > 0:
                     logger.debug(
@@ -172,24 +253,167 @@ class Archiver:
                         f"{excluded_count - sum(1 for i in self.metadata.get('files_excluded', []) if not i['path'].endswith('/'))} dirs exclus."
                     )
 
-            archive_checksum = calculate_checksum(archive_path)
-            archive_size = archive_path.stat().st_size
+            archive_checksum = archive_hash.hexdigest()
+            archive_size = archive_hash.size
             
             self.metadata.update('archive_checksum_sha256', archive_checksum)
             self.metadata.update('archive_size', archive_size)
+            self.metadata.update('segmentation', segmentation)
+            self.metadata.update('platforms', platforms)
             
             if self.debug_mode:
                 logger.info(f"Checksum archive: {archive_checksum[:12]}...")
                 logger.info(f"Taille archive: {archive_size / (1024*1024):.2f} Mo")
             
-            return archive_path, archive_basename, ext, tar_flag
+            return segments, ext, tar_flag
 
         except Exception as e:
             if not self.debug_mode:
                 print(f"{ERROR_COLOR} ERREUR{RESET_STYLE}")
+            for artifact_name in ('archive_artifact', 'encrypted_artifact'):
+                artifact = locals().get(artifact_name)
+                if artifact:
+                    artifact.close()
+                    artifact.path.unlink(missing_ok=True)
             self.cleanup()
             raise ArchiveError(f"Erreur création archive tar: {e}") from e
 
+    def _encrypted_path(self, archive_path: Path, set_index: int) -> Path:
+        """Fichier chiffré d'un segment (même nom que Encryptor.encrypt pour le premier jeu)."""
+        if not set_index:
+            return archive_path.with_suffix(f"{archive_path.suffix}.enc")
+        return archive_path.with_suffix(f"{archive_path.suffix}.{set_index}.enc")
+
+    def _chunked_updates(self) -> bool:
+        """Indique si le script principal ou une variante publie un magasin de blocs ('update.chunks')."""
+        configs = [self.config] + list(self.config.get('variants') or [])
+        return any(cfg.get('update', {}).get('chunks') for cfg in configs)
+
+    def _content_roots(self) -> List[Tuple[str, Path]]:
+        """
+        Résout le ou les répertoires sources.
+        
+        'content' est soit un chemin, soit un dictionnaire {plateforme: chemin}
+        dont la clé 'common' désigne les fichiers partagés par toutes les plateformes.
+        
+        Returns:
+            List[Tuple[str, Path]]: (plateforme, répertoire), la plateforme vide
+            désignant le contenu commun (toujours en premier)
+        """
+        content_cfg = self.config.get('content', './content')
+        config_dir = self.config.get('_config_dir', Path('.'))
+        
+        if not isinstance(content_cfg, dict):
+            return [('', get_absolute_path(content_cfg, config_dir))]
+        
+        roots: List[Tuple[str, Path]] = []
+        if content_cfg.get(COMMON_PLATFORM_KEY):
+            roots.append(('', get_absolute_path(content_cfg[COMMON_PLATFORM_KEY], config_dir)))
+        for plat in sorted(k for k in content_cfg if k != COMMON_PLATFORM_KEY):
+            roots.append((plat, get_absolute_path(content_cfg[plat], config_dir)))
+        return roots
+
+    def _collect_files(self, content_dir: Path, exclude_patterns: List[str], ignore_case: bool) -> List[Tuple[Path, str]]:
+        """
+        Parcourt le répertoire source et retourne les fichiers à archiver.
+        
+        Args:
+            content_dir: Répertoire source
+            exclude_patterns: Motifs d'exclusion
+            ignore_case: Ignorer la casse pour les exclusions
+            
+        Returns:
+            List[Tuple[Path, str]]: Liste (chemin absolu, chemin relatif POSIX)
+        """
+        candidates: List[Tuple[Path, str]] = []
+        excluded_dirs = set()
+
+        for root, dirs, files in os.walk(content_dir, topdown=True, onerror=lambda e: logger.warning(f"os.walk err: {e}")):
+            current_path = Path(root)
+            rel_root = current_path.relative_to(content_dir)
+            
+            if any(str(p) in excluded_dirs for p in current_path.parents):
+                dirs[:], files[:] = [], []
+                continue
+            
+            orig_dirs = list(dirs)
+            dirs[:] = []
+            
+            for d in orig_dirs: 
+                d_abs, d_rel = current_path/d, (rel_root/d).as_posix()
+                if check_exclusion(d_rel+'/', exclude_patterns, ignore_case): 
+                    self.metadata.add_excluded_file({'path':d_rel+'/', 'reason':'Pattern'})
+                    excluded_dirs.add(str(d_abs))
+                else: 
+                    dirs.append(d)
+            
+            for f in files:
+                f_abs, f_rel = current_path/f, (rel_root/f).as_posix()
+                if check_exclusion(f_rel, exclude_patterns, ignore_case):
+                    self.metadata.add_excluded_file({'path':f_rel, 'reason':'Pattern'})
+                    continue
+                candidates.append((f_abs, f_rel))
+
+        return candidates
+
+    def _plan_segments(self, candidates: List[Tuple[Path, str]], segmentation: str, max_bytes: int) -> List[List[Tuple[Path, str]]]:
+        """
+        Répartit les fichiers en segments selon la stratégie configurée.
+        
+        Args:
+            candidates: Fichiers à archiver (chemin absolu, chemin relatif)
+            segmentation: 'none', 'directory' (un segment par entrée de premier niveau) ou 'size'
+            max_bytes: Taille cumulée maximale (non compressée) d'un segment en mode 'size'
+            
+        Returns:
+            List[List[Tuple[Path, str]]]: Groupes de fichiers, un par segment
+        """
+        if segmentation == 'directory':
+            by_top: Dict[str, List[Tuple[Path, str]]] = {}
+            for f_abs, f_rel in candidates:
+                top = f_rel.split('/', 1)[0] if '/' in f_rel else ''
+                by_top.setdefault(top, []).append((f_abs, f_rel))
+            groups = [by_top[k] for k in sorted(by_top)]
+        elif segmentation == 'size':
+            groups, current, current_size = [], [], 0
+            for f_abs, f_rel in candidates:
+                try:
+                    f_size = f_abs.lstat().st_size
+                except OSError:
+                    f_size = 0
+                if current and current_size + f_size > max_bytes:
+                    groups.append(current)
+                    current, current_size = [], 0
+                current.append((f_abs, f_rel))
+                current_size += f_size
+            if current:
+                groups.append(current)
+        else:
+            groups = [candidates]
+
+        return [g for g in groups if g] or [[]]
+
+    def _segment_prefixes(self, rel_paths: List[str]) -> List[str]:
+        """
+        Calcule l'ensemble minimal des préfixes de chemins couverts par un segment.
+        
+        Les répertoires sont suffixés par '/', les fichiers de la racine sont listés
+        tels quels. Un préfixe contenant un séparateur de l'index ('|' ou ',') est
+        remplacé par '*' (le segment est alors toujours candidat).
+        """
+        prefixes = set()
+        for rel in rel_paths:
+            prefixes.add(rel.rsplit('/', 1)[0] + '/' if '/' in rel else rel)
+        if len(prefixes) > MAX_SEGMENT_PREFIXES:
+            prefixes = {p.split('/', 1)[0] + '/' if '/' in p else p for p in prefixes}
+        minimal = []
+        for p in sorted(prefixes):
+            if not any(p.startswith(kept) for kept in minimal if kept.endswith('/')):
+                minimal.append(p)
+        if any('|' in p or ',' in p or '\n' in p for p in minimal):
+            return ['*']
+        return minimal
+
     def cleanup(self):
         """Nettoie le répertoire temporaire."""
         if self.temp_dir_path and self.temp_dir_path.exists():
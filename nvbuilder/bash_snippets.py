@@ -17,7 +17,7 @@ try:
     from typing import TypedDict
     class BashSnippetsDict(TypedDict):
         encryption_vars: str
-        decryption_logic: str
+        decryption_functions: str
         decryption_cleanup: str
 except ImportError:
     BashSnippetsDict = Dict[str, str]
@@ -311,11 +311,11 @@ check_for_updates_and_download_if_needed() {
     
     return snippets
 
-def generate_encryption_snippets(config: Dict[str, Any], metadata: Dict[str, Any], archive_original_filename: str) -> BashSnippetsDict:
+def generate_encryption_snippets(config: Dict[str, Any], metadata: Dict[str, Any]) -> BashSnippetsDict:
     """Génère les snippets Bash relatifs au chiffrement."""
     snippets: BashSnippetsDict = {
         "encryption_vars": "",
-        "decryption_logic": "",
+        "decryption_functions": "",
         "decryption_cleanup": ""
     }
     
@@ -323,34 +323,72 @@ def generate_encryption_snippets(config: Dict[str, Any], metadata: Dict[str, Any
     encryption_tool = metadata.get('encryption_tool')
     
     if encryption_enabled and encryption_tool:
-        enc_fname = "archive." + ("enc" if encryption_tool == "openssl" else "gpg")
-        dec_fname = archive_original_filename
         ossl_c = config.get('compression', {}).get('openssl_cipher', DEFAULT_OPENSSL_CIPHER)
         ossl_i = config.get('compression', {}).get('openssl_iter', DEFAULT_OPENSSL_ITER)
         gpg_s2k = DEFAULT_GPG_S2K_OPTIONS
         
         var_lines = [
             f'ENCRYPTION_TOOL="{encryption_tool}"',
-            f'ENCRYPTED_TMP_FILENAME="{enc_fname}"',
-            f'DECRYPTED_TMP_FILENAME="{dec_fname}"',
+            f'ENCRYPTED_EXTENSION="{".enc" if encryption_tool == "openssl" else ".gpg"}"',
             f'OPENSSL_CIPHER="{ossl_c}"',
             f'OPENSSL_ITER="{ossl_i}"',
-            f'GPG_S2K_OPTIONS="{gpg_s2k}"'
+            f'GPG_S2K_OPTIONS="{gpg_s2k}"',
+            # Jeton de vérification chiffré avec le même mot de passe et les mêmes paramètres que le payload
+            f'PASSWORD_CHECK_TOKEN_B64="{metadata.get("password_check_token_b64") or ""}"'
         ]
         
         snippets["encryption_vars"] = "\n".join(var_lines)
         
-        snippets["decryption_logic"] = f"""
-    echo -e "${{HIGHLIGHT_STYLE}}• Vérification outil:${{RESET_STYLE}} ${{HIGHLIGHT_STYLE}}${{INFO_COLOR}}${{HIGHLIGHT_STYLE}}$ENCRYPTION_TOOL...${{RESET_STYLE}}"; if ! command -v $ENCRYPTION_TOOL &>/dev/null; then echo -e "${{RED}}Erreur: Outil '$ENCRYPTION_TOOL' absent.${{RESET}}" >&2; exit 1; fi
-    local attempts=0 max_attempts=3 code=1 cmd="" pass=""; while [ $attempts -lt $max_attempts ]; do
-        echo -en "• ${{HIGHLIGHT_STYLE}}Mot de passe déchiffrement :${{RESET_STYLE}} " >&2; read -s pass </dev/tty; echo "" >&2; if [ -z "$pass" ]; then echo -e "${{YELLOW}}Mdp vide.${{RESET}}"; continue; fi
-        echo -en "${{HIGHLIGHT_STYLE}}• Tentative $((attempts + 1))... "; if [ "$ENCRYPTION_TOOL" == "openssl" ]; then export NVBUILDER_DEC_PASS="$pass"; cmd="openssl enc -d -${{OPENSSL_CIPHER}} -pbkdf2 -iter ${{OPENSSL_ITER}} -in '$ENCRYPTED_TMP_FILENAME' -out '$DECRYPTED_TMP_FILENAME' -pass env:NVBUILDER_DEC_PASS";
-        elif [ "$ENCRYPTION_TOOL" == "gpg" ]; then cmd="gpg --quiet --batch --yes --pinentry-mode loopback ${{GPG_S2K_OPTIONS}} --passphrase '$pass' --output '$DECRYPTED_TMP_FILENAME' --decrypt '$ENCRYPTED_TMP_FILENAME' 2>/dev/null"; cmd+=" || "; cmd+="gpg --quiet --batch --yes --pinentry-mode loopback --passphrase '$pass' --output '$DECRYPTED_TMP_FILENAME' --decrypt '$ENCRYPTED_TMP_FILENAME' 2>/dev/null"; fi
-        eval $cmd; code=$?; unset pass; [ "$ENCRYPTION_TOOL" == "openssl" ] && unset NVBUILDER_DEC_PASS; if [ $code -eq 0 ]; then echo -e "${{HIGHLIGHT_STYLE}}${{GREEN}}Déchiffrement OK.${{RESET}}"; break; fi
-        echo -e "${{RED}}${{HIGHLIGHT_STYLE}}Échec (code $code). Mdp incorrect ?${{RESET}}" >&2; rm -f "$DECRYPTED_TMP_FILENAME" 2>/dev/null; attempts=$((attempts + 1)); if [ $attempts -ge $max_attempts ]; then echo -e "${{RED}}Trop d'échecs.${{RESET}}"; exit 1; fi; echo "$((max_attempts - attempts)) tentatives restantes." >&2;
-    done; if [ $code -ne 0 ]; then exit 1; fi
+        # Le mot de passe validé est conservé dans NVBUILDER_DEC_PASS, variable non exportée
+        # (jamais sur la ligne de commande ni dans l'environnement du script post-extraction),
+        # afin que chaque segment puisse être déchiffré sans nouvelle saisie. Seul le processus
+        # openssl le reçoit dans son environnement ; il est effacé dès la fin du déchiffrement.
+        snippets["decryption_functions"] = """
+# Déchiffre l'entrée standard vers la sortie standard avec le mot de passe de NVBUILDER_DEC_PASS
+# (étage d'un pipeline : aucune donnée déchiffrée n'est écrite sur disque)
+decrypt_stream() {
+    if [ "$ENCRYPTION_TOOL" == "openssl" ]; then
+        NVBUILDER_DEC_PASS="$NVBUILDER_DEC_PASS" openssl enc -d -"$OPENSSL_CIPHER" -pbkdf2 -iter "$OPENSSL_ITER" -pass env:NVBUILDER_DEC_PASS 2>/dev/null
+    else
+        # L'entrée standard porte les données : le mot de passe passe par le descripteur 3 (tube)
+        gpg --quiet --batch --yes --pinentry-mode loopback --passphrase-fd 3 --decrypt 3< <(printf '%s' "$NVBUILDER_DEC_PASS") 2>/dev/null
+    fi
+}
+
+# Vérifie NVBUILDER_DEC_PASS en déchiffrant le jeton intégré (quelques octets) : un mot de passe
+# erroné est rejeté sans lire le payload. Sans jeton (script ancien), le segment décrit par
+# l'entrée d'index $1 est déchiffré à la volée (résultat ignoré).
+check_decryption_password() {
+    local test_entry="$1" token=""
+    if [ -n "${PASSWORD_CHECK_TOKEN_B64:-}" ]; then
+        token=$(printf '%s' "$PASSWORD_CHECK_TOKEN_B64" | base64 -d | decrypt_stream) || true
+        [ "$token" == "$PASSWORD_CHECK_TOKEN" ]
+    else
+        payload_segment_stream "$test_entry" | decrypt_stream > /dev/null
+    fi
+}
+
+# Demande le mot de passe (3 tentatives) et le valide avec check_decryption_password
+prompt_decryption_password() {
+    local test_entry="$1"
+    echo -e "${HIGHLIGHT_STYLE}• Vérification outil:${RESET_STYLE} ${HIGHLIGHT_STYLE}${INFO_COLOR}$ENCRYPTION_TOOL...${RESET_STYLE}"
+    if ! command -v "$ENCRYPTION_TOOL" &>/dev/null; then error "Erreur: Outil '$ENCRYPTION_TOOL' absent."; exit 1; fi
+    local attempts=0 max_attempts=3 pass=""
+    while [ $attempts -lt $max_attempts ]; do
+        echo -en "• ${HIGHLIGHT_STYLE}Mot de passe déchiffrement :${RESET_STYLE} " >&2; read -s pass </dev/tty; echo "" >&2
+        if [ -z "$pass" ]; then echo -e "${YELLOW}Mdp vide.${RESET}"; continue; fi
+        echo -en "${HIGHLIGHT_STYLE}• Tentative $((attempts + 1))... "
+        NVBUILDER_DEC_PASS="$pass"; export -n NVBUILDER_DEC_PASS; unset pass
+        if check_decryption_password "$test_entry"; then echo -e "${HIGHLIGHT_STYLE}${GREEN}Déchiffrement OK.${RESET}"; return 0; fi
+        unset NVBUILDER_DEC_PASS
+        echo -e "${RED}${HIGHLIGHT_STYLE}Échec. Mdp incorrect ?${RESET}" >&2
+        attempts=$((attempts + 1))
+        if [ $attempts -ge $max_attempts ]; then echo -e "${RED}Trop d'échecs.${RESET}"; exit 1; fi
+        echo "$((max_attempts - attempts)) tentatives restantes." >&2
+    done
+}
 """
         
-        snippets["decryption_cleanup"] = 'if [ "$DEBUG_MODE" -eq 0 ] && [ -f "$WORK_DIR/$DECRYPTED_TMP_FILENAME" ]; then rm -f "$WORK_DIR/$DECRYPTED_TMP_FILENAME"; fi'
+        snippets["decryption_cleanup"] = 'unset NVBUILDER_DEC_PASS 2>/dev/null || true'
     
-    return snippets
\ No newline at end of file
+    return snippets
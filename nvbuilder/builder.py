@@ -4,9 +4,11 @@
 import logging
 import time
 import getpass
+import os
 import platform
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import sys
 from datetime import datetime
 
@@ -17,9 +19,12 @@ from .archiver import Archiver
 from .encryptor import Encryptor
 from .bash_snippets import generate_update_snippets, generate_encryption_snippets, BashSnippetsDict
 from .script_generator import ScriptGenerator
-from .utils import get_absolute_path, get_standard_exclusions, calculate_checksum, encrypt_string_to_base64
+from .delta import read_script_layout, reuse_previous_segments, write_delta_package
+from .chunker import write_chunk_index
+from .publisher import Publisher
+from .utils import get_absolute_path, get_standard_exclusions, calculate_checksum, calculate_checksum_multi, calculate_block_checksums, encrypt_string_to_base64, open_artifact, url_list
 from .exceptions import NvBuilderError, ConfigError, EncryptionError, ToolNotFoundError
-from .constants import VERSION,DEFAULT_UPDATE_MODE, PASSWORD_CHECK_TOKEN, DEFAULT_OPENSSL_CIPHER, DEFAULT_OPENSSL_ITER, DEFAULT_GPG_CIPHER_ALGO, DEFAULT_GPG_S2K_OPTIONS
+from .constants import VERSION,DEFAULT_UPDATE_MODE, PASSWORD_CHECK_TOKEN, DEFAULT_OPENSSL_CIPHER, DEFAULT_OPENSSL_ITER, DEFAULT_GPG_CIPHER_ALGO, DEFAULT_GPG_S2K_OPTIONS, DEFAULT_PASSWORD_ID, DOWNLOAD_BLOCK_SIZE
 
 # Import des couleurs sémantiques
 from .colors import (
@@ -46,7 +51,8 @@ class NvBuilder:
             debug_mode: Active le mode debug pour des logs plus verbeux.
         """
         self.start_time = time.time()
-        self.password: Optional[str] = None
+        self.passwords: Dict[str, str] = {}  # Mots de passe de chiffrement par 'password_id'
+        self.variants: List[Dict[str, Any]] = []  # Scripts générés (une entrée par variante)
         self.debug_mode = debug_mode
 
         # Config Loader (peut lever ConfigError)
@@ -90,7 +96,7 @@ class NvBuilder:
         encryption_tool = self.config.get('compression', {}).get('encryption_tool', 'openssl')
         update_enabled = self.config.get('update', {}).get('enabled', False)
         update_mode = self.config.get('update', {}).get('mode', DEFAULT_UPDATE_MODE)
-        update_url = self.config.get('update', {}).get('version_url', '')
+        update_url = ', '.join(url_list(self.config.get('update', {}).get('version_url')))
         hooks_pre = self.config.get('hooks', {}).get('pre_build', [])
         hooks_post = self.config.get('hooks', {}).get('post_build', [])
         exclude_patterns = self.config.get('exclude', {}).get('patterns', [])
@@ -112,6 +118,11 @@ class NvBuilder:
         need_root = self.config.get('output', {}).get('need_root', False)
         print(f"  {HIGHLIGHT_STYLE}• Droits root:{RESET_STYLE}      {SUCCESS_COLOR}Requis{RESET_STYLE}" if need_root else f"  {HIGHLIGHT_STYLE}• Droits root:{RESET_STYLE}  {WARNING_COLOR}Non requis{RESET_STYLE}")
         
+        variants = self.config.get('variants') or []
+        if variants:
+            names = ", ".join(v['name'] for v in variants)
+            print(f"  {HIGHLIGHT_STYLE}• Variantes:{RESET_STYLE}        {DETAIL_COLOR}{len(variants)} ({names}){RESET_STYLE}")
+        
         # Compression et chiffrement
         print(f"\n{INFO_COLOR}{HIGHLIGHT_STYLE}Compression et sécurité:{RESET_STYLE}")
         comp_display = f"{comp_method}" if comp_method == 'none' else f"{comp_method} (niveau {comp_level})"
@@ -122,6 +133,10 @@ class NvBuilder:
         else:
             print(f"  {HIGHLIGHT_STYLE}• Chiffrement:{RESET_STYLE}   {WARNING_COLOR}Désactivé{RESET_STYLE}")
         
+        segmentation = self.config.get('payload', {}).get('segmentation', 'none')
+        if segmentation != 'none':
+            print(f"  {HIGHLIGHT_STYLE}• Segmentation:{RESET_STYLE}  {DETAIL_COLOR}{segmentation}{RESET_STYLE}")
+        
         # Mise à jour
         print(f"\n{INFO_COLOR}{HIGHLIGHT_STYLE}Mise à jour:{RESET_STYLE}")
         if update_enabled:
@@ -161,14 +176,27 @@ class NvBuilder:
         print(f"  {HIGHLIGHT_STYLE}• Build ID:{RESET_STYLE}     {DETAIL_COLOR}{self.build_version}{RESET_STYLE}")
         print(f"  {HIGHLIGHT_STYLE}• Plateforme:{RESET_STYLE}   {DETAIL_COLOR}{platform.system()} {platform.release()}{RESET_STYLE}")
         
-    def _get_encryption_password(self) -> bool:
+    def _get_encryption_passwords(self, variant_configs: List[Dict[str, Any]]) -> bool:
         """
-        Demande et valide le mot de passe de chiffrement si nécessaire.
+        Demande les mots de passe de chiffrement nécessaires.
         
+        Un mot de passe est demandé par 'compression.password_id' distinct parmi
+        les variantes chiffrées (un seul sans variantes).
+        
+        Args:
+            variant_configs: Configurations des scripts à générer
+            
         Returns:
             bool: True si la saisie a réussi, False sinon
         """
-        if not self.metadata_manager.get('encryption_enabled'):
+        password_ids: List[str] = []
+        for cfg in variant_configs:
+            compression = cfg.get('compression', {})
+            password_id = compression.get('password_id', DEFAULT_PASSWORD_ID)
+            if compression.get('encrypted') and password_id not in password_ids:
+                password_ids.append(password_id)
+        
+        if not password_ids:
             if self.debug_mode:
                 logger.info("Chiffrement: Désactivé")
             return True
@@ -176,10 +204,28 @@ class NvBuilder:
         if self.debug_mode:
             logger.info("Chiffrement: Activé")
         
+        for password_id in password_ids:
+            password = self._prompt_password(password_id if len(password_ids) > 1 else None)
+            if password is None:
+                return False
+            self.passwords[password_id] = password
+        return True
+
+    def _prompt_password(self, label: Optional[str] = None) -> Optional[str]:
+        """
+        Demande un mot de passe avec confirmation.
+        
+        Args:
+            label: Identifiant du mot de passe affiché (variantes avec plusieurs mots de passe)
+            
+        Returns:
+            str: Mot de passe saisi, None si la saisie a échoué ou a été annulée
+        """
+        title = "Cryptage de l'archive" + (f" (mot de passe '{label}')" if label else "")
         try:
             while True:
                 # Utiliser sys.stdout.write pour contrôle fin + flush
-                print(f"\n{INFO_COLOR}{HIGHLIGHT_STYLE}Cryptage de l'archive{RESET_STYLE}")
+                print(f"\n{INFO_COLOR}{HIGHLIGHT_STYLE}{title}{RESET_STYLE}")
                 sys.stdout.write(f"   • Entrez le mot de passe pour le chiffrement : {RESET_STYLE}")
                 sys.stdout.flush()
                 pwd1 = getpass.getpass(prompt='')  # Prompt vide car déjà affiché
@@ -192,19 +238,18 @@ class NvBuilder:
                 pwd2 = getpass.getpass(prompt='')
                 
                 if pwd1 == pwd2:
-                    self.password = pwd1
-                    return True
+                    return pwd1
                 else:
                     print(f"{ERROR_COLOR}Mots de passe différents. Réessayez.{RESET_STYLE}")
         except EOFError:
             logger.error("Lecture mdp impossible (non interactif?).")
-            return False
+            return None
         except KeyboardInterrupt:
             print("\nSaisie mdp annulée.")
-            return False
+            return None
         except Exception as e:
             logger.error(f"Erreur saisie mdp: {e}", exc_info=True)
-            return False
+            return None
 
     def _run_hooks(self, hook_type: str):
         """
@@ -261,6 +306,227 @@ class NvBuilder:
         if not success:
             raise NvBuilderError(f"Échec lors de l'exécution des hooks {hook_type}.")
 
+    def _encrypt_segments(self, encryptor: Encryptor, segments: List[Dict[str, Any]], password: str,
+                          set_index: int = 0, with_artifact: bool = True):
+        """
+        Chiffre chaque segment du payload avec le même mot de passe.
+        
+        Les segments sont indépendants : ils sont chiffrés en parallèle (chiffrement interne
+        ou un processus openssl/gpg par segment) et peuvent ainsi être déchiffrés séparément
+        à l'extraction.
+        
+        Args:
+            encryptor: Instance d'Encryptor configurée
+            segments: Segments produits par l'Archiver (complétés avec 'embed_path'
+                      et 'payload_checksum_sha256')
+            password: Mot de passe de chiffrement
+            set_index: Rang du jeu de chiffrement (variantes), distingue les fichiers chiffrés
+            with_artifact: Écrit l'artefact 'encrypted_archive' à partir de ce chiffrement
+        """
+        enc_ext = ".enc" if encryptor.tool == "openssl" else ".gpg"
+        
+        def target_path(seg: Dict[str, Any]) -> Optional[Path]:
+            if not set_index:
+                return None
+            return seg['path'].with_suffix(f"{seg['path'].suffix}.{set_index}{enc_ext}")
+        
+        if len(segments) == 1:
+            # Archive chiffrée détachée : copie du flux produit par l'outil de chiffrement
+            encrypted_artifact = open_artifact(self.config, 'encrypted_archive') if with_artifact else None
+            try:
+                encrypted_paths = [encryptor.encrypt(segments[0]['path'], password, tee=encrypted_artifact,
+                                                     encrypted_path=target_path(segments[0]))]
+            except Exception:
+                if encrypted_artifact:
+                    encrypted_artifact.close()
+                    encrypted_artifact.path.unlink(missing_ok=True)
+                raise
+            if encrypted_artifact:
+                encrypted_artifact.close()
+                self.metadata_manager.add_artifact('encrypted_archive', encrypted_artifact.path,
+                                                   encrypted_artifact.size, encrypted_artifact.hexdigest())
+        else:
+            if not self.debug_mode:
+                print(f"{INFO_COLOR}{HIGHLIGHT_STYLE}Chiffrement en cours...      ", end=" ", flush=True)
+            workers = min(len(segments), os.cpu_count() or 2)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                encrypted_paths = list(pool.map(
+                    lambda seg: encryptor.encrypt(seg['path'], password, show_progress=False,
+                                                  encrypted_path=target_path(seg)),
+                    segments
+                ))
+            if not self.debug_mode:
+                print(f"{SUCCESS_COLOR}OK{RESET_STYLE} ({len(segments)} segments)")
+
+        for seg, enc_path in zip(segments, encrypted_paths):
+            seg['embed_path'] = enc_path
+            seg['payload_checksum_sha256'] = calculate_checksum(enc_path)
+
+    def _encryption_key(self, config: Dict[str, Any]) -> Optional[Tuple]:
+        """
+        Identifie le jeu de chiffrement d'une configuration.
+        
+        Les variantes partageant outil, algorithme et mot de passe réutilisent le même
+        payload chiffré.
+        
+        Returns:
+            Tuple: (outil, algorithme, itérations, password_id), None sans chiffrement
+        """
+        compression = config.get('compression', {})
+        if not compression.get('encrypted'):
+            return None
+        encryptor = Encryptor(config)
+        return (encryptor.tool, encryptor.cipher, encryptor.iterations,
+                compression.get('password_id', DEFAULT_PASSWORD_ID))
+
+    def _encrypt_payload(self, config: Dict[str, Any], segments: List[Dict[str, Any]],
+                         set_index: int, with_artifact: bool, stream_index: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Chiffre les segments et le jeton de vérification pour un jeu de chiffrement.
+        
+        Args:
+            config: Configuration (variante) définissant le chiffrement
+            segments: Segments produits par l'Archiver (non modifiés)
+            set_index: Rang du jeu de chiffrement
+            with_artifact: Écrit l'artefact 'encrypted_archive' à partir de ce chiffrement
+            stream_index: Rang du jeu dans 'encrypted' lorsque l'Archiver a déjà chiffré
+                          les segments au fil de la compression
+            
+        Returns:
+            Dict: Payload chiffré ('segments', checksum, taille, jeton et ses paramètres)
+            
+        Raises:
+            NvBuilderError: Si le chiffrement échoue
+        """
+        encryptor = Encryptor(config)
+        password = self.passwords[config['compression'].get('password_id', DEFAULT_PASSWORD_ID)]
+        enc_segments = [dict(seg) for seg in segments]
+        try:
+            if stream_index is not None:
+                # Segments chiffrés pendant l'archivage
+                for seg in enc_segments:
+                    seg['embed_path'], seg['payload_checksum_sha256'] = seg['encrypted'][stream_index]
+            else:
+                # Chiffrer chaque segment (en parallèle s'il y en a plusieurs)
+                self._encrypt_segments(encryptor, enc_segments, password, set_index, with_artifact)
+
+            # Chiffrer le jeton de vérification
+            if self.debug_mode:
+                logger.info("Chiffrement du jeton de vérification...")
+            
+            token_b64 = encrypt_string_to_base64(
+                plaintext=PASSWORD_CHECK_TOKEN, 
+                password=password,
+                tool=encryptor.tool, 
+                cipher=encryptor.cipher, 
+                iterations=encryptor.iterations,
+                gpg_cipher=encryptor.gpg_cipher, 
+                gpg_s2k=encryptor.gpg_s2k
+            )
+            
+            if not token_b64:
+                raise NvBuilderError("Échec chiffrement jeton.")
+        except (EncryptionError, ToolNotFoundError) as e:
+            raise NvBuilderError(f"Échec chiffrement: {e}") from e
+        
+        # Enregistrer les paramètres utilisés pour le chiffrement du jeton
+        token_params = {"tool": encryptor.tool}
+        if encryptor.tool == "openssl":
+            token_params.update({"cipher": encryptor.cipher, "iter": encryptor.iterations})
+        elif encryptor.tool == "gpg":
+            token_params.update({"cipher": encryptor.gpg_cipher, "s2k_options": encryptor.gpg_s2k})
+        
+        return {
+            'segments': enc_segments,
+            'encrypted': True,
+            'checksum': calculate_checksum_multi([seg['embed_path'] for seg in enc_segments]),
+            'size': sum(seg['embed_path'].stat().st_size for seg in enc_segments),
+            'path': str(enc_segments[0]['embed_path']) if len(enc_segments) == 1 else None,
+            'token_b64': token_b64,
+            'token_params': token_params,
+        }
+
+    def _apply_payload_metadata(self, manager: MetadataManager, payload: Dict[str, Any]):
+        """Enregistre dans les métadonnées d'une variante le payload qu'elle embarque."""
+        if payload['encrypted']:
+            manager.update('encrypted_archive_checksum_sha256', payload['checksum'])
+            manager.update('encrypted_size', payload['size'])
+            if payload['path']:
+                manager.update('encrypted_archive_path', payload['path'])
+            manager.update('password_check_token_b64', payload['token_b64'])
+            manager.update('token_encryption_params', payload['token_params'])
+        
+        # Index du payload conservé dans les métadonnées (sans les chemins temporaires)
+        manager.update('segments', [
+            {k: v for k, v in seg.items() if k not in ('path', 'embed_path', 'encrypted')}
+            for seg in payload['segments']
+        ])
+
+    def _previous_build(self, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Lit l'en-tête du script laissé par le build précédent (paquets différentiels, magasin de blocs).
+        
+        Args:
+            config: Configuration (variante) du script
+            
+        Returns:
+            Dict: Disposition du script existant (read_script_layout), None si 'update.delta'
+            et 'update.chunks' sont désactivés ou si aucun script exploitable n'existe
+        """
+        update_cfg = config.get('update', {})
+        if not update_cfg.get('delta') and not update_cfg.get('chunks'):
+            return None
+        script_path = get_absolute_path(config['output']['path'], self.base_dir)
+        if not script_path.is_file():
+            return None
+        layout = read_script_layout(script_path)
+        if layout is None:
+            logger.warning(f"{WARNING_COLOR}Script précédent '{script_path}' illisible : pas de paquet différentiel.{RESET_STYLE}")
+        return layout
+
+    def _render_variant(self, variant: Dict[str, Any], archive_extension: str,
+                        tar_command_flags: str, show_progress: bool) -> Path:
+        """
+        Génère le script d'une variante à partir du payload partagé.
+        
+        Args:
+            variant: Variante (configuration, métadonnées, payload)
+            archive_extension: Extension des archives tar
+            tar_command_flags: Options pour la commande tar
+            show_progress: Affiche la progression de l'écriture du script
+            
+        Returns:
+            Path: Chemin vers le script généré
+        """
+        config, manager = variant['config'], variant['metadata']
+        metadata_dict = manager.get_all()
+        
+        # Générer uniquement les snippets de chiffrement
+        bash_snippets = generate_encryption_snippets(config, metadata_dict)
+        
+        script_generator = ScriptGenerator(config, metadata_dict, show_progress=show_progress)
+        output_script_path = script_generator.generate(variant['payload']['segments'], archive_extension,
+                                                       tar_command_flags, bash_snippets)
+        if manager.get('output_mode') == 'thin':
+            manager.update('payload_dir', str(script_generator.get_payload_dir(output_script_path)))
+        
+        # Checksums par bloc publiés pour la reprise vérifiée des téléchargements de mise à jour
+        script_hash, block_sums = calculate_block_checksums(output_script_path, DOWNLOAD_BLOCK_SIZE)
+        manager.update('script_checksum_sha256', script_hash)
+        manager.update('script_size', output_script_path.stat().st_size)
+        manager.update('script_blocks', {'block_size': DOWNLOAD_BLOCK_SIZE, 'sha256': block_sums})
+        
+        # Paquet différentiel depuis le script précédent (annoncé dans version.json)
+        if variant.get('previous') and config.get('update', {}).get('delta'):
+            delta = write_delta_package(variant['previous'], output_script_path, self.debug_mode)
+            if delta:
+                manager.update('update_delta', delta)
+        
+        if self.debug_mode:
+            logger.info(f"Hash SHA256 du script '{output_script_path.name}': {script_hash[:12]}...")
+        
+        return output_script_path
+
     def build(self) -> Optional[Path]:
         """
         Orchestre le processus de build complet.
@@ -281,8 +547,11 @@ class NvBuilder:
                 logger.info(f"Script sortie    : {self.config.get('output',{}).get('path')}")
                 logger.info(f"Script post-exec : {self.config.get('script') or 'Aucun'}")
 
-            # Obtenir le mot de passe si nécessaire
-            if not self._get_encryption_password():
+            # Configurations des scripts à générer (une seule sans section 'variants')
+            variant_configs = self.config_loader.get_variant_configs()
+
+            # Obtenir les mots de passe si nécessaire
+            if not self._get_encryption_passwords(variant_configs):
                 raise NvBuilderError("Mot de passe requis/annulé.")
 
             # Hooks pré-build
@@ -295,111 +564,171 @@ class NvBuilder:
                 if self.debug_mode:
                     logger.info(f"Mode de mise à jour défini : {update_mode}")
 
-            # Étape 1: Créer l'archive
+            # Jeux de chiffrement distincts des variantes
+            encryption_keys = []
+            for cfg in variant_configs:
+                key = self._encryption_key(cfg)
+                if key not in [k for k, _ in encryption_keys]:
+                    encryption_keys.append((key, cfg))
+            base_key = self._encryption_key(self.config)
+
+            # Chiffrement interne : les segments sont chiffrés au fil de la compression,
+            # les autres jeux (gpg, commande openssl) chiffrent ensuite les segments en clair
+            streamed: Dict[Tuple, int] = {}
+            stream_encryptions = []
+            set_index = 0
+            for key, cfg in encryption_keys:
+                if key is None:
+                    continue
+                encryptor = Encryptor(cfg)
+                if encryptor.in_process:
+                    streamed[key] = len(stream_encryptions)
+                    password = self.passwords[cfg['compression'].get('password_id', DEFAULT_PASSWORD_ID)]
+                    stream_encryptions.append((encryptor, password, set_index, key == base_key))
+                set_index += 1
+            keep_plain = any(key not in streamed for key, _ in encryption_keys)
+
+            # Étape 1: Créer l'archive (une seule fois, partagée par toutes les variantes)
             if self.debug_mode:
                 logger.info(f"{HIGHLIGHT_STYLE}--- Étape 1: Création Archive ---{RESET_STYLE}")
+                if streamed:
+                    logger.info(f"Chiffrement au fil de l'archivage: {len(streamed)} jeu(x)"
+                                f"{'' if keep_plain else ', sans archive en clair'}")
             
             archiver = Archiver(self.config, self.metadata_manager)
-            archive_path, basename, ext, tar_flag = archiver.create()
-            archive_original_filename = basename + ext
-            path_to_embed = archive_path
-            token_b64 = None
-            token_params = None
-
-            # Étape 2: Chiffrer l'archive si demandé
-            if self.metadata_manager.get('encryption_enabled'):
+            segments, ext, tar_flag = archiver.create(stream_encryptions, keep_plain)
+            tar_command_flags = "x" + tar_flag + "f"
+            
+            # Segments dont les fichiers n'ont pas changé : repris du script précédent à l'identique,
+            # un paquet différentiel ne transporte ainsi que les segments modifiés
+            # (uniquement si les segments en clair ont été écrits)
+            previous_build = self._previous_build(self.config)
+            if previous_build and keep_plain:
+                reused = reuse_previous_segments(segments, self.metadata_manager.get('files_included', []),
+                                                 previous_build, tar_command_flags)
+                if reused:
+                    self.metadata_manager.update('archive_checksum_sha256', calculate_checksum_multi([seg['path'] for seg in segments]))
+                    self.metadata_manager.update('archive_size', sum(seg['size'] for seg in segments))
                 if self.debug_mode:
-                    logger.info(f"{HIGHLIGHT_STYLE}--- Étape 2: Chiffrement ---{RESET_STYLE}")
-                
-                encryptor = Encryptor(self.config)
-                try:
-                    # Chiffrer l'archive
-                    encrypted_archive_path = encryptor.encrypt(archive_path, self.password)
-                    path_to_embed = encrypted_archive_path
-                    enc_checksum = calculate_checksum(encrypted_archive_path)
-                    self.metadata_manager.update('encrypted_archive_checksum_sha256', enc_checksum)
-                    self.metadata_manager.update('encrypted_archive_path', str(encrypted_archive_path))
-                    
-                    if self.debug_mode:
-                        logger.debug(f"Suppression archive non chiffrée: {archive_path}")
-                    archive_path.unlink(missing_ok=True)
+                    logger.info(f"Segments repris du build {previous_build['build_version']}: {reused}/{len(segments)}")
 
-                    # Chiffrer le jeton de vérification
-                    if self.debug_mode:
-                        logger.info("Chiffrement du jeton de vérification...")
-                    
-                    token_b64 = encrypt_string_to_base64(
-                        plaintext=PASSWORD_CHECK_TOKEN, 
-                        password=self.password,
-                        tool=encryptor.tool, 
-                        cipher=encryptor.cipher, 
-                        iterations=encryptor.iterations,
-                        gpg_cipher=encryptor.gpg_cipher, 
-                        gpg_s2k=encryptor.gpg_s2k
-                    )
-                    
-                    if not token_b64:
-                        raise NvBuilderError("Échec chiffrement jeton.")
-                        
-                    self.metadata_manager.update('password_check_token_b64', token_b64)
-                    
-                    # Enregistrer les paramètres utilisés pour le chiffrement du jeton
-                    token_params = {"tool": encryptor.tool}
-                    if encryptor.tool == "openssl":
-                        token_params.update({"cipher": encryptor.cipher, "iter": encryptor.iterations})
-                    elif encryptor.tool == "gpg":
-                        token_params.update({"cipher": encryptor.gpg_cipher, "s2k_options": encryptor.gpg_s2k})
-                        
-                    self.metadata_manager.update('token_encryption_params', token_params)
-
-                except (EncryptionError, ToolNotFoundError) as e:
-                    raise NvBuilderError(f"Échec chiffrement: {e}") from e
-
-            # Étape 3: Préparer les snippets Bash
-            if self.debug_mode:
-                logger.info(f"{HIGHLIGHT_STYLE}--- Étape 3: Préparation Script Bash ---{RESET_STYLE}")
+            # Étape 2: Chiffrer les segments, une fois par jeu de chiffrement distinct
+            if any(key is not None for key, _ in encryption_keys) and self.debug_mode:
+                logger.info(f"{HIGHLIGHT_STYLE}--- Étape 2: Chiffrement ---{RESET_STYLE}")
             
-            metadata_dict = self.metadata_manager.get_all()
+            payloads: Dict[Optional[Tuple], Dict[str, Any]] = {}
+            set_index = 0
+            for key, cfg in encryption_keys:
+                if key is None:
+                    payloads[key] = {
+                        'segments': [dict(seg, embed_path=seg['path'], payload_checksum_sha256=seg['checksum_sha256'])
+                                     for seg in segments],
+                        'encrypted': False,
+                    }
+                else:
+                    payloads[key] = self._encrypt_payload(cfg, segments, set_index, with_artifact=(key == base_key),
+                                                          stream_index=streamed.get(key))
+                    set_index += 1
             
-            # Générer uniquement les snippets de chiffrement
-            encryption_snippets = generate_encryption_snippets(self.config, metadata_dict, archive_original_filename)
+            if base_key is not None and base_key not in payloads and self.config['output']['artifacts'].get('encrypted_archive'):
+                logger.warning(f"{WARNING_COLOR}Aucune variante n'utilise le chiffrement principal : artefact 'encrypted_archive' non généré.{RESET_STYLE}")
             
-            # Initialiser snippets comme un dictionnaire vide car nous n'avons plus besoin des snippets de mise à jour
-            bash_snippets = encryption_snippets
+            if None not in payloads:
+                # Plus aucune variante n'embarque l'archive en clair
+                for seg in segments:
+                    if not seg['path']:
+                        continue
+                    if self.debug_mode:
+                        logger.debug(f"Suppression archive non chiffrée: {seg['path']}")
+                    seg['path'].unlink(missing_ok=True)
+
+            # Métadonnées propres à chaque variante (l'archive est commune)
+            self.variants = []
+            for cfg in variant_configs:
+                if cfg is self.config:
+                    manager = self.metadata_manager
+                else:
+                    manager = MetadataManager(cfg, self.build_version)
+                    manager.import_archive_data(self.metadata_manager)
+                payload = payloads[self._encryption_key(cfg)]
+                self._apply_payload_metadata(manager, payload)
+                self.variants.append({'name': cfg.get('_variant'), 'config': cfg, 'metadata': manager,
+                                      'payload': payload, 'output_path': None,
+                                      'previous': previous_build if cfg is self.config else self._previous_build(cfg)})
 
-            # Étape 4: Générer le script final
+            # Étapes 3 et 4: Préparer les snippets Bash et générer les scripts
             if self.debug_mode:
-                logger.info(f"{HIGHLIGHT_STYLE}--- Étape 4: Génération Script Final ---{RESET_STYLE}")
+                logger.info(f"{HIGHLIGHT_STYLE}--- Étapes 3-4: Génération Script(s) Final(aux) ---{RESET_STYLE}")
             
-            script_generator = ScriptGenerator(self.config, metadata_dict)
-            tar_command_flags = "x" + tar_flag + "f"
-            output_script_path = script_generator.generate(path_to_embed, archive_original_filename, tar_command_flags, bash_snippets)
+            if len(self.variants) == 1:
+                self.variants[0]['output_path'] = self._render_variant(self.variants[0], ext, tar_command_flags, True)
+            else:
+                # Seul l'en-tête diffère : les scripts sont écrits en parallèle
+                if not self.debug_mode:
+                    print(f"{INFO_COLOR}{HIGHLIGHT_STYLE}Génération des variantes...  ", end=" ", flush=True)
+                workers = min(len(self.variants), os.cpu_count() or 2)
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    output_paths = list(pool.map(
+                        lambda variant: self._render_variant(variant, ext, tar_command_flags, False),
+                        self.variants
+                    ))
+                for variant, path in zip(self.variants, output_paths):
+                    variant['output_path'] = path
+                if not self.debug_mode:
+                    print(f"{SUCCESS_COLOR}OK{RESET_STYLE} ({len(self.variants)} scripts)")
 
-            # Étape 5: Finalisation (Hash, Fichiers annexes)
+            # Étape 5: Finalisation (Fichiers annexes)
             if self.debug_mode:
                 logger.info(f"{HIGHLIGHT_STYLE}--- Étape 5: Finalisation (Hash, Fichiers Annexes) ---{RESET_STYLE}")
             
-            script_hash = calculate_checksum(output_script_path)
-            self.metadata_manager.update('script_checksum_sha256', script_hash)
+            # Magasin de blocs (annoncé dans version.json) : publié variante par variante,
+            # le nettoyage des blocs non référencés tient compte des index de toutes les variantes
+            for variant in self.variants:
+                if variant['config'].get('update', {}).get('chunks'):
+                    previous = variant.get('previous')
+                    chunks = write_chunk_index(variant['output_path'], previous['build_version'] if previous else None,
+                                               self.debug_mode)
+                    variant['metadata'].update('update_chunks', chunks)
             
-            if self.debug_mode:
-                logger.info(f"Hash SHA256 du script '{output_script_path.name}': {script_hash[:12]}...")
+            # Manifeste commun : tous les scripts et les artefacts d'archive
+            self.metadata_manager.write_checksums_file([
+                (variant['metadata'].get('script_checksum_sha256'), variant['output_path'])
+                for variant in self.variants
+            ])
+            checksums_artifact = self.metadata_manager.get('artifacts', {}).get('checksums')
+            
+            # Écrire les fichiers de métadonnées de chaque variante
+            for variant in self.variants:
+                manager = variant['metadata']
+                if checksums_artifact and manager is not self.metadata_manager:
+                    manager.add_artifact('checksums', Path(checksums_artifact['path']),
+                                         checksums_artifact['size'], checksums_artifact['checksum_sha256'])
+                manager.write_metadata_file(variant['output_path'])
+                manager.write_version_file()
 
-            # Écrire les fichiers de métadonnées
-            self.metadata_manager.write_metadata_file(output_script_path)
-            self.metadata_manager.write_version_file()
+            # Publication dans le dépôt de mises à jour (avant les hooks, qui peuvent le synchroniser)
+            if self.config.get('publish', {}).get('enabled'):
+                if not self.debug_mode:
+                    print(f"{INFO_COLOR}{HIGHLIGHT_STYLE}Publication...  ", end=" ", flush=True)
+                result = Publisher(self.config, debug_mode=self.debug_mode).publish(variant_configs)
+                if not self.debug_mode:
+                    print(f"{SUCCESS_COLOR}OK{RESET_STYLE} ({result['repo_dir']})")
 
             # Hooks post-build
             self._run_hooks('post_build')
 
+            output_script_path = self.variants[0]['output_path']
+
             # Afficher les informations de fin
             if self.debug_mode:
                 end_time = time.time()
                 duration = end_time - self.start_time
-                final_size_mb = output_script_path.stat().st_size / (1024 * 1024)
                 logger.info(f"{SUCCESS_COLOR}{HIGHLIGHT_STYLE}--- Build Terminé (Mode Debug) ---{RESET_STYLE}")
                 logger.info(f"Durée du build: {duration:.2f}s")
-                logger.info(f"Script généré : {output_script_path} ({final_size_mb:.2f} Mo)")
+                for variant in self.variants:
+                    final_size_mb = variant['output_path'].stat().st_size / (1024 * 1024)
+                    label = f" [{variant['name']}]" if variant['name'] else ""
+                    logger.info(f"Script généré{label} : {variant['output_path']} ({final_size_mb:.2f} Mo)")
                 
                 if self.metadata_manager.get('update_enabled'):
                     update_mode = self.metadata_manager.get('update_mode', 'check-only')
@@ -428,11 +757,7 @@ class NvBuilder:
             # Nettoyage final
             if archiver:
                 archiver.cleanup()
-            # Effacer le mot de passe de la mémoire
-            if self.password:
-                try:
-                    self.password = '*' * len(self.password)
-                    del self.password
-                    self.password = None
-                except:
-                    pass
\ No newline at end of file
+            # Effacer les mots de passe de la mémoire
+            for password_id in list(self.passwords):
+                self.passwords[password_id] = '*' * len(self.passwords[password_id])
+            self.passwords.clear()
@@ -0,0 +1,379 @@
+# nvbuilder/chunker.py
+"""Découpage du payload en blocs définis par leur contenu et magasin de blocs pour les mises à jour."""
+
+import base64
+import hashlib
+import logging
+import math
+import os
+import re
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+from .constants import (
+    B64_CHUNK_SIZE, CHUNK_FORMAT_VERSION, CHUNK_STORE_DIRNAME, CHUNK_MIN_SIZE, CHUNK_AVG_SIZE,
+    CHUNK_MAX_SIZE, RSYNCABLE_MIN_SIZE, RSYNCABLE_AVG_SIZE, RSYNCABLE_MAX_SIZE
+)
+from .delta import read_script_layout
+from .exceptions import BuildProcessError
+
+logger = logging.getLogger("nvbuilder")
+
+# Hachage glissant : somme, sur une fenêtre de 64 octets, des valeurs associées à chaque octet
+# par une table fixe pseudo-aléatoire (valeurs impaires : une suite d'octets identiques ne
+# produit jamais de limite). Les sommes de toutes les positions d'un bloc sont calculées d'un
+# coup sur un entier Python (un octet par champ de 16 bits, additions décalées), les positions
+# dont l'octet de poids faible de la somme est nul (une sur 128 en moyenne) sont candidates.
+# Le CRC32 des octets précédant une position candidate décide ensuite de la limite.
+_GEAR = bytes(hashlib.sha256(bytes([i])).digest()[0] | 1 for i in range(256))
+ROLLING_WINDOW = 64  # Puissance de 2 (sommes par doublements successifs)
+CANDIDATE_SPACING = 128
+HASH_WINDOW = 48  # Octets précédant la position candidate pris en compte par le CRC32
+SCAN_STEP = 32 * 1024
+
+READ_BLOCK_SIZE = 1024 * 1024
+SHA256_NAME = re.compile(r"[0-9a-f]{64}")
+
+
+def _candidate_positions(buffer: bytearray, start: int, limit: int) -> Iterator[int]:
+    """Positions p de [start, limit] (coupure après l'octet p-1) où la somme glissante s'annule modulo 256."""
+    base = max(start - ROLLING_WINDOW, 0)
+    data = bytes(buffer[base:limit]).translate(_GEAR)
+    count = len(data)
+    fields = bytearray(2 * count)
+    fields[0::2] = data
+    sums = int.from_bytes(fields, 'little')
+    shift = 16
+    while shift < 16 * ROLLING_WINDOW:
+        sums += sums << shift
+        shift <<= 1
+    encoded = sums.to_bytes(2 * (count + ROLLING_WINDOW), 'little')
+    # Champ j : somme des octets base+j-63 .. base+j (fenêtre complète dès j = 63)
+    first = max(start - base - 1, ROLLING_WINDOW - 1)
+    i = encoded.find(0, 2 * first, 2 * count)
+    while i >= 0:
+        if not i & 1:
+            yield base + i // 2 + 1
+        i = encoded.find(0, i + 1, 2 * count)
+
+
+class ContentDefinedChunker:
+    """
+    Détermine les limites de blocs d'un flux à partir de son contenu.
+
+    Une limite est placée après une position candidate du hachage glissant dont le CRC32
+    de la fenêtre précédente a ses bits de poids faible nuls : une insertion ou une
+    suppression ne déplace que les limites voisines, les blocs suivants restent identiques.
+    """
+
+    def __init__(self, min_size: int = CHUNK_MIN_SIZE, avg_size: int = CHUNK_AVG_SIZE,
+                 max_size: int = CHUNK_MAX_SIZE):
+        """
+        Args:
+            min_size: Taille minimale d'un bloc (aucune limite recherchée avant)
+            avg_size: Taille moyenne visée (approximative)
+            max_size: Taille maximale (limite imposée au-delà)
+        """
+        self.min_size = max(min_size, ROLLING_WINDOW, HASH_WINDOW)
+        self.max_size = max(max_size, self.min_size + 1)
+        bits = round(math.log2(max(1.0, (avg_size - self.min_size) / CANDIDATE_SPACING)))
+        self.mask = (1 << bits) - 1
+        self._scanned = 0
+
+    def find_cut(self, buffer: bytearray) -> Optional[int]:
+        """
+        Cherche la prochaine limite dans le début de flux non encore découpé.
+
+        La recherche reprend là où l'appel précédent s'est arrêté, tant que le tampon
+        ne fait que grandir.
+
+        Returns:
+            int: Longueur du bloc à émettre, None s'il faut davantage de données
+        """
+        limit = min(len(buffer), self.max_size)
+        start = max(self._scanned, self.min_size)
+        # Par tranches : la limite se trouve en général bien avant la taille maximale
+        while start <= limit:
+            stop = min(start + SCAN_STEP, limit)
+            for end in _candidate_positions(buffer, start, stop):
+                if not zlib.crc32(buffer[end - HASH_WINDOW:end]) & self.mask:
+                    self._scanned = 0
+                    return end
+            start = stop + 1
+        if len(buffer) >= self.max_size:
+            self._scanned = 0
+            return self.max_size
+        self._scanned = max(limit + 1, self._scanned)
+        return None
+
+
+def iter_chunks(blocks: Iterable[bytes], chunker: Optional[ContentDefinedChunker] = None) -> Iterator[bytes]:
+    """
+    Découpe un flux (suite de blocs de lecture) en blocs définis par leur contenu.
+
+    Args:
+        blocks: Données du flux, dans l'ordre
+        chunker: Paramètres de découpage (magasin de blocs par défaut)
+
+    Yields:
+        bytes: Blocs successifs, dont la concaténation restitue le flux
+    """
+    chunker = chunker or ContentDefinedChunker()
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        while True:
+            cut = chunker.find_cut(buffer)
+            if cut is None:
+                break
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+    if buffer:
+        yield bytes(buffer)
+
+
+class RsyncableGzipWriter:
+    """
+    Compresse en gzip un flux tar en réinitialisant le compresseur à des limites définies
+    par le contenu non compressé (équivalent de 'gzip --rsyncable').
+
+    Après chaque limite, la sortie compressée ne dépend plus que des données qui suivent :
+    un fichier légèrement modifié ne change que quelques blocs de l'archive compressée,
+    les autres restent identiques d'un build à l'autre. L'en-tête gzip ne contient pas de date.
+    """
+
+    def __init__(self, output: Any, level: int = 9):
+        """
+        Args:
+            output: Objet disposant d'une méthode write(bytes) (non fermé par le writer)
+            level: Niveau de compression (1-9)
+        """
+        self.output = output
+        self._chunker = ContentDefinedChunker(RSYNCABLE_MIN_SIZE, RSYNCABLE_AVG_SIZE, RSYNCABLE_MAX_SIZE)
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._buffer = bytearray()
+        self._crc = 0
+        self._size = 0
+        self._closed = False
+        # Magic, deflate, sans drapeau, date nulle, XFL, système inconnu
+        self.output.write(b"\x1f\x8b\x08\x00\x00\x00\x00\x00" + (b"\x02" if level == 9 else b"\x00") + b"\xff")
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while True:
+            cut = self._chunker.find_cut(self._buffer)
+            if cut is None:
+                break
+            self._compress(self._buffer[:cut], zlib.Z_FULL_FLUSH)
+            del self._buffer[:cut]
+        return len(data)
+
+    def _compress(self, data: bytes, flush_mode: int):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self.output.write(self._compressor.compress(data) + self._compressor.flush(flush_mode))
+
+    def close(self):
+        """Compresse la fin du flux et écrit le pied gzip (CRC32 et taille)."""
+        if self._closed:
+            return
+        self._closed = True
+        self._compress(bytes(self._buffer), zlib.Z_FINISH)
+        self._buffer = bytearray()
+        self.output.write(struct.pack("<II", self._crc & 0xffffffff, self._size & 0xffffffff))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def chunk_index_name(script_path: Path, build_version: str) -> str:
+    """Nom de l'index de blocs d'un script pour une version de build."""
+    return f"{script_path.stem}_{build_version}.chunks"
+
+
+def _region_blocks(f, offset: int, length: int, decode: bool) -> Iterator[bytes]:
+    """Lit une région du script par blocs (décodés si la région est en Base64)."""
+    f.seek(offset)
+    remaining = length
+    # Bloc multiple de 4 : décodage Base64 indépendant par bloc
+    block_size = B64_CHUNK_SIZE // 3 * 4 if decode else READ_BLOCK_SIZE
+    while remaining:
+        block = f.read(min(remaining, block_size))
+        if not block:
+            raise ValueError("région tronquée")
+        remaining -= len(block)
+        yield base64.b64decode(block) if decode else block
+
+
+def _script_parts(layout: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Décrit le script comme une suite de régions : l'en-tête (texte et manifeste), recopié
+    tel quel, puis la région Base64 de chaque segment, découpée après décodage.
+    """
+    header_length = layout['payload_base'] + (layout['manifest_length'] + 1 if layout['manifest_length'] else 0)
+    parts = [{'kind': 'raw', 'offset': 0, 'length': header_length, 'size': header_length}]
+    for seg in layout['segments']:
+        parts.append({'kind': 'b64', 'offset': layout['payload_base'] + seg['offset'],
+                      'length': seg['b64_length'], 'size': seg['size']})
+    return parts
+
+
+def _store_chunk(store_dir: Path, checksum: str, data: bytes) -> bool:
+    """Ajoute un bloc au magasin s'il n'y figure pas déjà. Retourne True s'il a été écrit."""
+    chunk_path = store_dir / checksum[:2] / checksum
+    if chunk_path.is_file() and chunk_path.stat().st_size == len(data):
+        return False
+    chunk_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = chunk_path.with_name(checksum + '.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, chunk_path)
+    return True
+
+
+def _referenced_chunks(index_dir: Path) -> Optional[set]:
+    """Blocs référencés par les index présents dans le répertoire (None si un index est illisible)."""
+    referenced = set()
+    for index_path in index_dir.glob("*.chunks"):
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                if not f.readline().startswith("nvbuilder-chunks "):
+                    continue
+                for line in f:
+                    if line.startswith("chunk "):
+                        referenced.add(line.split()[1])
+        except OSError as e:
+            logger.warning(f"Index de blocs illisible '{index_path}': {e}")
+            return None
+    return referenced
+
+
+def _prune_store(script_path: Path, keep: List[str]) -> int:
+    """
+    Supprime les index obsolètes du script puis les blocs qu'aucun index ne référence.
+
+    Args:
+        script_path: Script généré (les index et le magasin sont à côté)
+        keep: Noms des index du script à conserver
+
+    Returns:
+        int: Nombre de blocs supprimés
+    """
+    stale = re.compile(rf"{re.escape(script_path.stem)}_\d+\.chunks")
+    for index_path in script_path.parent.glob(f"{script_path.stem}_*.chunks"):
+        if index_path.name not in keep and stale.fullmatch(index_path.name):
+            index_path.unlink(missing_ok=True)
+
+    # Le magasin peut être partagé par plusieurs scripts (variantes) : on ne supprime
+    # que les blocs absents de tous les index présents
+    return prune_chunk_store(script_path.parent)
+
+
+def prune_chunk_store(directory: Path) -> int:
+    """
+    Supprime du magasin de blocs d'un répertoire les blocs qu'aucun index présent ne référence.
+
+    Args:
+        directory: Répertoire contenant les index (*.chunks) et le magasin
+
+    Returns:
+        int: Nombre de blocs supprimés (aucun si un index est illisible)
+    """
+    referenced = _referenced_chunks(directory)
+    store_dir = directory / CHUNK_STORE_DIRNAME
+    if referenced is None or not store_dir.is_dir():
+        return 0
+    removed = 0
+    for chunk_path in store_dir.glob("*/*"):
+        if SHA256_NAME.fullmatch(chunk_path.name) and chunk_path.name not in referenced:
+            chunk_path.unlink(missing_ok=True)
+            removed += 1
+    for sub_dir in store_dir.iterdir():
+        if sub_dir.is_dir() and not any(sub_dir.iterdir()):
+            sub_dir.rmdir()
+    return removed
+
+
+def write_chunk_index(script_path: Path, previous_version: Optional[str] = None,
+                      debug_mode: bool = False) -> Dict[str, Any]:
+    """
+    Publie à côté du script le magasin de blocs et l'index du build.
+
+    L'en-tête du script et chaque segment (décodé) sont découpés en blocs définis par leur
+    contenu ; chaque bloc absent du magasin y est ajouté sous son SHA256. L'index liste, pour
+    chaque région du script, les blocs qui la composent : le script généré peut ainsi
+    reconstruire une nouvelle version en ne téléchargeant que les blocs absents de son propre
+    payload (localisés grâce à l'index de son build). Seuls les index du build courant et
+    du build précédent sont conservés.
+
+    Args:
+        script_path: Script généré
+        previous_version: Version de build du script remplacé (son index est conservé)
+        debug_mode: Affiche les statistiques du magasin
+
+    Returns:
+        Dict: 'index' (nom du fichier), 'store' (répertoire du magasin), 'count' (blocs),
+        'new_chunks' et 'new_bytes' (blocs ajoutés au magasin)
+
+    Raises:
+        BuildProcessError: Si le script est illisible ou si l'écriture échoue
+    """
+    layout = read_script_layout(script_path)
+    if not layout:
+        raise BuildProcessError(f"Script généré illisible: {script_path}")
+    if layout['payload_mode'] != 'embedded':
+        raise BuildProcessError("Le magasin de blocs nécessite un payload intégré au script.")
+
+    store_dir = script_path.parent / CHUNK_STORE_DIRNAME
+    name = chunk_index_name(script_path, layout['build_version'])
+    index_path = script_path.parent / name
+    digest = hashlib.sha256()
+    script_size = script_path.stat().st_size
+    lines: List[str] = []
+    count, new_chunks, new_bytes = 0, 0, 0
+    try:
+        with open(script_path, 'rb') as f:
+            for part in _script_parts(layout):
+                lines.append(f"part {part['kind']} {part['offset']} {part['length']} {part['size']}")
+                data_offset = 0
+                for chunk in iter_chunks(_region_blocks(f, part['offset'], part['length'], part['kind'] == 'b64')):
+                    checksum = hashlib.sha256(chunk).hexdigest()
+                    if _store_chunk(store_dir, checksum, chunk):
+                        new_chunks += 1
+                        new_bytes += len(chunk)
+                    lines.append(f"chunk {checksum} {data_offset} {len(chunk)}")
+                    data_offset += len(chunk)
+                    count += 1
+                if data_offset != part['size']:
+                    raise ValueError(f"région à l'offset {part['offset']} incohérente avec l'index")
+            f.seek(0)
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                digest.update(block)
+
+        lines.insert(0, f"nvbuilder-chunks {CHUNK_FORMAT_VERSION} {layout['build_version']} {script_size} {digest.hexdigest()}")
+        tmp_path = index_path.with_name(name + '.tmp')
+        tmp_path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+        os.replace(tmp_path, index_path)
+    except (OSError, ValueError) as e:
+        raise BuildProcessError(f"Publication du magasin de blocs '{store_dir}' échouée: {e}") from e
+
+    keep = [name]
+    if previous_version and previous_version != layout['build_version']:
+        keep.append(chunk_index_name(script_path, previous_version))
+    removed = _prune_store(script_path, keep)
+
+    if debug_mode:
+        logger.info(f"Magasin de blocs: {count} blocs, {new_chunks} nouveaux "
+                    f"({new_bytes / (1024*1024):.2f} Mo), {removed} supprimés - index {name}")
+
+    return {
+        'index': name,
+        'store': CHUNK_STORE_DIRNAME,
+        'count': count,
+        'new_chunks': new_chunks,
+        'new_bytes': new_bytes,
+    }
@@ -0,0 +1,121 @@
+# nvbuilder/cipher.py
+"""
+Chiffrement dans le processus au format de 'openssl enc -salt -pbkdf2'.
+
+Le flux produit est identique à celui d'openssl : en-tête 'Salted__', sel de 8 octets,
+puis les données chiffrées en AES-CBC (remplissage PKCS#7) ou AES-CTR, la clé et l'IV
+étant dérivés du mot de passe par PBKDF2-HMAC-SHA256. Il est donc déchiffré sans
+changement par 'openssl enc -d -<cipher> -pbkdf2 -iter <n>' dans le script généré.
+
+Nécessite le paquet optionnel 'cryptography' ; sans lui (ou pour un autre algorithme),
+Encryptor et encrypt_string_to_base64 utilisent la commande openssl.
+"""
+
+import io
+import os
+from typing import Any
+
+from .exceptions import EncryptionError
+from .constants import DEFAULT_OPENSSL_CIPHER, DEFAULT_OPENSSL_ITER
+
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives.padding import PKCS7
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
+OPENSSL_MAGIC = b"Salted__"
+OPENSSL_SALT_SIZE = 8
+AES_BLOCK_SIZE = 16
+# Algorithmes d'openssl enc reproduits : nom -> (taille de clé, mode)
+SUPPORTED_CIPHERS = {
+    f"aes-{bits}-{mode}": (bits // 8, mode)
+    for bits in (128, 192, 256)
+    for mode in ("cbc", "ctr")
+}
+
+
+def in_process_supported(cipher: str) -> bool:
+    """Indique si l'algorithme openssl peut être chiffré sans lancer la commande openssl."""
+    return HAS_CRYPTOGRAPHY and cipher.lower() in SUPPORTED_CIPHERS
+
+
+class OpensslEncryptWriter:
+    """
+    Objet fichier en écriture qui chiffre au fil de l'eau vers une sortie.
+
+    L'en-tête est écrit à la création ; finish() écrit le dernier bloc (remplissage CBC).
+    Comme TeeWriter, la sortie n'est pas fermée par le writer.
+    """
+
+    def __init__(self, output: Any, password: str, cipher: str = DEFAULT_OPENSSL_CIPHER,
+                 iterations: int = DEFAULT_OPENSSL_ITER, salt: bytes = None):
+        """
+        Args:
+            output: Objet disposant d'une méthode write(bytes)
+            password: Mot de passe (encodé en UTF-8, comme transmis à openssl par '-pass env:')
+            cipher: Algorithme openssl (aes-128/192/256, cbc ou ctr)
+            iterations: Itérations PBKDF2 ('-iter')
+            salt: Sel (aléatoire par défaut)
+
+        Raises:
+            EncryptionError: Si 'cryptography' est absent ou l'algorithme non supporté
+        """
+        if not in_process_supported(cipher):
+            raise EncryptionError(f"Chiffrement interne indisponible pour '{cipher}' "
+                                  f"({'algorithme non supporté' if HAS_CRYPTOGRAPHY else 'cryptography absent'}).")
+        key_size, mode = SUPPORTED_CIPHERS[cipher.lower()]
+        salt = salt if salt is not None else os.urandom(OPENSSL_SALT_SIZE)
+        if len(salt) != OPENSSL_SALT_SIZE:
+            raise EncryptionError(f"Sel de {len(salt)} octets (attendu: {OPENSSL_SALT_SIZE}).")
+
+        # openssl enc -pbkdf2 : clé et IV dérivés ensemble (SHA256 par défaut)
+        derived = PBKDF2HMAC(algorithm=hashes.SHA256(), length=key_size + AES_BLOCK_SIZE,
+                             salt=salt, iterations=iterations).derive(password.encode('utf-8'))
+        key, iv = derived[:key_size], derived[key_size:]
+        cipher_mode = modes.CBC(iv) if mode == "cbc" else modes.CTR(iv)
+        self._encryptor = Cipher(algorithms.AES(key), cipher_mode).encryptor()
+        self._padder = PKCS7(algorithms.AES.block_size).padder() if mode == "cbc" else None
+        self.output = output
+        self.size = 0
+        self.finished = False
+        self._emit(OPENSSL_MAGIC + salt)
+
+    def _emit(self, data: bytes):
+        if data:
+            self.output.write(data)
+            self.size += len(data)
+
+    def write(self, data: bytes) -> int:
+        if self._padder:
+            self._emit(self._encryptor.update(self._padder.update(data)))
+        else:
+            self._emit(self._encryptor.update(data))
+        return len(data)
+
+    def finish(self):
+        """Termine le chiffrement (dernier bloc et remplissage). Sans effet si déjà appelé."""
+        if self.finished:
+            return
+        tail = self._encryptor.update(self._padder.finalize()) if self._padder else b""
+        self._emit(tail + self._encryptor.finalize())
+        self.finished = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+
+
+def encrypt_bytes(data: bytes, password: str, cipher: str = DEFAULT_OPENSSL_CIPHER,
+                  iterations: int = DEFAULT_OPENSSL_ITER) -> bytes:
+    """Chiffre des données en mémoire (format 'openssl enc -salt -pbkdf2')."""
+    buffer = io.BytesIO()
+    with OpensslEncryptWriter(buffer, password, cipher, iterations) as writer:
+        writer.write(data)
+    return buffer.getvalue()
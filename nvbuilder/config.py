@@ -1,6 +1,7 @@
 """Gestion de la configuration."""
 
 import yaml
+import re
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 import copy
@@ -8,9 +9,9 @@ import logging
 import traceback
 import time
 
-from .constants import DEFAULT_CONFIG, DEFAULT_CONFIG_FILENAME, VERSION, DEFAULT_UPDATE_MODE, UPDATE_MODES
+from .constants import DEFAULT_CONFIG, DEFAULT_CONFIG_FILENAME, VERSION, DEFAULT_UPDATE_MODE, UPDATE_MODES, SEGMENTATION_MODES, COMMON_PLATFORM_KEY, OUTPUT_MODES, DEFAULT_OUTPUT_MODE, VARIANT_OVERRIDE_KEYS, VARIANT_COMPRESSION_KEYS
 from .exceptions import ConfigError
-from .utils import (get_absolute_path, get_all_standard_exclusions,
+from .utils import (get_absolute_path, get_all_standard_exclusions, merge_dicts,
                     _get_nested, _set_nested, prompt_string, prompt_bool,
                     save_config_yaml)
 
@@ -78,29 +79,42 @@ class ConfigLoader:
     def _apply_defaults(self, raw_config: Dict[str, Any]) -> Dict[str, Any]:
         """Applique les valeurs par défaut en fusionnant récursivement."""
         config_with_defaults = copy.deepcopy(DEFAULT_CONFIG)
+        return merge_dicts(config_with_defaults, raw_config)
 
-        def merge_dicts(default: Dict, loaded: Dict) -> Dict:
-            """Fonction interne de fusion récursive des dictionnaires."""
-            merged = default.copy() # Commencer avec une copie des défauts
-            # Parcourir les clés chargées
-            for key, loaded_value in loaded.items():
-                default_value = merged.get(key)
-                # Si la clé existe dans les deux et ce sont des dictionnaires -> fusion récursive
-                if isinstance(loaded_value, dict) and isinstance(default_value, dict):
-                    merged[key] = merge_dicts(default_value, loaded_value)
-                # Sinon (clé nouvelle, ou pas des dictionnaires) -> remplacer par la valeur chargée
-                else:
-                    merged[key] = loaded_value
-            return merged
-
-        # Appeler la fonction de fusion récursive
-        final_config = merge_dicts(config_with_defaults, raw_config)
-        return final_config
+    def get_variant_configs(self) -> List[Dict[str, Any]]:
+        """
+        Retourne la configuration de chaque script à générer.
+        
+        Sans section 'variants', seule la configuration principale est retournée.
+        Sinon, chaque variante est la configuration principale surchargée par ses
+        propres sections d'en-tête ('script', 'update', 'output', chiffrement).
+        """
+        variants = self.config.get('variants') or []
+        if not variants:
+            return [self.config]
+        
+        variant_configs = []
+        for variant in variants:
+            overrides = {k: v for k, v in variant.items() if k != 'name'}
+            variant_config = merge_dicts(copy.deepcopy(self.config), copy.deepcopy(overrides))
+            variant_config['variants'] = []
+            variant_config['_variant'] = variant['name']
+            variant_configs.append(variant_config)
+        return variant_configs
 
     def _validate_config(self):
         """Valide la configuration chargée."""
-        # Vérification du contenu
-        if not isinstance(self.config.get('content'), str) or not self.config['content']:
+        # Vérification du contenu (chemin unique ou dictionnaire {plateforme: chemin})
+        content_cfg = self.config.get('content')
+        if isinstance(content_cfg, dict):
+            if not any(k != COMMON_PLATFORM_KEY for k in content_cfg):
+                raise ConfigError(f"'content' doit définir au moins une plateforme en plus de '{COMMON_PLATFORM_KEY}'.")
+            for plat, plat_dir in content_cfg.items():
+                if not isinstance(plat, str) or not re.fullmatch(r'[A-Za-z0-9_.-]+', plat):
+                    raise ConfigError(f"Nom de plateforme invalide dans 'content': '{plat}'.")
+                if not isinstance(plat_dir, str) or not plat_dir:
+                    raise ConfigError(f"'content.{plat}' requis (chaîne non vide).")
+        elif not isinstance(content_cfg, str) or not content_cfg:
              raise ConfigError("'content' requis (chaîne non vide).")
         
         # Vérification du chemin de sortie
@@ -108,6 +122,47 @@ class ConfigLoader:
            not isinstance(self.config['output'].get('path'), str) or not self.config['output']['path']:
              raise ConfigError("'output.path' requis (chaîne non vide).")
         
+        # Vérification du mode de sortie
+        output_mode = self.config['output'].get('mode', DEFAULT_OUTPUT_MODE)
+        if output_mode not in OUTPUT_MODES:
+            raise ConfigError(f"Mode de sortie invalide: '{output_mode}' (attendu: {', '.join(OUTPUT_MODES)}).")
+        if output_mode == 'thin' and not self.config['output'].get('payload_url'):
+            raise ConfigError("'output.payload_url' requis en mode 'thin' (URL de publication des segments).")
+        
+        # Vérification du cache d'extraction côté cible
+        cache_cfg = self.config['output'].get('extract_cache')
+        if not isinstance(cache_cfg, dict) or not isinstance(cache_cfg.get('enabled'), bool):
+            raise ConfigError("'output.extract_cache.enabled' doit être un booléen.")
+        cache_max = cache_cfg.get('max_size_mb')
+        if isinstance(cache_max, bool) or not isinstance(cache_max, int) or cache_max < 0:
+            raise ConfigError(f"'output.extract_cache.max_size_mb' doit être un entier positif ou nul (reçu: {cache_max!r}).")
+        if cache_cfg['enabled'] and self.config.get('compression', {}).get('encrypted'):
+            raise ConfigError("'output.extract_cache' est incompatible avec le chiffrement (contenu conservé en clair sur la cible).")
+        
+        # Vérification du placement du répertoire de travail côté cible
+        work_dir_cfg = self.config['output'].get('work_dir')
+        ram_fraction = work_dir_cfg.get('ram_fraction') if isinstance(work_dir_cfg, dict) else None
+        if isinstance(ram_fraction, bool) or not isinstance(ram_fraction, (int, float)) or not 0 <= ram_fraction <= 1:
+            raise ConfigError(f"'output.work_dir.ram_fraction' doit être un nombre entre 0 et 1 (reçu: {ram_fraction!r}).")
+        
+        # Vérification des artefacts additionnels
+        artifacts = self.config['output'].get('artifacts')
+        if not isinstance(artifacts, dict):
+            raise ConfigError("'output.artifacts' doit être un dictionnaire.")
+        for kind, artifact_path in artifacts.items():
+            if kind not in DEFAULT_CONFIG['output']['artifacts']:
+                raise ConfigError(f"Artefact inconnu: 'output.artifacts.{kind}'.")
+            if artifact_path and not isinstance(artifact_path, str):
+                raise ConfigError(f"'output.artifacts.{kind}' doit être un chemin.")
+        if isinstance(self.config.get('content'), dict) and (artifacts.get('archive') or artifacts.get('encrypted_archive')):
+            raise ConfigError("Les artefacts d'archive ne sont pas disponibles avec un contenu multi-plateformes.")
+        if artifacts.get('encrypted_archive') and '_variant' not in self.config:
+            # Artefact produit avec le chiffrement de la configuration principale
+            if not self.config.get('compression', {}).get('encrypted'):
+                raise ConfigError("'output.artifacts.encrypted_archive' nécessite 'compression.encrypted: true'.")
+            if self.config.get('payload', {}).get('segmentation', 'none') != 'none':
+                raise ConfigError("'output.artifacts.encrypted_archive' nécessite un payload non segmenté.")
+        
         # Vérification de la compression
         if 'compression' not in self.config or not isinstance(self.config.get('compression'), dict):
             raise ConfigError("Section 'compression' manquante ou invalide.")
@@ -116,9 +171,160 @@ class ConfigLoader:
         if comp_method not in ['gz', 'bz2', 'xz', 'none']:
              raise ConfigError(f"Méthode compression invalide: '{comp_method}'.")
         
+        # Vérification de la segmentation du payload
+        payload_cfg = self.config.get('payload')
+        if not isinstance(payload_cfg, dict):
+            raise ConfigError("Section 'payload' invalide.")
+        if payload_cfg.get('segmentation') not in SEGMENTATION_MODES:
+            raise ConfigError(f"Segmentation invalide: '{payload_cfg.get('segmentation')}' (attendu: {', '.join(SEGMENTATION_MODES)}).")
+        seg_size = payload_cfg.get('segment_size_mb')
+        if isinstance(seg_size, bool) or not isinstance(seg_size, int) or seg_size <= 0:
+            raise ConfigError(f"'payload.segment_size_mb' doit être un entier positif (reçu: {seg_size!r}).")
+        if not isinstance(payload_cfg.get('platform_probe'), str) or not payload_cfg['platform_probe'].strip():
+            raise ConfigError("'payload.platform_probe' doit être une commande non vide.")
+        
+        # Vérification de l'intervalle entre deux vérifications de mise à jour
+        check_interval = self.config.get('update', {}).get('check_interval')
+        if isinstance(check_interval, bool) or not isinstance(check_interval, int) or check_interval < 0:
+            raise ConfigError(f"'update.check_interval' doit être un nombre de secondes positif ou nul (reçu: {check_interval!r}).")
+        
+        # Limites de temps des requêtes de mise à jour et vérification en arrière-plan
+        for key in ('connect_timeout', 'max_time'):
+            value = self.config.get('update', {}).get(key)
+            if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+                raise ConfigError(f"'update.{key}' doit être un nombre de secondes strictement positif (reçu: {value!r}).")
+        if not isinstance(self.config.get('update', {}).get('background'), bool):
+            raise ConfigError("'update.background' doit être un booléen.")
+        
+        # Miroirs : URL unique ou liste, appariées par position lorsque les deux sont des listes
+        mirror_counts = {}
+        for key in ('version_url', 'package_url'):
+            value = self.config.get('update', {}).get(key)
+            if isinstance(value, list):
+                if not value or not all(isinstance(url, str) and url.strip() for url in value):
+                    raise ConfigError(f"'update.{key}' doit être une URL ou une liste d'URLs non vides.")
+                mirror_counts[key] = len(value)
+            elif not isinstance(value, str):
+                raise ConfigError(f"'update.{key}' doit être une URL ou une liste d'URLs (reçu: {value!r}).")
+        if len(mirror_counts) == 2 and min(mirror_counts.values()) > 1 and len(set(mirror_counts.values())) > 1:
+            raise ConfigError("'update.version_url' et 'update.package_url' doivent lister le même nombre de miroirs "
+                              f"(reçu: {mirror_counts['version_url']} et {mirror_counts['package_url']}).")
+        mirror_race = self.config.get('update', {}).get('mirror_race')
+        if isinstance(mirror_race, bool) or not isinstance(mirror_race, int) or mirror_race <= 0:
+            raise ConfigError(f"'update.mirror_race' doit être un entier positif (reçu: {mirror_race!r}).")
+        
+        # Vérification des paquets différentiels (reconstruction à partir du payload intégré en clair)
+        delta_enabled = self.config.get('update', {}).get('delta')
+        if not isinstance(delta_enabled, bool):
+            raise ConfigError("'update.delta' doit être un booléen.")
+        if delta_enabled and self.config.get('compression', {}).get('encrypted'):
+            raise ConfigError("'update.delta' est incompatible avec le chiffrement (segments rechiffrés à chaque build).")
+        if delta_enabled and output_mode == 'thin':
+            raise ConfigError("'update.delta' est sans objet en mode 'thin' (segments déjà mis en cache côté cible).")
+        if delta_enabled and payload_cfg.get('segmentation') == 'none':
+            # Un seul segment : toute modification le change, aucun paquet ne serait jamais produit
+            raise ConfigError("'update.delta' nécessite 'payload.segmentation: directory' ou 'size' "
+                              "(avec un payload non segmenté, utiliser 'update.chunks').")
+
+        # Vérification du magasin de blocs (découpage du payload intégré en clair)
+        chunks_enabled = self.config.get('update', {}).get('chunks')
+        if not isinstance(chunks_enabled, bool):
+            raise ConfigError("'update.chunks' doit être un booléen.")
+        if chunks_enabled and self.config.get('compression', {}).get('encrypted'):
+            raise ConfigError("'update.chunks' est incompatible avec le chiffrement (payload entièrement modifié à chaque build).")
+        if chunks_enabled and output_mode == 'thin':
+            raise ConfigError("'update.chunks' est sans objet en mode 'thin' (segments déjà mis en cache côté cible).")
+        if chunks_enabled and comp_method not in ('gz', 'none'):
+            raise ConfigError(f"'update.chunks' nécessite la compression 'gz' ou 'none' (reçu: '{comp_method}').")
+
+        # Vérification du dépôt de publication (commun à toutes les variantes)
+        publish_cfg = self.config.get('publish')
+        if not isinstance(publish_cfg, dict):
+            raise ConfigError("Section 'publish' invalide.")
+        for key in ('enabled', 'link'):
+            if not isinstance(publish_cfg.get(key), bool):
+                raise ConfigError(f"'publish.{key}' doit être un booléen.")
+        if not isinstance(publish_cfg.get('repo_dir'), str):
+            raise ConfigError("'publish.repo_dir' doit être un chemin.")
+        if publish_cfg['enabled'] and not publish_cfg['repo_dir']:
+            raise ConfigError("'publish.repo_dir' requis lorsque 'publish.enabled' est activé.")
+        for key in ('keep', 'max_age_days'):
+            value = publish_cfg.get(key)
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ConfigError(f"'publish.{key}' doit être un entier positif ou nul (reçu: {value!r}).")
+
+        # Vérification des variantes
+        self._validate_variants()
+        
         if self.debug_mode:
             logger.debug("Validation config OK.")
 
+    def _validate_variants(self):
+        """
+        Valide la section 'variants'.
+        
+        Une variante ne peut surcharger que l'en-tête du script : l'archive (contenu,
+        exclusions, compression, segmentation) est commune à toutes les variantes.
+        Chaque configuration fusionnée est ensuite validée comme une configuration complète.
+        """
+        variants = self.config.get('variants')
+        if variants is None:
+            variants = self.config['variants'] = []
+        if not isinstance(variants, list):
+            raise ConfigError("'variants' doit être une liste.")
+        if not variants:
+            return
+        
+        names = set()
+        for variant in variants:
+            if not isinstance(variant, dict):
+                raise ConfigError("Chaque variante doit être un dictionnaire.")
+            name = variant.get('name')
+            if not isinstance(name, str) or not re.fullmatch(r'[A-Za-z0-9_.-]+', name):
+                raise ConfigError(f"Nom de variante invalide: {name!r}.")
+            if name in names:
+                raise ConfigError(f"Variante '{name}' définie plusieurs fois.")
+            names.add(name)
+            
+            for key, value in variant.items():
+                if key == 'name':
+                    continue
+                if key not in VARIANT_OVERRIDE_KEYS:
+                    raise ConfigError(f"Variante '{name}': '{key}' ne peut pas être surchargé (autorisé: {', '.join(VARIANT_OVERRIDE_KEYS)}).")
+                if key in ('update', 'output', 'compression') and not isinstance(value, dict):
+                    raise ConfigError(f"Variante '{name}': '{key}' doit être un dictionnaire.")
+            if 'artifacts' in variant.get('output', {}):
+                raise ConfigError(f"Variante '{name}': 'output.artifacts' est commun à toutes les variantes.")
+            for comp_key in variant.get('compression', {}):
+                if comp_key not in VARIANT_COMPRESSION_KEYS:
+                    raise ConfigError(f"Variante '{name}': 'compression.{comp_key}' est commun à toutes les variantes.")
+        
+        # Valider chaque configuration fusionnée et détecter les sorties en conflit
+        base_config = self.config
+        seen_outputs: Dict[Path, str] = {}
+        seen_version_files: Dict[Path, str] = {}
+        try:
+            for variant_config in self.get_variant_configs():
+                name = variant_config['_variant']
+                self.config = variant_config
+                self._validate_config()
+                
+                # Le fichier .json de métadonnées est dérivé du chemin du script
+                output_path = get_absolute_path(variant_config['output']['path'], self.base_dir)
+                output_key = output_path.with_suffix('')
+                if output_key in seen_outputs:
+                    raise ConfigError(f"Variantes '{seen_outputs[output_key]}' et '{name}': chemins de sortie en conflit ({output_path}).")
+                seen_outputs[output_key] = name
+                
+                version_file = variant_config.get('update', {}).get('version_file_path')
+                if version_file:
+                    version_path = get_absolute_path(version_file, self.base_dir)
+                    if version_path in seen_version_files:
+                        raise ConfigError(f"Variantes '{seen_version_files[version_path]}' et '{name}': même 'update.version_file_path'.")
+                    seen_version_files[version_path] = name
+        finally:
+            self.config = base_config
+
     def apply_standard_exclusions(self):
         """Applique les exclusions standard à la configuration."""
         if not self.config:
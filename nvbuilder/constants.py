@@ -18,16 +18,75 @@ PASSWORD_CHECK_TOKEN = "nvbuilder_passwd_ok_v1" # Chaîne à chiffrer/vérifier
 # Modes de mise à jour
 UPDATE_MODES = ["check-only", "download-only", "auto-replace", "auto-replace-always"]
 DEFAULT_UPDATE_MODE = "check-only"
+DEFAULT_UPDATE_CHECK_INTERVAL = 0 # Secondes sans requête après une vérification (0 : à chaque exécution)
+DEFAULT_UPDATE_CONNECT_TIMEOUT = 5 # Secondes pour établir une connexion au serveur de mise à jour
+DEFAULT_UPDATE_MAX_TIME = 30 # Durée maximale de la vérification ; délai sans données avant l'abandon d'un téléchargement
+DEFAULT_UPDATE_MIRROR_RACE = 3 # Miroirs interrogés en parallèle lors de la vérification
+MIRROR_BACKOFF_BASE = 60 # Secondes d'attente d'un miroir après un échec, doublées à chaque échec consécutif
+MIRROR_BACKOFF_MAX = 6 * 3600
+DELTA_FORMAT_VERSION = 1 # Format des paquets différentiels (ligne d'en-tête de la recette)
+DOWNLOAD_BLOCK_SIZE = 16 * 1024 * 1024 # Blocs du script vérifiés séparément lors de la reprise d'un téléchargement
+
+# Magasin de blocs pour les mises à jour (découpage du payload défini par son contenu)
+CHUNK_FORMAT_VERSION = 1 # Format des index de blocs (ligne d'en-tête)
+CHUNK_STORE_DIRNAME = "chunks" # Répertoire du magasin, publié à côté du script (blocs nommés par leur SHA256)
+CHUNK_MIN_SIZE = 16 * 1024
+CHUNK_AVG_SIZE = 64 * 1024
+CHUNK_MAX_SIZE = 256 * 1024
+RSYNCABLE_MIN_SIZE = 8 * 1024 # Découpage du flux tar non compressé (points de resynchronisation gzip)
+RSYNCABLE_AVG_SIZE = 32 * 1024
+RSYNCABLE_MAX_SIZE = 128 * 1024
+
+# Dépôt de mises à jour local (nvbuilder publish)
+PUBLISH_RELEASES_DIRNAME = "releases" # Un sous-répertoire par version de build publiée
+PUBLISH_MANIFEST_FILENAME = "release.json" # Scripts et fichiers de version d'une publication
+DEFAULT_PUBLISH_KEEP = 5 # Publications conservées (0 : toutes)
+DEFAULT_SERVE_HOST = "0.0.0.0" # nvbuilder serve : adresse d'écoute
+DEFAULT_SERVE_PORT = 8000
+DEFAULT_SERVE_METRICS_INTERVAL = 60 # Secondes entre deux affichages des compteurs du serveur (0 : jamais)
+
+# Modes de sortie : payload intégré au script ou publié à côté (téléchargé à l'exécution)
+OUTPUT_MODES = ["embedded", "thin"]
+DEFAULT_OUTPUT_MODE = "embedded"
+THIN_SEGMENT_EXTENSION = ".seg" # Fichiers publiés nommés <sha256>.seg
+
+# Cache d'extraction côté cible (désactivé par défaut)
+DEFAULT_EXTRACT_CACHE_MAX_MB = 2048 # Taille maximale du cache avant éviction des entrées les plus anciennes
+
+# Répertoire de travail côté cible : /dev/shm si le contenu extrait tient dans cette fraction de la mémoire
+DEFAULT_WORKDIR_RAM_FRACTION = 0.25 # 0 : jamais en mémoire
+
+# Segmentation du payload
+SEGMENTATION_MODES = ["none", "directory", "size"]
+DEFAULT_SEGMENTATION = "none"
+DEFAULT_SEGMENT_SIZE_MB = 256
+MAX_SEGMENT_PREFIXES = 32 # Au-delà, les préfixes sont ramenés au premier niveau
+B64_CHUNK_SIZE = 3 * 1024 * 1024 # Bloc lu pour l'encodage Base64 (multiple de 3)
+
+# Payloads multi-plateformes ('content' sous forme de dictionnaire)
+COMMON_PLATFORM_KEY = "common" # Contenu partagé par toutes les plateformes
+DEFAULT_PLATFORM_PROBE = "uname -m" # Commande exécutée par le script pour détecter la plateforme
+
+# Variantes : plusieurs scripts générés à partir d'une seule archive
+VARIANT_OVERRIDE_KEYS = ["script", "update", "output", "compression"] # Sections surchargeables (en-tête du script)
+VARIANT_COMPRESSION_KEYS = ["encrypted", "encryption_tool", "openssl_cipher", "openssl_iter", "password_id"]
+DEFAULT_PASSWORD_ID = "default" # Identifiant du mot de passe partagé par les variantes chiffrées
 
 # Clés de configuration attendues et valeurs par défaut
 DEFAULT_CONFIG = {
     'content': './content',
     'script': 'start.sh',
-    'output': {'path': 'autoextract.sh', 'need_root': False},
+    'output': {'path': 'autoextract.sh', 'need_root': False, 'mode': DEFAULT_OUTPUT_MODE, 'payload_url': '', 'payload_dir': '',
+               'extract_cache': {'enabled': False, 'max_size_mb': DEFAULT_EXTRACT_CACHE_MAX_MB},
+               'work_dir': {'ram_fraction': DEFAULT_WORKDIR_RAM_FRACTION},
+               'artifacts': {'archive': '', 'encrypted_archive': '', 'checksums': ''}},
     'compression': {'method': 'gz', 'level': 9, 'encrypted': False, 'encryption_tool': DEFAULT_ENCRYPTION_TOOL},
     'exclude': {'patterns': [], 'ignore_case': True},
-    'update': {'enabled': False, 'version_url': '', 'package_url': '', 'version_file_path': '', 'mode': DEFAULT_UPDATE_MODE},
+    'payload': {'segmentation': DEFAULT_SEGMENTATION, 'segment_size_mb': DEFAULT_SEGMENT_SIZE_MB, 'platform_probe': DEFAULT_PLATFORM_PROBE},
+    'update': {'enabled': False, 'version_url': '', 'package_url': '', 'version_file_path': '', 'mode': DEFAULT_UPDATE_MODE, 'check_interval': DEFAULT_UPDATE_CHECK_INTERVAL, 'connect_timeout': DEFAULT_UPDATE_CONNECT_TIMEOUT, 'max_time': DEFAULT_UPDATE_MAX_TIME, 'background': False, 'mirror_race': DEFAULT_UPDATE_MIRROR_RACE, 'delta': False, 'chunks': False},
+    'publish': {'enabled': False, 'repo_dir': '', 'keep': DEFAULT_PUBLISH_KEEP, 'max_age_days': 0, 'link': True},
     'hooks': {'pre_build': [], 'post_build': []},
+    'variants': [],
     'logging': {'file': DEFAULT_LOG_FILENAME, 'level': 'INFO', 'format': '%(asctime)s - %(levelname)s - %(message)s', 'max_size': 10485760, 'backup_count': 3},
     'generate_metadata_file': True
 }
\ No newline at end of file
@@ -0,0 +1,326 @@
+# nvbuilder/delta.py
+"""Paquets de mise à jour différentiels entre deux builds d'un même script."""
+
+import base64
+import gzip
+import hashlib
+import io
+import logging
+import os
+import re
+import shlex
+import tarfile
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from .constants import ARCHIVE_MARKER, B64_CHUNK_SIZE, DELTA_FORMAT_VERSION
+from .exceptions import BuildProcessError
+from .utils import calculate_checksum
+
+logger = logging.getLogger("nvbuilder")
+
+MARKER_LINE = f"\n# NVBUILDER_MARKER_LINE: {ARCHIVE_MARKER}\n".encode('utf-8')
+HEADER_READ_SIZE = 256 * 1024
+MAX_HEADER_SIZE = 16 * 1024 * 1024  # Au-delà, le fichier n'est pas un script nvBuilder
+
+
+def read_script_layout(script_path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Lit l'en-tête d'un script généré sans charger son payload.
+
+    Args:
+        script_path: Script nvBuilder existant
+
+    Returns:
+        Dict: 'build_version', 'payload_mode', 'tar_flags', 'payload_base' (octet suivant
+        la ligne marqueur), 'segments' (index) et 'manifest' (entrées du manifeste des
+        fichiers, vide s'il n'est pas intégré) ; None si le fichier n'est pas lisible
+    """
+    try:
+        with open(script_path, 'rb') as f:
+            header = b''
+            while True:
+                chunk = f.read(HEADER_READ_SIZE)
+                if not chunk or len(header) > MAX_HEADER_SIZE:
+                    return None
+                header += chunk
+                marker_pos = header.find(MARKER_LINE)
+                if marker_pos >= 0:
+                    break
+            payload_base = marker_pos + len(MARKER_LINE)
+            text = header[:payload_base].decode('utf-8', errors='replace')
+
+            def value(name: str) -> str:
+                match = re.search(rf'^{name}="?([^"\n]*)"?$', text, re.M)
+                if not match:
+                    raise ValueError(f"'{name}' absent de l'en-tête")
+                return match.group(1)
+
+            index = re.search(r'^PAYLOAD_SEGMENTS=\(\n(.*?)^\)$', text, re.M | re.S)
+            if not index:
+                raise ValueError("'PAYLOAD_SEGMENTS' absent de l'en-tête")
+            segments = []
+            for entry in shlex.split(index.group(1)):
+                seg_id, offset, b64_length, checksum, size, plat, _ = entry.split('|', 6)
+                segments.append({'id': int(seg_id), 'offset': int(offset), 'b64_length': int(b64_length),
+                                 'checksum_sha256': checksum, 'size': int(size), 'platform': plat})
+
+            manifest: List[str] = []
+            manifest_length = int(value('MANIFEST_LENGTH'))
+            if manifest_length:
+                f.seek(payload_base)
+                region = f.read(manifest_length)
+                manifest = gzip.decompress(base64.b64decode(region)).decode('utf-8').splitlines()
+
+            return {
+                'path': script_path,
+                'build_version': value('CURRENT_BUILD_VERSION'),
+                'payload_mode': value('PAYLOAD_MODE'),
+                'tar_flags': value('TAR_COMMAND_FLAGS'),
+                'payload_base': payload_base,
+                'manifest_length': manifest_length,
+                'segments': segments,
+                'manifest': manifest,
+            }
+    except (OSError, ValueError, EOFError) as e:
+        logger.debug(f"En-tête illisible '{script_path}': {e}")
+        return None
+
+
+def _manifest_by_segment(manifest: List[str]) -> Dict[int, List[str]]:
+    """Regroupe les entrées du manifeste par segment (sans le numéro de segment)."""
+    groups: Dict[int, List[str]] = {}
+    for entry in manifest:
+        seg_id, rest = entry.split('|', 1)
+        groups.setdefault(int(seg_id), []).append(rest)
+    return {seg_id: sorted(entries) for seg_id, entries in groups.items()}
+
+
+def reuse_previous_segments(segments: List[Dict[str, Any]], files_included: List[Dict[str, Any]],
+                            previous: Dict[str, Any], tar_flags: str) -> int:
+    """
+    Reprend à l'identique les segments du build précédent dont les fichiers n'ont pas changé.
+
+    Une archive recréée diffère octet pour octet même à contenu identique (dates, en-tête
+    gzip) : le segment du script précédent est donc décodé à la place du nouveau, ce qui
+    permet à un paquet différentiel de ne transporter que les segments réellement modifiés.
+    Les segments contenant des liens symboliques (cible absente du manifeste) sont toujours recréés.
+
+    Args:
+        segments: Segments produits par l'Archiver (fichier et checksum mis à jour sur place)
+        files_included: Fichiers inclus (métadonnées du build)
+        previous: Script précédent (read_script_layout)
+        tar_flags: Options tar du build courant (même compression exigée)
+
+    Returns:
+        int: Nombre de segments repris
+    """
+    if previous['payload_mode'] != 'embedded' or previous['tar_flags'] != tar_flags or not previous['manifest']:
+        return 0
+
+    previous_files = _manifest_by_segment(previous['manifest'])
+    previous_segments = {seg['id']: seg for seg in previous['segments']}
+    candidates: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+    for seg_id, entries in previous_files.items():
+        seg = previous_segments.get(seg_id)
+        if seg and not any(e.split('|')[2] == 'symlink' for e in entries):
+            candidates[(seg['platform'], tuple(entries))] = seg
+
+    current_files: Dict[int, List[str]] = {}
+    for f in files_included:
+        current_files.setdefault(f['segment'], []).append(
+            f"{f['size']}|{f['mode']:o}|{f['checksum_sha256']}|{f['path']}")
+
+    reused = 0
+    for seg in segments:
+        entries = tuple(sorted(current_files.get(seg['id'], [])))
+        source = candidates.get((seg.get('platform') or '', entries))
+        if not entries or not source:
+            continue
+        if _decode_region(previous, source, seg['path']):
+            seg['size'] = source['size']
+            seg['checksum_sha256'] = source['checksum_sha256']
+            reused += 1
+    return reused
+
+
+def _decode_region(layout: Dict[str, Any], seg: Dict[str, Any], target: Optional[Path]) -> bool:
+    """
+    Décode la région Base64 d'un segment du script vers 'target' (remplacé si le checksum correspond).
+
+    Returns:
+        bool: True si le segment a été décodé et vérifié (False sans fichier cible :
+        segment chiffré au fil de l'archivage, non écrit en clair)
+    """
+    if target is None:
+        return False
+    tmp_path = target.with_name(target.name + '.previous')
+    digest = hashlib.sha256()
+    try:
+        with open(layout['path'], 'rb') as src, open(tmp_path, 'wb') as dst:
+            src.seek(layout['payload_base'] + seg['offset'])
+            remaining = seg['b64_length']
+            while remaining:
+                # Bloc multiple de 4 : décodage Base64 indépendant par bloc
+                chunk = src.read(min(remaining, B64_CHUNK_SIZE // 3 * 4))
+                if not chunk:
+                    raise ValueError("région tronquée")
+                remaining -= len(chunk)
+                data = base64.b64decode(chunk)
+                digest.update(data)
+                dst.write(data)
+        if digest.hexdigest() != seg['checksum_sha256']:
+            raise ValueError("checksum différent de l'index")
+        os.replace(tmp_path, target)
+        return True
+    except (OSError, ValueError) as e:
+        logger.warning(f"Segment {seg['id']} du build précédent non repris: {e}")
+        tmp_path.unlink(missing_ok=True)
+        return False
+
+
+def _manifest_changes(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """
+    Compare les manifestes de deux builds.
+
+    Returns:
+        List[str]: Lignes 'A chemin' (ajouté), 'M chemin' (modifié) et 'D chemin' (supprimé)
+    """
+    def files(layout: Dict[str, Any]) -> Dict[Tuple[str, str], str]:
+        platforms = {seg['id']: seg['platform'] for seg in layout['segments']}
+        result = {}
+        for entry in layout['manifest']:
+            seg_id, size, mode, checksum, path = entry.split('|', 4)
+            result[(platforms.get(int(seg_id), ''), path)] = f"{size}|{mode}|{checksum}"
+        return result
+
+    old_files, new_files = files(previous), files(current)
+    changes = []
+    for key in sorted(set(old_files) | set(new_files), key=lambda k: (k[1], k[0])):
+        if key not in old_files:
+            changes.append(f"A {key[1]}")
+        elif key not in new_files:
+            changes.append(f"D {key[1]}")
+        elif old_files[key] != new_files[key]:
+            changes.append(f"M {key[1]}")
+    return changes
+
+
+def _delta_operations(previous: Dict[str, Any], current: Dict[str, Any]) -> List[Tuple[str, int, int]]:
+    """
+    Calcule la recette de reconstruction du nouveau script.
+
+    Returns:
+        List[Tuple]: ('new', position dans le nouveau script, longueur) pour les octets transportés
+        par le paquet, ('old', offset relatif au payload du script précédent, longueur) pour les
+        régions de segments identiques ; les opérations contiguës sont fusionnées
+    """
+    old_regions = {seg['checksum_sha256']: seg for seg in previous['segments']}
+    header_length = current['payload_base'] + (current['manifest_length'] + 1 if current['manifest_length'] else 0)
+    operations: List[Tuple[str, int, int]] = [('new', 0, header_length)]
+    for seg in current['segments']:
+        length = seg['b64_length'] + 1
+        source = old_regions.get(seg['checksum_sha256'])
+        if source:
+            op = ('old', source['offset'], length)
+        else:
+            op = ('new', current['payload_base'] + seg['offset'], length)
+        kind, start, prev_length = operations[-1]
+        if kind == op[0] and start + prev_length == op[1]:
+            operations[-1] = (kind, start, prev_length + length)
+        else:
+            operations.append(op)
+    return operations
+
+
+def delta_package_name(script_path: Path, from_version: str, to_version: str) -> str:
+    """Nom du paquet différentiel d'un script entre deux versions de build."""
+    return f"{script_path.stem}_{from_version}_{to_version}.delta"
+
+
+def write_delta_package(previous: Dict[str, Any], script_path: Path,
+                        debug_mode: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Écrit à côté du script le paquet différentiel depuis le build précédent.
+
+    Le paquet (tar gzip) contient la recette de reconstruction, les octets du nouveau script
+    absents de l'ancien (en-tête, manifeste, segments modifiés) et la liste des fichiers
+    ajoutés, modifiés et supprimés. Les paquets obsolètes du même script sont supprimés.
+
+    Args:
+        previous: Script précédent (read_script_layout, lu avant la génération)
+        script_path: Nouveau script généré
+        debug_mode: Affiche les détails du paquet
+
+    Returns:
+        Dict: 'from_build_version', 'to_build_version', 'path' (nom du fichier), 'size',
+        'checksum_sha256' et 'reused_segments' ; None si aucun segment n'est commun
+
+    Raises:
+        BuildProcessError: Si l'écriture du paquet échoue
+    """
+    current = read_script_layout(script_path)
+    if not current:
+        raise BuildProcessError(f"Script généré illisible: {script_path}")
+    if current['build_version'] == previous['build_version']:
+        return None
+
+    operations = _delta_operations(previous, current)
+    reused = sum(1 for seg in current['segments'] if seg['checksum_sha256'] in
+                 {old['checksum_sha256'] for old in previous['segments']})
+    if not reused:
+        if debug_mode:
+            logger.info("Paquet différentiel non généré : aucun segment commun avec le build précédent.")
+        return None
+
+    name = delta_package_name(script_path, previous['build_version'], current['build_version'])
+    delta_path = script_path.parent / name
+    tmp_path = delta_path.with_name(name + '.tmp')
+    recipe = [f"nvbuilder-delta {DELTA_FORMAT_VERSION} {previous['build_version']} {current['build_version']}"]
+    changes = _manifest_changes(previous, current)
+
+    def add_bytes(tar: tarfile.TarFile, member: str, data: bytes):
+        info = tarfile.TarInfo(member)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+    try:
+        with tarfile.open(tmp_path, 'w:gz', compresslevel=6) as tar, open(script_path, 'rb') as src:
+            data_count = 0
+            for kind, start, length in operations:
+                if kind == 'old':
+                    recipe.append(f"old {start} {length}")
+                    continue
+                member = f"data/{data_count:03d}"
+                data_count += 1
+                src.seek(start)
+                info = tarfile.TarInfo(member)
+                info.size = length
+                tar.addfile(info, src)
+                recipe.append(f"new {member}")
+            add_bytes(tar, 'recipe', ("\n".join(recipe) + "\n").encode('utf-8'))
+            add_bytes(tar, 'changes', "".join(f"{line}\n" for line in changes).encode('utf-8'))
+        os.replace(tmp_path, delta_path)
+    except (OSError, tarfile.TarError) as e:
+        tmp_path.unlink(missing_ok=True)
+        raise BuildProcessError(f"Écriture du paquet différentiel '{delta_path}' échouée: {e}") from e
+
+    # Les paquets vers une version précédente ne servent plus
+    stale = re.compile(rf"{re.escape(script_path.stem)}_\d+_\d+\.delta")
+    for old_delta in script_path.parent.glob(f"{script_path.stem}_*.delta"):
+        if old_delta != delta_path and stale.fullmatch(old_delta.name):
+            old_delta.unlink(missing_ok=True)
+
+    delta_size = delta_path.stat().st_size
+    if debug_mode:
+        logger.info(f"Paquet différentiel: {name} ({delta_size / (1024*1024):.2f} Mo, "
+                    f"{reused}/{len(current['segments'])} segments repris, {len(changes)} fichier(s) modifié(s))")
+
+    return {
+        'from_build_version': previous['build_version'],
+        'to_build_version': current['build_version'],
+        'path': name,
+        'size': delta_size,
+        'checksum_sha256': calculate_checksum(delta_path),
+        'reused_segments': reused,
+    }
@@ -3,11 +3,13 @@
 
 import subprocess
 import os
+import tempfile
 import logging
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 
-from .utils import check_tool_availability, calculate_checksum
+from .cipher import OpensslEncryptWriter, in_process_supported
+from .utils import check_tool_availability, calculate_checksum, HashingFile, TeeWriter
 from .exceptions import EncryptionError, ToolNotFoundError
 from .constants import DEFAULT_ENCRYPTION_TOOL, DEFAULT_OPENSSL_CIPHER, DEFAULT_OPENSSL_ITER, DEFAULT_GPG_CIPHER_ALGO, DEFAULT_GPG_S2K_OPTIONS
 
@@ -21,6 +23,8 @@ from .colors import (
 
 logger = logging.getLogger("nvbuilder")
 
+ENCRYPT_BLOCK_SIZE = 1024 * 1024 # Bloc lu pour le chiffrement interne
+
 class Encryptor:
     """Classe responsable du chiffrement de l'archive."""
 
@@ -50,14 +54,21 @@ class Encryptor:
             self.iterations = None  # Non utilisé pour GPG
         else:
             raise EncryptionError(f"Outil de chiffrement non supporté : {self.tool}")
+        
+        # Chiffrement interne (paquet 'cryptography') : même format que 'openssl enc', sans processus
+        self.in_process = self.tool == "openssl" and in_process_supported(self.cipher)
 
-    def encrypt(self, archive_path: Path, password: str) -> Path:
+    def encrypt(self, archive_path: Path, password: str, show_progress: bool = True,
+                tee: Optional[HashingFile] = None, encrypted_path: Optional[Path] = None) -> Path:
         """
         Chiffre le fichier d'archive spécifié.
         
         Args:
             archive_path: Chemin du fichier à chiffrer
             password: Mot de passe de chiffrement
+            show_progress: Affiche la progression (désactivé pour les segments chiffrés en parallèle)
+            tee: Artefact recevant une copie du flux chiffré (archive chiffrée détachée)
+            encrypted_path: Fichier de sortie (défaut: archive suivie de '.enc' ou '.gpg')
         
         Returns:
             Path: Chemin du fichier chiffré
@@ -68,20 +79,80 @@ class Encryptor:
         """
         # Définir l'extension de chiffrement
         enc_ext = ".enc" if self.tool == "openssl" else ".gpg"
-        encrypted_path = archive_path.with_suffix(archive_path.suffix + enc_ext)
+        if encrypted_path is None:
+            encrypted_path = archive_path.with_suffix(archive_path.suffix + enc_ext)
 
         # Message de début de chiffrement
+        backend = "cryptography" if self.in_process else self.tool
         if self.debug_mode:
-            logger.info(f"Chiffrement ({self.tool}) vers {encrypted_path.name}...")
-        else:
+            logger.info(f"Chiffrement ({backend}) vers {encrypted_path.name}...")
+        elif show_progress:
             print(f"{INFO_COLOR}{HIGHLIGHT_STYLE}Chiffrement en cours...      ", end=" ", flush=True)
 
+        if not self.in_process:
+            try:
+                # Vérifier la disponibilité de l'outil
+                check_tool_availability(self.tool)
+            except ToolNotFoundError as e:
+                raise EncryptionError(f"Chiffrement impossible: {e}") from e
+
         try:
-            # Vérifier la disponibilité de l'outil
-            check_tool_availability(self.tool)
-        except ToolNotFoundError as e:
-            raise EncryptionError(f"Chiffrement impossible: {e}") from e
+            if self.in_process:
+                self._encrypt_in_process(archive_path, password, encrypted_path, tee)
+            else:
+                self._encrypt_with_tool(archive_path, password, encrypted_path, tee)
+
+            # Calcul du checksum
+            checksum = calculate_checksum(encrypted_path)
+            
+            # Messages de confirmation
+            if self.debug_mode:
+                logger.info(f"•  Chiffrement {SUCCESS_COLOR}OK{RESET_STYLE}. Checksum: {checksum[:12]}...")
+            elif show_progress:
+                print(f"{SUCCESS_COLOR}OK{RESET_STYLE}")
+            
+            return encrypted_path
+
+        except Exception as e:
+            # Nettoyage en cas d'erreur
+            if encrypted_path.exists():
+                encrypted_path.unlink(missing_ok=True)
+            
+            # Relancer comme erreur de chiffrement si ce n'est pas déjà le cas
+            if isinstance(e, EncryptionError):
+                raise
+            raise EncryptionError(f"Erreur inattendue chiffrement: {e}") from e
 
+    def open_stream(self, output: Any, password: str) -> OpensslEncryptWriter:
+        """
+        Ouvre un flux de chiffrement interne écrivant dans 'output' (objet disposant de write(bytes)).
+        
+        Le flux se termine par finish() (ou à la sortie d'un bloc 'with') ; la sortie n'est pas fermée.
+        
+        Raises:
+            EncryptionError: Si le chiffrement interne n'est pas disponible (voir in_process)
+        """
+        if not self.in_process:
+            raise EncryptionError(f"Chiffrement en flux indisponible ({self.tool}"
+                                  f"{', ' + self.cipher if self.cipher else ''}) : 'cryptography' requis.")
+        return OpensslEncryptWriter(output, password, self.cipher, self.iterations)
+
+    def _encrypt_in_process(self, archive_path: Path, password: str, encrypted_path: Path,
+                            tee: Optional[HashingFile]):
+        """Chiffre l'archive sans processus externe, en une lecture, vers le fichier et l'artefact."""
+        with open(archive_path, 'rb') as src, open(encrypted_path, 'wb') as out_file:
+            with self.open_stream(TeeWriter([out_file, tee]), password) as writer:
+                for chunk in iter(lambda: src.read(ENCRYPT_BLOCK_SIZE), b''):
+                    writer.write(chunk)
+
+    def _encrypt_with_tool(self, archive_path: Path, password: str, encrypted_path: Path,
+                           tee: Optional[HashingFile]):
+        """
+        Chiffre l'archive avec la commande openssl ou gpg.
+        
+        Raises:
+            EncryptionError: Si l'outil retourne une erreur
+        """
         cmd = []
         env = os.environ.copy()
         archive_path_str, encrypted_path_str = str(archive_path), str(encrypted_path)
@@ -94,9 +165,10 @@ class Encryptor:
                     "openssl", "enc", f"-{self.cipher}", "-salt", "-pbkdf2", 
                     "-iter", str(self.iterations), 
                     "-in", archive_path_str, 
-                    "-out", encrypted_path_str, 
                     "-pass", "env:NVBUILDER_ENC_PASS"
                 ]
+                if tee is None:
+                    cmd += ["-out", encrypted_path_str]
             elif self.tool == "gpg":
                 s2k_opts = self.gpg_s2k.split()
                 cmd = [
@@ -106,7 +178,7 @@ class Encryptor:
                     "--cipher-algo", self.gpg_cipher
                 ] + s2k_opts + [
                     "--passphrase", password, 
-                    "-o", encrypted_path_str, 
+                    "-o", encrypted_path_str if tee is None else "-", 
                     archive_path_str
                 ]
 
@@ -114,14 +186,17 @@ class Encryptor:
             if self.debug_mode:
                 logger.debug(f"Exécution {self.tool} pour chiffrement...")
             
-            result = subprocess.run(
-                cmd, 
-                capture_output=True, 
-                text=True, 
-                encoding='utf-8', 
-                env=env, 
-                check=False
-            )
+            if tee is None:
+                result = subprocess.run(
+                    cmd, 
+                    capture_output=True, 
+                    text=True, 
+                    encoding='utf-8', 
+                    env=env, 
+                    check=False
+                )
+            else:
+                result = self._run_teed(cmd, env, encrypted_path, tee)
 
             # Vérification du résultat
             if result.returncode != 0:
@@ -130,34 +205,28 @@ class Encryptor:
                     err_msg += f"\nStderr: {result.stderr.strip()}"
                 if result.stdout:
                     err_msg += f"\nStdout: {result.stdout.strip()}"
-                
-                # Supprimer le fichier incomplet
-                if encrypted_path.exists():
-                    encrypted_path.unlink(missing_ok=True)
-                
                 raise EncryptionError(err_msg)
-            else:
-                # Calcul du checksum
-                checksum = calculate_checksum(encrypted_path)
-                
-                # Messages de confirmation
-                if self.debug_mode:
-                    logger.info(f"•  Chiffrement {SUCCESS_COLOR}OK{RESET_STYLE}. Checksum: {checksum[:12]}...")
-                else:
-                    print(f"{SUCCESS_COLOR}OK{RESET_STYLE}")
-                
-                return encrypted_path
-
-        except Exception as e:
-            # Nettoyage en cas d'erreur
-            if encrypted_path.exists():
-                encrypted_path.unlink(missing_ok=True)
-            
-            # Relancer comme erreur de chiffrement si ce n'est pas déjà le cas
-            if isinstance(e, EncryptionError):
-                raise
-            raise EncryptionError(f"Erreur inattendue chiffrement: {e}") from e
         finally:
             # Toujours nettoyer le mot de passe de l'environnement
             if 'NVBUILDER_ENC_PASS' in env:
-                del env['NVBUILDER_ENC_PASS']
\ No newline at end of file
+                del env['NVBUILDER_ENC_PASS']
+
+    def _run_teed(self, cmd: List[str], env: Dict[str, str], encrypted_path: Path,
+                  tee: HashingFile) -> subprocess.CompletedProcess:
+        """
+        Exécute l'outil de chiffrement en lisant sa sortie standard, recopiée
+        à la fois dans le fichier chiffré et dans l'artefact.
+        
+        Returns:
+            subprocess.CompletedProcess: Code retour et stderr de l'outil
+        """
+        with tempfile.TemporaryFile() as err_file, open(encrypted_path, 'wb') as out_file:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err_file, env=env)
+            writer = TeeWriter([out_file, tee])
+            for chunk in iter(lambda: proc.stdout.read(1024 * 1024), b''):
+                writer.write(chunk)
+            proc.stdout.close()
+            returncode = proc.wait()
+            err_file.seek(0)
+            stderr = err_file.read().decode('utf-8', errors='replace')
+        return subprocess.CompletedProcess(cmd, returncode, stdout='', stderr=stderr)
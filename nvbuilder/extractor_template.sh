@@ -88,25 +88,66 @@ NVBUILDER_VERSION="%%NVBUILDER_VERSION%%"
 BUILD_VERSION="%%BUILD_VERSION%%"
 SCRIPT_MARKER_VALUE="%%ARCHIVE_MARKER%%"
 TAR_COMMAND_FLAGS="%%TAR_COMMAND_FLAGS%%"
+COMPRESSION_METHOD="%%COMPRESSION_METHOD%%"  # gz, bz2, xz ou none
 POST_EXTRACTION_SCRIPT="%%POST_EXTRACTION_SCRIPT%%"
 CONTENT_SOURCE_DIR="%%CONTENT_SOURCE_DIR%%"
 ARCHIVE_CHECKSUM="%%ARCHIVE_CHECKSUM%%"
 ENCRYPTED_CHECKSUM="%%ENCRYPTED_CHECKSUM%%"
 PASSWORD_CHECK_TOKEN="nvbuilder_passwd_ok_v1"
 NEED_ROOT="%%NEED_ROOT_BOOL%%"
+ARCHIVE_EXTENSION="%%ARCHIVE_EXTENSION%%"
+# Mode du payload : 'embedded' (régions Base64 après le marqueur) ou 'thin' (segments téléchargés)
+PAYLOAD_MODE="%%PAYLOAD_MODE%%"
+PAYLOAD_URL="%%PAYLOAD_URL%%"
+SEGMENT_COUNT=%%SEGMENT_COUNT%%
+# Plateformes disposant de segments dédiés (vide : payload unique) et commande de détection
+PAYLOAD_PLATFORMS=%%PAYLOAD_PLATFORMS%%
+PLATFORM_PROBE=%%PLATFORM_PROBE%%
+# Cache d'extraction côté cible (contenu extrait réutilisé d'une exécution à l'autre)
+EXTRACT_CACHE_ENABLED="%%EXTRACT_CACHE_BOOL%%"
+EXTRACT_CACHE_MAX_MB=%%EXTRACT_CACHE_MAX_MB%%
+# Contrôle d'espace libre : taille du payload décodé (octets), contenu extrait par plateforme
+# ('plateforme:octets:fichiers', '-' pour le contenu commun) et part de la mémoire utilisable dans /dev/shm
+PAYLOAD_BYTES=%%PAYLOAD_BYTES%%
+CONTENT_SIZES=%%CONTENT_SIZES%%
+WORKDIR_RAM_PERCENT=%%WORKDIR_RAM_PERCENT%%
+# Index du payload : 'id|offset|longueur_b64|sha256|taille|plateforme|préfixes'
+# (offset relatif à la première ligne suivant le marqueur, plateforme vide = contenu commun)
+PAYLOAD_SEGMENTS=(
+%%PAYLOAD_INDEX%%
+)
+# Manifeste des fichiers (extraction incrémentale, --list) : région Base64 (gzip) de MANIFEST_LENGTH
+# octets placée en tête du payload, avant les segments (0 pour un payload chiffré)
+MANIFEST_LENGTH=%%MANIFEST_LENGTH%%
+MANIFEST_FILES=%%MANIFEST_FILES%%
 # --- Fin Configuration Interne ---
 
 # --- Variables de mise à jour (seront remplacées par les valeurs réelles) ---
 CURRENT_BUILD_VERSION="%%BUILD_VERSION%%"
 VERSION_URL="%%UPDATE_VERSION_URL%%"
 PACKAGE_URL="%%UPDATE_PACKAGE_URL%%"
+VERSION_URLS=(%%UPDATE_VERSION_URLS%%)  # Miroirs, dans l'ordre de préférence (VERSION_URL : le premier)
+PACKAGE_URLS=(%%UPDATE_PACKAGE_URLS%%)  # Appariés par position avec VERSION_URLS s'ils sont aussi nombreux
+UPDATE_MIRROR_RACE=%%UPDATE_MIRROR_RACE%%  # Miroirs interrogés en parallèle
+MIRROR_BACKOFF_BASE=%%MIRROR_BACKOFF_BASE%%; MIRROR_BACKOFF_MAX=%%MIRROR_BACKOFF_MAX%%  # Attente (s) d'un miroir après des échecs
 UPDATE_MODE="%%UPDATE_MODE%%"
+UPDATE_CHECK_INTERVAL=%%UPDATE_CHECK_INTERVAL%%  # Secondes sans requête après une vérification (0 : à chaque exécution)
+DOWNLOAD_ATTEMPTS=${NVBUILDER_DOWNLOAD_ATTEMPTS:-5}  # Tentatives d'un téléchargement complet (reprises après coupure)
+UPDATE_CONNECT_TIMEOUT=%%UPDATE_CONNECT_TIMEOUT%%  # Secondes pour établir une connexion
+UPDATE_MAX_TIME=%%UPDATE_MAX_TIME%%  # Durée maximale de la vérification ; délai sans données reçues avant l'abandon d'un téléchargement
+UPDATE_BACKGROUND="%%UPDATE_BACKGROUND_BOOL%%"  # Vérification en parallèle de l'extraction, résultat traité à la fin
+# Limites appliquées à chaque transfert : connexion, puis transfert bloqué (aucune donnée pendant UPDATE_MAX_TIME)
+CURL_LIMITS=(--connect-timeout "$UPDATE_CONNECT_TIMEOUT" --speed-limit 1 --speed-time "$UPDATE_MAX_TIME")
+WGET_LIMITS=(--connect-timeout="$UPDATE_CONNECT_TIMEOUT" --read-timeout="$UPDATE_MAX_TIME")
 # --- Fin variables de mise à jour ---
 
 # --- Variables globales d'initialisation ---
 NO_UPDATE_CHECK=0
 FORCE_DOWNLOAD=0
 NO_AUTO_UPDATE=0
+UPDATE_IN_BACKGROUND=0  # 1 dans la tâche de vérification en arrière-plan (aucune interaction, pas de relance)
+UPDATE_JOB_PID=""; UPDATE_JOB_LOG=""  # Tâche de vérification en arrière-plan et son journal
+MIRROR_STATE=""  # Fichier des échecs par miroir ('url échecs prochain_essai'), défini par la vérification
 # --- Fin Variables globales d'initialisation ---
 
 # --- Début Variables et Blocs Conditionnels ---
@@ -119,7 +160,29 @@ NO_AUTO_UPDATE=0
 SCRIPT_NAME=$(basename "$0")
 SCRIPT_PATH="" # Défini par get_script_path
 SCRIPT_DIR=""  # Défini par get_script_path
-EXTRACT_ONLY=0; SHOW_INFO=0; TARGET_DIR=""; DEBUG_MODE=0
+EXTRACT_ONLY=0; SHOW_INFO=0; TARGET_DIR=""; DEBUG_MODE=0; ONLY_PATTERN=""; TARGET_PLATFORM=""
+SELFTEST=0  # 1 avec --selftest : vérification complète du payload sans extraction
+LIST_CONTENTS=0; LIST_PATTERN=""  # --list [MOTIF]
+# Mesure des phases (--timings[=FICHIER.json] ou NVBUILDER_TIMINGS=1|FICHIER.json)
+TIMINGS=0; TIMINGS_JSON=""
+case "${NVBUILDER_TIMINGS:-}" in
+    ""|0) ;;
+    1) TIMINGS=1 ;;
+    *) TIMINGS=1; TIMINGS_JSON="$NVBUILDER_TIMINGS" ;;
+esac
+TIMING_T0=0; TIMING_START=0; TIMING_REPORTED=0
+TIMING_NAMES=(); TIMING_MS=(); TIMING_BYTES=(); TIMING_SEGMENTS=()
+VERIFY_PAYLOAD=1  # Vérification SHA256 des segments pendant l'extraction (--no-verify pour la désactiver)
+EXTRACT_DEST_CREATED=0  # 1 si le dossier --extract-only a été créé par ce script (supprimé en cas d'échec)
+WORK_DIR_IS_TEMP=0  # 1 si WORK_DIR est un répertoire temporaire créé par create_work_dir (supprimé à la sortie)
+USE_EXTRACT_CACHE=1  # 0 avec --no-cache
+INCREMENTAL=1; DELETE_REMOVED=0  # Avec --target-dir : --full réécrit tout, --delete-removed supprime les fichiers obsolètes
+INCR_KEEP=""; INCR_WRITTEN=0; INCR_SKIPPED=0; INCR_REMOVED=0; INCR_BYTES=0  # Résultat de plan_incremental / delete_removed_files
+EXTRACT_CACHE_ROOT=""; EXTRACT_CACHE_TMP=""  # Racine du cache et entrée en cours de création
+PAYLOAD_BASE=""  # Position (octets) du début du payload, définie par locate_payload
+SEGMENTS_DIR=""  # Répertoire de travail des extractions de segments (messages d'erreur)
+DECOMPRESSOR=()  # Décompresseur parallèle retenu par select_decompressor (vide : tar décompresse)
+DECOMPRESSOR_LABEL=""; TAR_EXTRACT_FLAGS="$TAR_COMMAND_FLAGS"
 # Variables pré-initialisées pour éviter les erreurs
 WORK_DIR="/tmp/nvb_temp_$$"  # Sera écrasé mais pré-initialisé pour sécurité
 EXTRACT_DEST="$WORK_DIR"     # Idem
@@ -156,7 +219,7 @@ display_banner() {
     
     # Sinon, en mode debug ou info, afficher la bannière complète
     echo -e "${BANNER_COLOR}${HIGHLIGHT_STYLE}╔══════════════════════════════════════════════════════════╗${RESET_STYLE}"
-    echo -e "${BANNER_COLOR}${HIGHLIGHT_STYLE}║                      ${INFO_COLOR}NV$BUILDER${BANNER_COLOR}                         ║${RESET_STYLE}"
+    echo -e "${BANNER_COLOR}${HIGHLIGHT_STYLE}║                      ${SUCCESS_COLOR}NV${INFO_COLOR}BUILDER${BANNER_COLOR}                         ║${RESET_STYLE}"
     echo -e "${BANNER_COLOR}${HIGHLIGHT_STYLE}╚══════════════════════════════════════════════════════════╝${RESET_STYLE}"
     
     if [ "$simple_mode" -eq 1 ]; then
@@ -241,7 +304,16 @@ Ce script extrait une archive intégrée et exécute un script post-extraction.
 $(header "Options principales :")
   --extract-only      Extrait seulement le contenu, sans exécuter '$POST_EXTRACTION_SCRIPT'.
   --target-dir DIR    Extrait le contenu dans le répertoire DIR spécifié. Par défaut, un répertoire temporaire est créé et nettoyé ensuite, sauf si --extract-only est aussi utilisé (auquel cas un dossier ./<nom_script>_ext_<timestamp> est créé).
+  --only PATTERN      N'extrait que les fichiers correspondant à PATTERN (ex: 'docs/*'). Seuls les segments concernés sont décodés.
+  --platform NAME     Force la plateforme du contenu à extraire (sinon NVBUILDER_PLATFORM ou détection automatique).
+  --no-verify         Ne vérifie pas le SHA256 des segments pendant l'extraction (exécutions locales de confiance).
+  --no-cache          N'utilise pas le cache d'extraction (si activé à la construction).
+  --full              Avec --target-dir, réécrit tous les fichiers (par défaut, seuls les fichiers modifiés le sont).
+  --delete-removed    Avec --target-dir, supprime les fichiers absents de cette version.
   --info              Affiche les informations détaillées sur cette archive et quitte.
+  --timings[=FILE]    Mesure la durée de chaque phase (mise à jour, localisation, extraction par segment, script) et l'affiche en fin d'exécution (horloge monotone /proc/uptime, au centième de seconde) ; FILE reçoit les mesures au format JSON (équivalent : NVBUILDER_TIMINGS=1 ou NVBUILDER_TIMINGS=FILE).
+  --list [PATTERN]    Affiche les fichiers contenus (taille, SHA256, chemin), éventuellement filtrés par PATTERN, sans décoder le payload.
+  --selftest          Vérifie le payload de bout en bout (décodage, SHA256, déchiffrement, liste tar) sans rien écrire sur disque, affiche le débit et quitte.
   --debug             Active le mode debug (plus de messages, ne supprime pas le dossier temporaire).
   --help, -h          Affiche cette aide et quitte.
 EOF
@@ -290,6 +362,28 @@ display_info() {
         echo -e "${DETAIL_COLOR} Checksum (chiffré): ${RESET_STYLE}%%ENCRYPTED_CHECKSUM%%"
     fi
     echo -e "${DETAIL_COLOR} Checksum (original): ${RESET_STYLE}%%ARCHIVE_CHECKSUM%%"
+    echo -e "${DETAIL_COLOR} Segments           : ${RESET_STYLE}${SEGMENT_COUNT}"
+    echo -e "${DETAIL_COLOR} Taille payload     : ${RESET_STYLE}$((PAYLOAD_BYTES / 1024)) Ko (contenu : $(($(content_size | cut -d' ' -f1) / 1024)) Ko)"
+    if [ "$MANIFEST_FILES" -gt 0 ]; then
+        echo -e "${DETAIL_COLOR} Manifeste          : ${RESET_STYLE}${MANIFEST_FILES} fichier(s) (--list, extraction incrémentale)"
+    fi
+    select_decompressor
+    echo -e "${DETAIL_COLOR} Décompression      : ${RESET_STYLE}${DECOMPRESSOR_LABEL}"
+    if [ "$EXTRACT_CACHE_ENABLED" = "true" ]; then
+        echo -e "${DETAIL_COLOR} Cache extraction   : ${RESET_STYLE}activé (max ${EXTRACT_CACHE_MAX_MB} Mo)"
+    fi
+    if [ "$PAYLOAD_MODE" = "thin" ]; then
+        echo -e "${DETAIL_COLOR} Payload (thin)     : ${RESET_STYLE}${PAYLOAD_URL}"
+    fi
+    if [ -n "$PAYLOAD_PLATFORMS" ]; then
+        echo -e "${DETAIL_COLOR} Plateformes        : ${RESET_STYLE}${PAYLOAD_PLATFORMS} (détection: ${PLATFORM_PROBE})"
+    fi
+    if [ "$DEBUG_MODE" -eq 1 ]; then
+        local entry
+        for entry in "${PAYLOAD_SEGMENTS[@]}"; do
+            echo -e "${SUBTLE_STYLE}   - ${entry}${RESET_STYLE}"
+        done
+    fi
     
     if %%BASH_UPDATE_ENABLED_BOOL%%; then 
         echo -e "${DETAIL_COLOR} URL Version        : ${RESET_STYLE}%%UPDATE_VERSION_URL%%"
@@ -304,6 +398,7 @@ cleanup() {
     local exit_code=$?
     local is_temp_dir=0
     trap - EXIT TERM INT
+    timing_report || true
     debug_log "Cleanup: Démarrage avec code $exit_code"
     
     # Protection contre variables non définies
@@ -312,15 +407,30 @@ cleanup() {
         exit $exit_code
     fi
     
-    if [ -f "${WORK_DIR:-}/awk_output.tmp" ]; then 
-        debug_log "Cleanup: Suppression awk_output.tmp"
-        rm -f "${WORK_DIR}/awk_output.tmp"
+    # Arrêter les extractions de segments encore en cours
+    local running_jobs
+    running_jobs=$(jobs -p 2>/dev/null || true)
+    if [ -n "$running_jobs" ]; then
+        debug_log "Cleanup: Arrêt des tâches en cours ($running_jobs)"
+        kill $running_jobs 2>/dev/null || true
+        wait 2>/dev/null || true
+    fi
+    
+    # Entrée du cache d'extraction inachevée
+    if [ -n "${EXTRACT_CACHE_TMP:-}" ] && [ -d "${EXTRACT_CACHE_TMP:-}" ]; then
+        debug_log "Cleanup: Suppression $EXTRACT_CACHE_TMP"
+        rm -rf "${EXTRACT_CACHE_TMP}"
+    fi
+    
+    if [ "${DEBUG_MODE:-0}" -eq 0 ] && [ -n "${SEGMENTS_DIR:-}" ] && [ -d "${SEGMENTS_DIR:-}" ]; then
+        debug_log "Cleanup: Suppression $SEGMENTS_DIR"
+        rm -rf "${SEGMENTS_DIR}"
     fi
     
     if [ "${DEBUG_MODE:-0}" -eq 0 ]; then 
         debug_log "Cleanup: Mode non-debug activé."
         if [ -n "${WORK_DIR:-}" ]; then 
-            if [[ "${WORK_DIR:-}" == /tmp/nvb_* ]] || ([ -n "${EXTRACT_DEST:-}" ] && [[ "${WORK_DIR:-}" == "${EXTRACT_DEST:-}"/.nvb_temp_* ]]); then 
+            if [ "${WORK_DIR_IS_TEMP:-0}" -eq 1 ] || [[ "${WORK_DIR:-}" == /tmp/nvb_* ]] || ([ -n "${EXTRACT_DEST:-}" ] && [[ "${WORK_DIR:-}" == "${EXTRACT_DEST:-}"/.nvb_temp_* ]]); then 
                 is_temp_dir=1
             fi
         fi
@@ -330,6 +440,12 @@ cleanup() {
             rm -rf "${WORK_DIR}"
         fi
         
+        # Extraction seule interrompue : le dossier créé par ce script ne contient qu'un résultat partiel
+        if [ $exit_code -ne 0 ] && [ "${EXTRACT_DEST_CREATED:-0}" -eq 1 ] && [ -d "${EXTRACT_DEST:-}" ]; then
+            debug_log "Cleanup: Suppression extraction partielle $EXTRACT_DEST"
+            rm -rf "${EXTRACT_DEST}"
+        fi
+        
         if %%BASH_ENCRYPTION_ENABLED_BOOL%%; then 
             local skip_cleanup=0
             if [ "${EXTRACT_ONLY:-0}" -eq 1 ] && [ -n "${EXTRACT_DEST:-}" ]; then 
@@ -349,9 +465,6 @@ cleanup() {
         fi
     elif [ -n "${WORK_DIR:-}" ] && [ -d "${WORK_DIR:-}" ]; then 
         warning "Mode Debug : ${WORK_DIR} non supprimé."
-        if %%BASH_ENCRYPTION_ENABLED_BOOL%% && [ -f "${WORK_DIR:-}/${DECRYPTED_TMP_FILENAME:-}" ]; then 
-            warning "Mode Debug : Fichier déchiffré conservé"
-        fi
     fi
     
     if [ "${DEBUG_MODE:-0}" -eq 1 ] && [[ $- == *x* ]]; then 
@@ -373,9 +486,846 @@ find_archive_marker_line() {
 }
 debug_log "Définition find_archive_marker_line OK."
 
+# Calcule PAYLOAD_BASE : nombre d'octets jusqu'à la fin de la ligne marqueur
+locate_payload() {
+    local marker_line
+    marker_line=$(find_archive_marker_line)
+    if [ -z "$marker_line" ]; then 
+        error "Erreur: Marqueur unique non trouvé ('# NVBUILDER_MARKER_LINE: $SCRIPT_MARKER_VALUE')."
+        return 1
+    fi
+    PAYLOAD_BASE=$(head -n "$marker_line" "$SCRIPT_PATH" | wc -c | tr -d ' ')
+    debug_log "Marqueur trouvé: L$marker_line. Payload à l'octet $PAYLOAD_BASE."
+}
+
+# Écrit sur stdout la région Base64 ($1 = offset, $2 = longueur) sans lire le reste du script
+read_payload_region() {
+    local offset="$1" length="$2"
+    # tail est interrompu (SIGPIPE/EPIPE) dès que head a lu la région : ce n'est pas une erreur,
+    # une région tronquée est de toute façon détectée au décodage
+    { tail -c +"$((PAYLOAD_BASE + offset + 1))" "$SCRIPT_PATH" 2>/dev/null || true; } | head -c "$length"
+}
+
+# Affiche la taille d'un fichier en octets
+file_size() {
+    stat -c%s "$1" 2>/dev/null || stat -f%z "$1" 2>/dev/null || wc -c < "$1"
+}
+
+# Affiche l'espace libre (Ko) du système de fichiers contenant $1 (vide si df échoue)
+free_space_kb() {
+    { df -Pk "$1" 2>/dev/null || true; } | awk 'NR == 2 { print $4 }'
+}
+
+# Affiche l'espace (Ko) nécessaire pour $1 octets répartis en $2 fichiers
+# (blocs partiellement occupés et marge de 1 Mo compris)
+space_needed_kb() {
+    echo $(( $1 / 1024 + $2 * 4 + 1024 ))
+}
+
+# Affiche 'octets fichiers' du contenu extrait pour TARGET_PLATFORM (contenu commun compris)
+content_size() {
+    local item plat bytes files total_bytes=0 total_files=0
+    for item in $CONTENT_SIZES; do
+        IFS=':' read -r plat bytes files <<< "$item"
+        if [ "$plat" = "-" ] || [ "$plat" = "$TARGET_PLATFORM" ]; then
+            total_bytes=$((total_bytes + bytes)); total_files=$((total_files + files))
+        fi
+    done
+    echo "$total_bytes $total_files"
+}
+
+# Indique si le système de fichiers de $1 dispose de $2 Ko (vrai si df n'est pas disponible)
+has_free_space() {
+    local free
+    free=$(free_space_kb "$1")
+    [ -z "$free" ] || [ "$free" -ge "$2" ]
+}
+
+# Échoue immédiatement si $1 ne dispose pas de $2 Ko ($3 : description de l'opération)
+require_free_space() {
+    local dir="$1" need_kb="$2" what="$3" free
+    free=$(free_space_kb "$dir")
+    if [ -n "$free" ] && [ "$free" -lt "$need_kb" ]; then
+        error "Erreur: Espace disque insuffisant pour $what dans '$dir' : $((need_kb / 1024)) Mo nécessaires, $((free / 1024)) Mo disponibles."
+        exit 1
+    fi
+    debug_log "Espace libre dans '$dir' : ${free:-?} Ko (nécessaire : $need_kb Ko)"
+}
+
+# Indique si $1 Ko tiennent dans WORKDIR_RAM_PERCENT % de la mémoire totale et dans la mémoire disponible
+fits_in_ram() {
+    local need_kb="$1" total_kb available_kb
+    [ "$WORKDIR_RAM_PERCENT" -gt 0 ] && [ -r /proc/meminfo ] || return 1
+    total_kb=$(awk '/^MemTotal:/ { print $2 }' /proc/meminfo)
+    available_kb=$(awk '/^MemAvailable:/ { print $2 }' /proc/meminfo)
+    [ -n "$total_kb" ] && [ "$need_kb" -le $((total_kb * WORKDIR_RAM_PERCENT / 100)) ] || return 1
+    [ -z "$available_kb" ] || [ "$need_kb" -le "$available_kb" ]
+}
+
+# Indique si un fichier du répertoire $1 peut être exécuté (système de fichiers sans noexec)
+dir_allows_exec() {
+    local probe="$1/.nvb_exec_probe" rc=1
+    if printf '#!/bin/sh\nexit 0\n' > "$probe" 2>/dev/null && chmod +x "$probe" 2>/dev/null && "$probe" 2>/dev/null; then
+        rc=0
+    fi
+    rm -f "$probe"
+    return $rc
+}
+
+# Crée WORK_DIR (exécution sans --target-dir ni --extract-only) dans le premier emplacement disposant
+# de $1 Ko : /dev/shm si le contenu tient dans la part de mémoire configurée, puis $TMPDIR (ou /tmp),
+# puis le répertoire courant. L'emplacement doit permettre d'exécuter le script post-extraction.
+create_work_dir() {
+    local need_kb="$1" base
+    local -a candidates=()
+    if [ -d /dev/shm ] && fits_in_ram "$need_kb"; then
+        candidates+=(/dev/shm)
+    fi
+    candidates+=("${TMPDIR:-/tmp}" "$PWD")
+    for base in "${candidates[@]}"; do
+        [ -d "$base" ] && [ -w "$base" ] || continue
+        if ! has_free_space "$base" "$need_kb"; then
+            debug_log "Répertoire de travail: '$base' ignoré (espace insuffisant)."
+            continue
+        fi
+        WORK_DIR=$(mktemp -d "$base/nvb_${SCRIPT_NAME}_$$.XXXXXX" 2>/dev/null) || continue
+        WORK_DIR_IS_TEMP=1
+        if [ -n "$POST_EXTRACTION_SCRIPT" ] && ! dir_allows_exec "$WORK_DIR"; then
+            debug_log "Répertoire de travail: '$base' ignoré (noexec)."
+            rm -rf "$WORK_DIR"; WORK_DIR=""; WORK_DIR_IS_TEMP=0
+            continue
+        fi
+        debug_log "Répertoire de travail: $WORK_DIR"
+        return 0
+    done
+    error "Erreur: Aucun emplacement pour le répertoire de travail ($((need_kb / 1024)) Mo nécessaires ; essayés : ${candidates[*]})."
+    return 1
+}
+
+# Affiche le SHA256 de l'entrée standard (sha256sum, shasum ou openssl)
+sha256_stream() {
+    if command -v sha256sum &>/dev/null; then
+        sha256sum | cut -d' ' -f1
+    elif command -v shasum &>/dev/null; then
+        shasum -a 256 | cut -d' ' -f1
+    else
+        openssl dgst -sha256 | sed 's/^.*= //'
+    fi
+}
+
+# Affiche le SHA256 d'un fichier
+sha256_file() {
+    sha256_stream < "$1"
+}
+
+# Recopie l'entrée standard sur la sortie standard et écrit son SHA256 dans le fichier $1.
+# Le hash est calculé par une substitution de processus, en parallèle du reste du pipeline.
+hash_tee() {
+    local sum_file="$1"
+    tee >(sha256_stream > "$sum_file")
+    # Attendre la fin du calcul (bash >= 4.4 ; sinon extract_segment attend le fichier)
+    wait $! 2>/dev/null || true
+}
+
+# Télécharge l'URL $1 vers le fichier $2 (curl ou wget)
+download_file() {
+    local url="$1" out_file="$2"
+    if command -v curl &>/dev/null; then
+        curl -fsSL --retry 3 "${CURL_LIMITS[@]}" -o "$out_file" "$url"
+    elif command -v wget &>/dev/null; then
+        wget --quiet --tries=3 "${WGET_LIMITS[@]}" -O "$out_file" "$url"
+    else
+        error "Erreur: curl/wget absents."
+        return 1
+    fi
+}
+
+# Comme download_file, pour un fichier facultatif (index de blocs, paquet différentiel) : son absence
+# entraîne un repli sur le script complet, le message de curl/wget est réservé au journal de débogage
+download_optional() {
+    local url="$1" out_file="$2" err rc=0
+    err=$(download_file "$url" "$out_file" 2>&1) || rc=$?
+    [ $rc -ne 0 ] || return 0
+    debug_log "Téléchargement facultatif de '$url' échoué (code $rc): $err"
+    return $rc
+}
+
+# Écrit sur stdout le contenu de l'URL $1 (curl ou wget), sans fichier intermédiaire
+download_stream() {
+    local url="$1"
+    if command -v curl &>/dev/null; then
+        curl -fsSL --retry 3 "${CURL_LIMITS[@]}" "$url"
+    elif command -v wget &>/dev/null; then
+        wget --quiet --tries=3 "${WGET_LIMITS[@]}" -O - "$url"
+    else
+        error "Erreur: curl/wget absents."
+        return 1
+    fi
+}
+
+# Écrit sur stdout le contenu de l'URL $1 à partir de l'octet $2 (requête Range), sans réessai :
+# une reprise après une coupure est gérée par download_resumable
+download_range() {
+    local url="$1" offset="$2"
+    if command -v curl &>/dev/null; then
+        curl -fsSL "${CURL_LIMITS[@]}" -C "$offset" "$url"
+    elif command -v wget &>/dev/null; then
+        wget --quiet --tries=1 "${WGET_LIMITS[@]}" --start-pos="$offset" -O - "$url"
+    else
+        error "Erreur: curl/wget absents."
+        return 1
+    fi
+}
+
+# Réduit le fichier $1 à ses $2 premiers octets
+truncate_file() {
+    local file="$1" size="$2"
+    if command -v truncate &>/dev/null; then
+        truncate -s "$size" "$file"
+    else
+        head -c "$size" "$file" > "$file.trunc" && mv -f "$file.trunc" "$file"
+    fi
+}
+
+# Affiche le nombre de blocs de $2 octets valides au début du fichier $1, d'après les
+# checksums listés dans le fichier $3 (un par ligne, dans l'ordre des blocs)
+verified_blocks() {
+    local file="$1" block_size="$2" sums_file="$3" count=0 expected size
+    size=$(file_size "$file")
+    while read -r expected; do
+        [ $(((count + 1) * block_size)) -le "$size" ] || break
+        [ "$({ tail -c +"$((count * block_size + 1))" "$file" 2>/dev/null || true; } | head -c "$block_size" | sha256_stream)" = "$expected" ] || break
+        count=$((count + 1))
+    done < "$sums_file"
+    echo "$count"
+}
+
+# Télécharge l'URL $1 vers $2 via le fichier partiel '$2.part', repris par requête Range après
+# une coupure (y compris lors d'une exécution suivante). Le SHA256 est calculé pendant le transfert,
+# le début déjà présent n'étant relu qu'une fois ; la taille ($4) et le checksum ($3) attendus sont
+# vérifiés avant le renommage atomique vers $2. Avec les checksums par bloc ($5 = taille des blocs,
+# $6 = fichier des checksums), un fichier partiel corrompu est tronqué après son dernier bloc
+# valide au lieu d'être retéléchargé entièrement.
+download_resumable() {
+    local url="$1" target="$2" expected="$3" size="$4" block_size="${5:-0}" sums_file="${6:-}"
+    local part="$2.part" attempt=0 offset status actual good
+    # Un fichier partiel n'est repris que pour le même contenu attendu
+    if [ -z "$expected" ] || [ "$(cat "$part.id" 2>/dev/null)" != "$expected" ]; then
+        rm -f "$part"
+        echo "$expected" > "$part.id" || return 1
+    fi
+    touch "$part" || return 1
+    while [ "$attempt" -lt "$DOWNLOAD_ATTEMPTS" ]; do
+        attempt=$((attempt + 1))
+        offset=$(file_size "$part")
+        if [ -n "$size" ] && [ "$offset" -gt "$size" ]; then
+            truncate_file "$part" 0
+            offset=0
+        fi
+        [ "$offset" -eq 0 ] || info "Reprise du téléchargement à l'octet $offset..."
+        rm -f "$part.status"
+        # Le début déjà présent puis la suite téléchargée (ajoutée au fichier partiel) passent dans sha256
+        {
+            head -c "$offset" "$part"
+            [ "$offset" = "$size" ] || download_range "$url" "$offset" | tee -a "$part" || echo "$?" > "$part.status"
+        } | sha256_stream > "$part.sum"
+        actual=$(cat "$part.sum")
+        status=$(cat "$part.status" 2>/dev/null || true)
+        if [ -n "$status" ]; then
+            if [ "$status" = "33" ]; then
+                # Le serveur ignore les requêtes Range : reprise depuis le début
+                warning "Avertissement: Reprise non supportée par le serveur, téléchargement complet."
+                truncate_file "$part" 0
+            else
+                warning "Avertissement: Téléchargement interrompu ($(file_size "$part") octets reçus)."
+                [ "$attempt" -ge "$DOWNLOAD_ATTEMPTS" ] || sleep "$attempt"
+            fi
+            continue
+        fi
+        if { [ -z "$size" ] || [ "$(file_size "$part")" = "$size" ]; } && { [ -z "$expected" ] || [ "$actual" = "$expected" ]; }; then
+            mv -f "$part" "$target" || return 1
+            rm -f "$part.id" "$part.sum"
+            return 0
+        fi
+        # Contenu invalide : ne conserver que les blocs vérifiés
+        good=0
+        if [ "$block_size" -gt 0 ] && [ -s "$sums_file" ]; then
+            good=$(verified_blocks "$part" "$block_size" "$sums_file")
+        fi
+        warning "Avertissement: Checksum invalide, reprise après $((good * block_size)) octets vérifiés."
+        truncate_file "$part" $((good * block_size))
+    done
+    rm -f "$part.sum" "$part.status"
+    return 1
+}
+
+# Mode thin : place le segment ($1 = sha256, $2 = taille) dans le cache local et affiche son chemin.
+# Un fichier déjà présent n'est réutilisé que si sa taille et son checksum correspondent.
+fetch_segment() {
+    local checksum="$1" size="$2" cache_dir cached url tmp_file
+    cache_dir="${NVBUILDER_CACHE_DIR:-${XDG_CACHE_HOME:-$HOME/.cache}/nvbuilder}/payloads"
+    cached="$cache_dir/${checksum}.seg"
+    if [ -f "$cached" ]; then
+        if [ "$(file_size "$cached")" = "$size" ] && [ "$(sha256_file "$cached")" = "$checksum" ]; then
+            debug_log "Segment ${checksum:0:12} trouvé en cache."
+            echo "$cached"
+            return 0
+        fi
+        warning "Segment en cache corrompu, nouveau téléchargement: $cached"
+        rm -f "$cached"
+    fi
+    mkdir -p "$cache_dir" || return 1
+    url="${NVBUILDER_PAYLOAD_URL:-$PAYLOAD_URL}"
+    url="${url%/}/${checksum}.seg"
+    # Fichier partiel propre au processus, renommé atomiquement une fois vérifié
+    tmp_file="$cached.part.${BASHPID:-$$}"
+    debug_log "Téléchargement $url"
+    if ! download_file "$url" "$tmp_file"; then
+        rm -f "$tmp_file"
+        error "Erreur: Téléchargement de '$url' échoué."
+        return 1
+    fi
+    if [ "$(file_size "$tmp_file")" != "$size" ] || [ "$(sha256_file "$tmp_file")" != "$checksum" ]; then
+        rm -f "$tmp_file"
+        error "Erreur: Checksum invalide pour '$url'."
+        return 1
+    fi
+    mv -f "$tmp_file" "$cached"
+    echo "$cached"
+}
+
+# Écrit sur stdout les octets (compressés ou chiffrés) du segment décrit par une entrée d'index
+payload_segment_stream() {
+    local entry="$1" offset length checksum size cached
+    IFS='|' read -r _ offset length checksum size _ <<< "$entry"
+    if [ "$PAYLOAD_MODE" = "thin" ]; then
+        cached=$(fetch_segment "$checksum" "$size") || return 1
+        cat "$cached"
+    else
+        read_payload_region "$offset" "$length" | base64 -d
+    fi
+}
+
+# Choisit (une seule fois) un décompresseur multi-thread disponible pour COMPRESSION_METHOD.
+# Sans outil adapté, ou avec NVBUILDER_DECOMPRESSOR=tar, la décompression reste confiée à tar.
+select_decompressor() {
+    [ -n "$DECOMPRESSOR_LABEL" ] && return 0
+    DECOMPRESSOR=()
+    if [ "${NVBUILDER_DECOMPRESSOR:-}" != "tar" ]; then
+        case "$COMPRESSION_METHOD" in
+            gz)
+                if command -v pigz >/dev/null 2>&1; then DECOMPRESSOR=(pigz -dc); fi ;;
+            bz2)
+                if command -v lbzip2 >/dev/null 2>&1; then DECOMPRESSOR=(lbzip2 -dc)
+                elif command -v pbzip2 >/dev/null 2>&1; then DECOMPRESSOR=(pbzip2 -dc); fi ;;
+            xz)
+                if command -v pixz >/dev/null 2>&1; then DECOMPRESSOR=(pixz -d)
+                elif [[ "$(xz --help 2>/dev/null || true)" == *"--threads"* ]]; then DECOMPRESSOR=(xz -dc -T0); fi ;;
+        esac
+    fi
+    if [ ${#DECOMPRESSOR[@]} -gt 0 ]; then
+        DECOMPRESSOR_LABEL="${DECOMPRESSOR[*]} (parallèle)"
+        TAR_EXTRACT_FLAGS="xf"
+    else
+        DECOMPRESSOR_LABEL="tar -${TAR_COMMAND_FLAGS}"
+        TAR_EXTRACT_FLAGS="$TAR_COMMAND_FLAGS"
+    fi
+    debug_log "Décompresseur retenu: $DECOMPRESSOR_LABEL"
+}
+
+# Indique si un segment (liste de préfixes séparés par des virgules) peut contenir ONLY_PATTERN
+segment_matches_pattern() {
+    local prefixes_csv="$1" literal prefix
+    [ -z "$ONLY_PATTERN" ] && return 0
+    # Partie littérale du motif (avant le premier caractère générique)
+    literal="${ONLY_PATTERN#./}"
+    literal="${literal%%[\*\?\[]*}"
+    local -a prefixes=()
+    IFS=',' read -r -a prefixes <<< "$prefixes_csv"
+    for prefix in "${prefixes[@]}"; do
+        [ "$prefix" = "*" ] && return 0
+        if [[ "$literal" == "$prefix"* || "$prefix" == "$literal"* ]]; then
+            return 0
+        fi
+    done
+    return 1
+}
+
+# Détermine TARGET_PLATFORM (--platform, NVBUILDER_PLATFORM ou PLATFORM_PROBE)
+detect_platform() {
+    [ -z "$PAYLOAD_PLATFORMS" ] && return 0
+    [ -z "$TARGET_PLATFORM" ] && TARGET_PLATFORM="${NVBUILDER_PLATFORM:-}"
+    if [ -z "$TARGET_PLATFORM" ]; then
+        TARGET_PLATFORM=$(eval "$PLATFORM_PROBE" 2>/dev/null | head -n 1) || true
+    fi
+    local plat
+    for plat in $PAYLOAD_PLATFORMS; do
+        if [ "$plat" = "$TARGET_PLATFORM" ]; then
+            debug_log "Plateforme: $TARGET_PLATFORM"
+            return 0
+        fi
+    done
+    error "Erreur: Plateforme '${TARGET_PLATFORM:-inconnue}' non prise en charge (disponibles: $PAYLOAD_PLATFORMS)."
+    return 1
+}
+debug_log "Définition fonctions payload OK."
+
 # --- Fonctions conditionnelles (Injectées) ---
 debug_log "Définition fonctions injectées..."
+# --- Début Fonctions Déchiffrement ---
+%%BASH_DECRYPTION_FUNCTIONS%%
+# --- Fin Fonctions Déchiffrement ---
 # --- Début Fonction Update ---
+# Préfixe des fichiers d'état de la vérification des mises à jour, propres au script et à VERSION_URL :
+# .state (etag, last_modified, build_version, checked_at) et .json (dernière réponse reçue)
+update_state_base() {
+    local dir key
+    dir="${NVBUILDER_CACHE_DIR:-${XDG_CACHE_HOME:-$HOME/.cache}/nvbuilder}/update"
+    if ! mkdir -p "$dir" 2>/dev/null || [ ! -w "$dir" ]; then
+        dir="${TMPDIR:-/tmp}/nvbuilder_update_$(id -u)"
+        mkdir -p "$dir" 2>/dev/null || true
+    fi
+    key=$(printf '%s|%s' "$SCRIPT_PATH" "$VERSION_URL" | sha256_stream | cut -c1-16)
+    echo "$dir/${SCRIPT_NAME%.sh}_$key"
+}
+
+# Affiche la valeur de la clé $2 du fichier d'état $1 (vide si absente)
+update_state_get() {
+    [ -f "$1" ] || return 0
+    sed -n "s/^$2=//p" "$1" | head -n 1
+}
+
+# Affiche la valeur du dernier en-tête HTTP $2 (insensible à la casse) du fichier d'en-têtes $1
+http_header_value() {
+    [ -f "$1" ] || return 0
+    tr -d '\r' < "$1" | awk -v name="$2" '
+        { line = $0; sub(/^[ \t]+/, "", line) }
+        tolower(substr(line, 1, length(name) + 1)) == tolower(name) ":" {
+            value = substr(line, length(name) + 2); sub(/^[ \t]+/, "", value)
+        }
+        END { print value }'
+}
+
+# Indique si la dernière vérification ($1 : fichier d'état) date de moins de UPDATE_CHECK_INTERVAL
+# secondes, plus une gigue aléatoire (jusqu'à 10 %) qui étale les requêtes des hôtes lancés ensemble
+update_check_is_fresh() {
+    local state="$1" checked_at elapsed jitter
+    [ "$UPDATE_CHECK_INTERVAL" -gt 0 ] && [ "$FORCE_DOWNLOAD" -eq 0 ] || return 1
+    [ -f "${state%.state}.json" ] || return 1
+    checked_at=$(update_state_get "$state" checked_at)
+    [[ "$checked_at" =~ ^[0-9]+$ ]] || return 1
+    elapsed=$(( $(date +%s) - checked_at ))
+    jitter=$(( RANDOM % (UPDATE_CHECK_INTERVAL / 10 + 1) ))
+    [ "$elapsed" -ge 0 ] && [ "$elapsed" -lt $((UPDATE_CHECK_INTERVAL + jitter)) ]
+}
+
+# Exécute la commande $2... en l'interrompant après $1 secondes si 'timeout' est disponible
+with_time_budget() {
+    local seconds="$1"; shift
+    if command -v timeout &>/dev/null; then
+        timeout "$seconds" "$@"
+    else
+        "$@"
+    fi
+}
+
+# Télécharge l'URL $3 (VERSION_URL par défaut) dans $1 et affiche le code HTTP. La requête est
+# conditionnelle (ETag et Last-Modified du fichier d'état $2) si la réponse en cache vient du même
+# miroir (304 : réponse en cache toujours valide). En-têtes dans $1.headers.
+fetch_version_json() {
+    local out_file="$1" state="$2" url="${3:-$VERSION_URL}" etag="" last_modified="" status
+    local -a conditions=()
+    if [ -f "${state%.state}.json" ] && [ "$(update_state_get "$state" mirror)" = "$url" ]; then
+        etag=$(update_state_get "$state" etag)
+        last_modified=$(update_state_get "$state" last_modified)
+    fi
+    if command -v curl &>/dev/null; then
+        [ -n "$etag" ] && conditions+=(-H "If-None-Match: $etag")
+        [ -n "$last_modified" ] && conditions+=(-H "If-Modified-Since: $last_modified")
+        status=$(curl -fsSL --connect-timeout "$UPDATE_CONNECT_TIMEOUT" --max-time "$UPDATE_MAX_TIME" \
+            "${conditions[@]}" -D "$out_file.headers" -o "$out_file" -w '%{http_code}' "$url") || return 1
+    elif command -v wget &>/dev/null; then
+        [ -n "$etag" ] && conditions+=(--header="If-None-Match: $etag")
+        [ -n "$last_modified" ] && conditions+=(--header="If-Modified-Since: $last_modified")
+        # wget signale un 304 comme une erreur : le code HTTP est lu dans les en-têtes
+        # wget n'a pas de durée maximale : 'timeout' l'impose lorsqu'il est disponible
+        with_time_budget "$UPDATE_MAX_TIME" wget --quiet --server-response --tries=1 "${WGET_LIMITS[@]}" \
+            "${conditions[@]}" -O "$out_file" "$url" 2> "$out_file.headers" || true
+        status=$(awk '$1 ~ /^HTTP\// { code = $2 } END { print code }' "$out_file.headers")
+    else
+        return 1
+    fi
+    [ "$status" = "200" ] || [ "$status" = "304" ] || return 1
+    echo "$status"
+}
+
+# Indique si le miroir $1 est encore en attente après des échecs récents (MIRROR_STATE)
+mirror_waiting() {
+    local retry_at
+    retry_at=$(awk -v url="$1" '$1 == url { print $3 }' "$MIRROR_STATE" 2>/dev/null || true)
+    [[ "$retry_at" =~ ^[0-9]+$ ]] && [ "$retry_at" -gt "$(date +%s)" ]
+}
+
+# Affiche les indices des URLs $@ dans l'ordre d'essai : miroirs disponibles dans l'ordre de la
+# configuration, puis ceux en attente
+mirror_order() {
+    local url i=0
+    local -a ready=() waiting=()
+    for url in "$@"; do
+        if mirror_waiting "$url"; then
+            waiting+=("$i")
+        else
+            ready+=("$i")
+        fi
+        i=$((i + 1))
+    done
+    echo "${ready[*]} ${waiting[*]}"
+}
+
+# Enregistre le résultat ($2 : ok ou fail) d'une requête vers le miroir $1. Après des échecs
+# consécutifs, le miroir n'est réessayé qu'en dernier pendant un délai doublé à chaque échec.
+mirror_record() {
+    local url="$1" result="$2" failures delay
+    [ -n "$MIRROR_STATE" ] || return 0
+    failures=$(awk -v url="$url" '$1 == url { print $2 }' "$MIRROR_STATE" 2>/dev/null || true)
+    [[ "$failures" =~ ^[0-9]+$ ]] || failures=0
+    [ "$result" = "fail" ] || [ "$failures" -gt 0 ] || return 0
+    {
+        awk -v url="$url" '$1 != url' "$MIRROR_STATE" 2>/dev/null || true
+        if [ "$result" = "fail" ]; then
+            failures=$((failures + 1))
+            delay=$((MIRROR_BACKOFF_BASE << (failures < 10 ? failures - 1 : 9)))
+            [ "$delay" -le "$MIRROR_BACKOFF_MAX" ] || delay=$MIRROR_BACKOFF_MAX
+            echo "$url $failures $(($(date +%s) + delay))"
+        fi
+    } > "$MIRROR_STATE.tmp.$$" 2>/dev/null && mv -f "$MIRROR_STATE.tmp.$$" "$MIRROR_STATE" 2>/dev/null || rm -f "$MIRROR_STATE.tmp.$$"
+}
+
+# Interroge les miroirs de VERSION_URLS par groupes de UPDATE_MIRROR_RACE requêtes parallèles et
+# retient la première réponse valide : code 304, ou JSON avec une build_version et, s'il est annoncé,
+# un checksum de script bien formé. La réponse est placée dans $1 (en-têtes dans $1.headers) ;
+# affiche le code HTTP et l'indice du miroir retenu. Les requêtes plus lentes sont abandonnées.
+fetch_version_race() {
+    local out_file="$1" state="$2" race_dir i pid running winner="" status=""
+    local -a order=() batch=() pids=()
+    # Un seul miroir : requête directe, sans course
+    if [ ${#VERSION_URLS[@]} -le 1 ]; then
+        status=$(fetch_version_json "$out_file" "$state" "${VERSION_URLS[0]:-$VERSION_URL}") || return 1
+        echo "$status 0"
+        return 0
+    fi
+    race_dir=$(mktemp -d "${TMPDIR:-/tmp}/nvb_race.XXXXXX") || return 1
+    read -r -a order <<< "$(mirror_order "${VERSION_URLS[@]}")"
+    while [ ${#order[@]} -gt 0 ] && [ -z "$winner" ]; do
+        batch=("${order[@]:0:$UPDATE_MIRROR_RACE}")
+        order=("${order[@]:$UPDATE_MIRROR_RACE}")
+        pids=()
+        for i in "${batch[@]}"; do
+            (
+                status=$(fetch_version_json "$race_dir/$i" "$state" "${VERSION_URLS[$i]}") \
+                    && { [ "$status" = "304" ] || { grep -q '"build_version"' "$race_dir/$i" \
+                        && ! grep -q '"script_checksum_sha256": "[^"]*[^0-9a-f"][^"]*"' "$race_dir/$i"; }; } \
+                    || { touch "$race_dir/$i.failed"; exit 1; }
+                echo "$i $status" >> "$race_dir/answers"
+            ) 2> "$race_dir/$i.err" &
+            pids+=("$!")
+        done
+        # Attente par scrutation ('wait -n' exige bash 4.3) : première réponse valide, ou fin de toutes les requêtes
+        while :; do
+            if [ -s "$race_dir/answers" ]; then
+                read -r winner status < "$race_dir/answers"
+                break
+            fi
+            running=0
+            for pid in "${pids[@]}"; do
+                kill -0 "$pid" 2>/dev/null && { running=1; break; }
+            done
+            if [ $running -eq 0 ]; then
+                # Réponse écrite juste avant la fin du dernier processus
+                [ -s "$race_dir/answers" ] && read -r winner status < "$race_dir/answers"
+                break
+            fi
+            sleep 0.05
+        done
+        kill "${pids[@]}" 2>/dev/null || true
+        wait "${pids[@]}" 2>/dev/null || true
+        # Seuls les miroirs qui ont répondu en erreur sont pénalisés (pas les requêtes interrompues)
+        for i in "${batch[@]}"; do
+            if [ -f "$race_dir/$i.failed" ]; then
+                mirror_record "${VERSION_URLS[$i]}" fail
+            elif [ "$i" = "$winner" ]; then
+                mirror_record "${VERSION_URLS[$i]}" ok
+            fi
+        done
+        # Erreurs affichées seulement si aucun miroir du groupe n'a répondu (une requête interrompue
+        # peut encore écrire dans son fichier, déjà supprimé, sans rien afficher)
+        if [ -z "$winner" ]; then
+            for i in "${batch[@]}"; do cat "$race_dir/$i.err" >&2 2>/dev/null || true; done
+        fi
+    done
+    if [ -n "$winner" ]; then
+        mv -f "$race_dir/$winner" "$out_file" 2>/dev/null || : > "$out_file"
+        mv -f "$race_dir/$winner.headers" "$out_file.headers" 2>/dev/null || true
+    fi
+    rm -rf "$race_dir"
+    [ -n "$winner" ] || return 1
+    echo "$status $winner"
+}
+
+# Enregistre l'état de la vérification ($1 : fichier d'état, $2 : build_version, $3 : en-têtes reçus,
+# $4 : miroir qui a répondu). Une réponse 304 sans validateurs conserve ceux de la réponse précédente.
+update_state_save() {
+    local state="$1" version="$2" headers="$3" mirror="${4:-$VERSION_URL}" etag last_modified
+    etag=$(http_header_value "$headers" etag)
+    last_modified=$(http_header_value "$headers" last-modified)
+    if [ "$(update_state_get "$state" mirror)" = "$mirror" ]; then
+        [ -n "$etag" ] || etag=$(update_state_get "$state" etag)
+        [ -n "$last_modified" ] || last_modified=$(update_state_get "$state" last_modified)
+    fi
+    {
+        echo "etag=$etag"
+        echo "last_modified=$last_modified"
+        echo "build_version=$version"
+        echo "mirror=$mirror"
+        echo "checked_at=$(date +%s)"
+    } > "$state.tmp.$$" 2>/dev/null && mv -f "$state.tmp.$$" "$state" 2>/dev/null || rm -f "$state.tmp.$$"
+}
+
+# Reconstruit dans $2 la nouvelle version du script à partir du paquet différentiel annoncé par
+# version.json ($1) pour CURRENT_BUILD_VERSION : octets transportés par le paquet et régions de
+# segments inchangés relues dans ce script. Échoue (téléchargement complet) si aucun paquet n'est
+# annoncé, s'il est invalide ou si le résultat ne correspond pas au checksum attendu ($3).
+apply_update_delta() {
+    local remote_json="$1" target_file="$2" expected="$3" delta_path="" delta_checksum="" key value
+    local delta_dir header format from_version to_version rc=0
+    [ -n "$expected" ] && [ "$expected" != "null" ] || return 1
+    while IFS='=' read -r key value; do
+        case "$key" in
+            path) delta_path="$value" ;;
+            checksum_sha256) delta_checksum="$value" ;;
+        esac
+    done < <(printf '%s\n' "$remote_json" | awk -v key="\"$CURRENT_BUILD_VERSION\":" '
+        index($0, key) && /\{/ { inside = 1; next }
+        inside && /\}/ { exit }
+        inside { line = $0; gsub(/[",]/, "", line); sub(/^[ \t]+/, "", line); sub(/: /, "=", line); print line }')
+    if [ -z "$delta_path" ] || [ -z "$delta_checksum" ] || [[ "$delta_path" == */* ]]; then
+        debug_log "Aucun paquet différentiel depuis la version $CURRENT_BUILD_VERSION."
+        return 1
+    fi
+
+    delta_dir=$(mktemp -d "${TMPDIR:-/tmp}/nvb_delta.XXXXXX") || return 1
+    echo -e "${INFO_COLOR}Téléchargement du paquet différentiel ${delta_path}...${RESET_STYLE}"
+    if ! download_optional "${PACKAGE_URL%/*}/$delta_path" "$delta_dir/package"; then
+        info "Paquet différentiel non publié, téléchargement complet."
+        rm -rf "$delta_dir"
+        return 1
+    fi
+    if [ "$(sha256_file "$delta_dir/package")" != "$delta_checksum" ] \
+        || ! tar xzf "$delta_dir/package" -C "$delta_dir" 2>/dev/null; then
+        warning "Avertissement: Paquet différentiel invalide."
+        rm -rf "$delta_dir"
+        return 1
+    fi
+    read -r header format from_version to_version < "$delta_dir/recipe" || true
+    if [ "$header" != "nvbuilder-delta" ] || [ "$format" != "1" ] || [ "$from_version" != "$CURRENT_BUILD_VERSION" ]; then
+        warning "Avertissement: Paquet différentiel non applicable à la version $CURRENT_BUILD_VERSION."
+        rm -rf "$delta_dir"
+        return 1
+    fi
+    if [ -s "$delta_dir/changes" ]; then
+        info "  Fichiers : $(grep -c '^A ' "$delta_dir/changes" || true) ajouté(s), $(grep -c '^M ' "$delta_dir/changes" || true) modifié(s), $(grep -c '^D ' "$delta_dir/changes" || true) supprimé(s)"
+    fi
+
+    # Reconstruction : les régions 'old' sont relues dans ce script, sans décodage
+    [ -n "${PAYLOAD_BASE:-}" ] || locate_payload || { rm -rf "$delta_dir"; return 1; }
+    (
+        local op arg length
+        while read -r op arg length; do
+            case "$op" in
+                new) cat "$delta_dir/$arg" || rc=1 ;;
+                old) read_payload_region "$arg" "$length" ;;
+            esac
+        done < <(tail -n +2 "$delta_dir/recipe")
+        exit $rc
+    ) > "$target_file.delta.$$" || rc=1
+    rm -rf "$delta_dir"
+    if [ "$rc" -ne 0 ] || [ "$(sha256_file "$target_file.delta.$$")" != "$expected" ]; then
+        warning "Avertissement: Script reconstruit invalide (checksum), téléchargement complet."
+        rm -f "$target_file.delta.$$"
+        return 1
+    fi
+    mv -f "$target_file.delta.$$" "$target_file"
+    success "Version $to_version reconstruite à partir du paquet différentiel ($(file_size "$target_file") octets)."
+}
+
+# Écrit sur stdout les données d'une région du script décrite par un index de blocs :
+# $1 = type ('raw' : octets du script, 'b64' : segment décodé), $2 = offset de la région dans
+# le script, $3 = offset dans les données de la région, $4 = longueur.
+# Pour une région Base64, seuls les groupes de 4 caractères couvrant la plage sont décodés.
+read_chunk_range() {
+    local kind="$1" part_offset="$2" data_offset="$3" length="$4" start end
+    if [ "$kind" = "raw" ]; then
+        { tail -c +"$((part_offset + data_offset + 1))" "$SCRIPT_PATH" 2>/dev/null || true; } | head -c "$length"
+        return
+    fi
+    start=$((data_offset / 3 * 4))
+    end=$(((data_offset + length + 2) / 3 * 4))
+    { tail -c +"$((part_offset + start + 1))" "$SCRIPT_PATH" 2>/dev/null || true; } | head -c "$((end - start))" \
+        | base64 -d | { tail -c +"$((data_offset % 3 + 1))" 2>/dev/null || true; } | head -c "$length"
+}
+
+# Encode l'entrée standard en Base64 sur une seule ligne (format des régions de segments)
+base64_single_line() {
+    if base64 -w 0 </dev/null &>/dev/null; then
+        base64 -w 0
+    else
+        base64 | tr -d '\n'
+    fi
+    echo ""
+}
+
+# Télécharge dans le répertoire $2 les URLs listées dans le fichier $1 (une par ligne, fichiers
+# nommés d'après la fin de l'URL) : un seul processus curl/wget, connexion réutilisée
+download_batch() {
+    local list_file="$1" out_dir="$2" url
+    if command -v curl &>/dev/null; then
+        while read -r url; do
+            printf 'url = "%s"\noutput = "%s/%s"\n' "$url" "$out_dir" "${url##*/}"
+        done < "$list_file" > "$out_dir/.curl_config"
+        curl -fsSL --retry 3 "${CURL_LIMITS[@]}" --config "$out_dir/.curl_config"
+    elif command -v wget &>/dev/null; then
+        wget --quiet --tries=3 "${WGET_LIMITS[@]}" -P "$out_dir" -i "$list_file"
+    else
+        error "Erreur: curl/wget absents."
+        return 1
+    fi
+}
+
+# Reconstruit dans $2 la nouvelle version du script à partir du magasin de blocs annoncé par
+# version.json ($1) : l'index du nouveau build liste les blocs de chaque région du script, celui
+# du build courant les localise dans ce script. Seuls les blocs absents de ce payload (et du
+# cache local) sont téléchargés. Échoue (autre méthode) si le magasin n'est pas annoncé, si l'index
+# de ce build n'est plus publié ou si le résultat ne correspond pas au checksum attendu ($3).
+apply_update_chunks() {
+    local remote_json="$1" target_file="$2" expected="$3" index_name="" store="" key value
+    local base_url work_dir chunk_cache header format version size checksum
+    local checksum_chunk chunk_size local_bytes=0 remote_bytes=0 missing=0 part kind rc=0
+    [ -n "$expected" ] && [ "$expected" != "null" ] || return 1
+    while IFS='=' read -r key value; do
+        case "$key" in
+            index) index_name="$value" ;;
+            store) store="$value" ;;
+        esac
+    done < <(printf '%s\n' "$remote_json" | awk '
+        index($0, "\"chunks\":") && /\{/ { inside = 1; next }
+        inside && /\}/ { exit }
+        inside { line = $0; gsub(/[",]/, "", line); sub(/^[ \t]+/, "", line); sub(/: /, "=", line); print line }')
+    if [ -z "$index_name" ] || [[ ! "$index_name" =~ ^[A-Za-z0-9._-]+_[0-9]+\.chunks$ ]] || [[ ! "$store" =~ ^[A-Za-z0-9._-]+$ ]]; then
+        debug_log "Aucun magasin de blocs annoncé."
+        return 1
+    fi
+    base_url="${PACKAGE_URL%/*}"
+    work_dir=$(mktemp -d "${TMPDIR:-/tmp}/nvb_chunks.XXXXXX") || return 1
+
+    # Index du nouveau build et index de ce build (localisation des blocs dans ce script)
+    if ! download_optional "$base_url/$index_name" "$work_dir/new.chunks" \
+        || ! download_optional "$base_url/${index_name%_*}_${CURRENT_BUILD_VERSION}.chunks" "$work_dir/own.chunks"; then
+        debug_log "Index de blocs indisponible (build $CURRENT_BUILD_VERSION non publié ?)."
+        rm -rf "$work_dir"
+        return 1
+    fi
+    read -r header format version size checksum < "$work_dir/new.chunks" || true
+    if [ "$header" != "nvbuilder-chunks" ] || [ "$format" != "1" ] || [ "$checksum" != "$expected" ]; then
+        warning "Avertissement: Index de blocs invalide ou ne correspondant pas à la version annoncée."
+        rm -rf "$work_dir"
+        return 1
+    fi
+    read -r header format version size checksum < "$work_dir/own.chunks" || true
+    if [ "$header" != "nvbuilder-chunks" ] || [ "$format" != "1" ] || [ "$version" != "$CURRENT_BUILD_VERSION" ] \
+        || [ "$size" != "$(file_size "$SCRIPT_PATH")" ]; then
+        warning "Avertissement: Index de blocs de la version $CURRENT_BUILD_VERSION incohérent avec ce script."
+        rm -rf "$work_dir"
+        return 1
+    fi
+
+    # Plan de reconstruction, une liste par région : plages locales contiguës fusionnées
+    # ('local type offset_région offset longueur') et blocs à obtenir ('fetch sha256 taille')
+    awk -v dir="$work_dir" '
+        function flush_run() { if (run) print "local", rkind, rpart, roff, rlen > out; run = 0 }
+        FNR == 1 { file++; next }
+        file == 1 && $1 == "part" { kind = $2; part = $3; next }
+        file == 1 && $1 == "chunk" { if (!($2 in src)) src[$2] = kind " " part " " $3; next }
+        file == 2 && $1 == "part" {
+            flush_run(); n++; out = sprintf("%s/part.%04d", dir, n); printf "" > out
+            print sprintf("%04d", n), $2 > (dir "/parts"); next
+        }
+        file == 2 && $1 == "chunk" {
+            if ($2 in src) {
+                split(src[$2], s, " ")
+                if (run && rkind == s[1] && rpart == s[2] && roff + rlen == s[3]) { rlen += $4 }
+                else { flush_run(); run = 1; rkind = s[1]; rpart = s[2]; roff = s[3]; rlen = $4 }
+                local_bytes += $4
+            } else {
+                flush_run(); print "fetch", $2, $4 > out; remote_bytes += $4
+            }
+        }
+        END { flush_run(); print local_bytes + 0, remote_bytes + 0 > (dir "/totals") }
+    ' "$work_dir/own.chunks" "$work_dir/new.chunks" || { rm -rf "$work_dir"; return 1; }
+    read -r local_bytes remote_bytes < "$work_dir/totals" || true
+
+    # Blocs manquants : cache local d'abord (téléchargements interrompus), magasin distant sinon
+    chunk_cache="${NVBUILDER_CACHE_DIR:-${XDG_CACHE_HOME:-$HOME/.cache}/nvbuilder}/chunks"
+    mkdir -p "$chunk_cache" "$work_dir/fetch" || { rm -rf "$work_dir"; return 1; }
+    while read -r checksum_chunk chunk_size; do
+        if [ -f "$chunk_cache/$checksum_chunk" ] && [ "$(sha256_file "$chunk_cache/$checksum_chunk")" = "$checksum_chunk" ]; then
+            continue
+        fi
+        echo "$base_url/$store/${checksum_chunk:0:2}/$checksum_chunk"
+        missing=$((missing + 1))
+    done < <(cat "$work_dir"/part.* | awk '$1 == "fetch" && !seen[$2]++ { print $2, $3 }') > "$work_dir/fetch.list"
+    echo -e "${INFO_COLOR}Magasin de blocs : $((local_bytes / 1024)) Ko repris de ce script, $((remote_bytes / 1024)) Ko à obtenir ($missing bloc(s) à télécharger)...${RESET_STYLE}"
+    if [ "$missing" -gt 0 ]; then
+        download_batch "$work_dir/fetch.list" "$work_dir/fetch" || rc=1
+        while read -r value; do
+            checksum_chunk="${value##*/}"
+            if [ -f "$work_dir/fetch/$checksum_chunk" ] && [ "$(sha256_file "$work_dir/fetch/$checksum_chunk")" = "$checksum_chunk" ]; then
+                mv -f "$work_dir/fetch/$checksum_chunk" "$chunk_cache/$checksum_chunk"
+            else
+                rc=1
+            fi
+        done < "$work_dir/fetch.list"
+        if [ "$rc" -ne 0 ]; then
+            warning "Avertissement: Blocs indisponibles ou invalides dans le magasin."
+            rm -rf "$work_dir"
+            return 1
+        fi
+    fi
+
+    # Reconstruction région par région (les segments sont réencodés en Base64)
+    (
+        local op a b c d
+        while read -r part kind; do
+            while read -r op a b c d; do
+                case "$op" in
+                    local) read_chunk_range "$a" "$b" "$c" "$d" ;;
+                    fetch) cat "$chunk_cache/$a" || exit 1 ;;
+                esac
+            done < "$work_dir/part.$part" | if [ "$kind" = "b64" ]; then base64_single_line; else cat; fi
+        done < "$work_dir/parts"
+    ) > "$target_file.chunks.$$" || rc=1
+    if [ "$rc" -ne 0 ] || [ "$(sha256_file "$target_file.chunks.$$")" != "$expected" ]; then
+        warning "Avertissement: Script reconstruit invalide (checksum)."
+        rm -f "$target_file.chunks.$$"
+        rm -rf "$work_dir"
+        return 1
+    fi
+    mv -f "$target_file.chunks.$$" "$target_file"
+    # Les blocs téléchargés sont désormais dans le nouveau script
+    while read -r value; do rm -f "$chunk_cache/${value##*/}"; done < "$work_dir/fetch.list"
+    rm -rf "$work_dir"
+    success "Nouvelle version reconstruite à partir du magasin de blocs ($((remote_bytes / 1024)) Ko téléchargés sur $(( $(file_size "$target_file") / 1024 )) Ko)."
+}
+
 check_for_updates_and_download_if_needed() {
     # Masquer les messages en mode normal, sauf en cas d'erreur ou nouvelle version
     local QUIET_MODE=0
@@ -384,27 +1334,46 @@ check_for_updates_and_download_if_needed() {
     debug_log "Vérification MàJ depuis $VERSION_URL..."
     debug_log "URL Package: $PACKAGE_URL"
     debug_log "Mode update: $UPDATE_MODE"
-    local downloader="" remote_json="" latest_version="" script_checksum="" update_success=0 replace_success=0
+    local remote_json="" latest_version="" script_checksum="" update_success=0 replace_success=0
     local original_args=("$@")  # Sauvegarder les arguments originaux pour la relance
 
     # Déterminer téléchargeur
-    if command -v curl &>/dev/null; then 
-        downloader="curl -fsSL --retry 3"
-    elif command -v wget &>/dev/null; then 
-        downloader="wget --quiet --tries=3 -O-"
-    else 
+    if ! command -v curl &>/dev/null && ! command -v wget &>/dev/null; then 
         [ "$QUIET_MODE" -eq 0 ] && echo -e "${WARNING_COLOR}Avertissement: curl/wget absents.${RESET_STYLE}" >&2
         [ "$QUIET_MODE" -eq 0 ] && echo -e "${WARNING_COLOR}Poursuite de l'extraction normale.${RESET_STYLE}"
         return 0
     fi
 
-    # Récupérer JSON distant
-    echo -e "${HIGHLIGHT_STYLE}• Vérification des mises à jour...${RESET_STYLE}"
-    debug_log "Tentative récupération: $VERSION_URL"
-    if ! remote_json=$($downloader "$VERSION_URL"); then 
-        echo -e "${WARNING_COLOR}Avertissement: Échec récupération $VERSION_URL.${RESET_STYLE}" >&2
-        echo -e "${WARNING_COLOR}Poursuite de l'extraction normale.${RESET_STYLE}"
-        return 0
+    # Récupérer JSON distant : réponse en cache tant que UPDATE_CHECK_INTERVAL n'est pas écoulé,
+    # requête conditionnelle sinon (304 : la réponse en cache reste valide)
+    local state_base state_file http_status="" fetched=0 race_result="" version_mirror=0 i
+    state_base=$(update_state_base)
+    state_file="$state_base.state"
+    MIRROR_STATE="$state_base.mirrors"
+    if update_check_is_fresh "$state_file"; then
+        debug_log "Vérification récente (intervalle ${UPDATE_CHECK_INTERVAL}s), réponse en cache: $state_base.json"
+        remote_json=$(cat "$state_base.json")
+        for i in "${!VERSION_URLS[@]}"; do
+            [ "${VERSION_URLS[$i]}" != "$(update_state_get "$state_file" mirror)" ] || version_mirror=$i
+        done
+    else
+        echo -e "${HIGHLIGHT_STYLE}• Vérification des mises à jour...${RESET_STYLE}"
+        debug_log "Tentative récupération: ${VERSION_URLS[*]}"
+        if ! race_result=$(fetch_version_race "$state_base.tmp.$$" "$state_file"); then 
+            rm -f "$state_base.tmp.$$" "$state_base.tmp.$$.headers"
+            echo -e "${WARNING_COLOR}Avertissement: Échec récupération $VERSION_URL$([ ${#VERSION_URLS[@]} -le 1 ] || echo " et des autres miroirs").${RESET_STYLE}" >&2
+            echo -e "${WARNING_COLOR}Poursuite de l'extraction normale.${RESET_STYLE}"
+            return 0
+        fi
+        read -r http_status version_mirror <<< "$race_result"
+        debug_log "Réponse HTTP: $http_status (miroir ${VERSION_URLS[$version_mirror]})"
+        if [ "$http_status" = "304" ]; then
+            rm -f "$state_base.tmp.$$"
+        else
+            mv -f "$state_base.tmp.$$" "$state_base.json"
+        fi
+        remote_json=$(cat "$state_base.json" 2>/dev/null) || remote_json=""
+        fetched=1
     fi
     if [ -z "$remote_json" ]; then 
         echo -e "${WARNING_COLOR}Avertissement: Réponse vide de $VERSION_URL.${RESET_STYLE}" >&2
@@ -427,8 +1396,13 @@ check_for_updates_and_download_if_needed() {
     if [ -z "$latest_version" ]; then 
         echo -e "${WARNING_COLOR}Avertissement: build_version distante non trouvée.${RESET_STYLE}" >&2
         echo -e "${WARNING_COLOR}Poursuite de l'extraction normale.${RESET_STYLE}"
+        rm -f "$state_base.tmp.$$.headers"
         return 0
     fi
+    if [ "$fetched" -eq 1 ]; then
+        update_state_save "$state_file" "$latest_version" "$state_base.tmp.$$.headers" "${VERSION_URLS[$version_mirror]}"
+        rm -f "$state_base.tmp.$$.headers"
+    fi
     
     echo -en "  • ${HIGHLIGHT_STYLE}Actuelle: ${INFO_COLOR}$CURRENT_BUILD_VERSION${RESET_STYLE} / ${HIGHLIGHT_STYLE}Distante: ${INFO_COLOR}$latest_version${RESET_STYLE} "
 
@@ -453,7 +1427,7 @@ check_for_updates_and_download_if_needed() {
     fi
 
     # Vérification mot de passe si nécessaire (sauf en mode auto-replace-always)
-    local password_ok=1
+    local password_ok=1 manual_only=0
     local user_password=""
     
     # En mode auto-replace-always, définir user_password vide mais valide
@@ -461,6 +1435,10 @@ check_for_updates_and_download_if_needed() {
         password_ok=1
         user_password="auto_replace_always_bypass"
         echo -e "${WARNING_COLOR}Mode auto-replace-always activé - Vérification de mot de passe ignorée${RESET_STYLE}"
+    elif %%BASH_ENCRYPTION_ENABLED_BOOL%% && [ "$UPDATE_IN_BACKGROUND" -eq 1 ]; then
+        # Aucune saisie en arrière-plan : la nouvelle version est seulement téléchargée
+        echo -e "${WARNING_COLOR}Vérification du mot de passe impossible en arrière-plan : remplacement manuel.${RESET_STYLE}"
+        manual_only=1
     elif %%BASH_ENCRYPTION_ENABLED_BOOL%%; then
         debug_log "Mode chiffré détecté, vérification jeton..."
         if [ -n "$token_b64" ] && [ "$token_b64" != "null" ]; then
@@ -533,52 +1511,78 @@ check_for_updates_and_download_if_needed() {
         fi
     fi
 
-    # Téléchargement du script
-    echo -e "${INFO_COLOR}Téléchargement depuis $PACKAGE_URL...${RESET_STYLE}"
-    local url_basename
+    # Téléchargement du script (magasin de blocs ou paquet différentiel si disponible, script complet sinon).
+    # Le checksum est toujours vérifié avant que le fichier cible n'apparaisse.
+    local url_basename script_size block_size sums_file
     url_basename=$(basename "$PACKAGE_URL")
     [ -z "$url_basename" ] || [[ "$url_basename" == "."* ]] && url_basename="$(basename "$0")_new"
     local target_file="$SCRIPT_DIR/$url_basename"
+    # Ne jamais écrire sur le script en cours d'exécution (bash le relit au fil de l'eau)
+    [ "$target_file" != "$SCRIPT_PATH" ] || target_file="${SCRIPT_PATH}_new"
     debug_log "Fichier cible: $target_file"
+    [ "$script_checksum" != "null" ] || script_checksum=""
+    [ -n "$script_checksum" ] || echo -e "${WARNING_COLOR}Avertissement: Checksum script distant absent.${RESET_STYLE}" >&2
 
-    local dl_cmd=""
-    if [[ "$downloader" == "curl"* ]]; then 
-        dl_cmd="curl -fSL --retry 3 -o '$target_file' '$PACKAGE_URL'"
-    else 
-        dl_cmd="wget --quiet --tries=3 -O '$target_file' '$PACKAGE_URL'"
+    # Miroirs du paquet : celui dont la réponse est arrivée la première (miroirs appariés), puis les
+    # autres dans l'ordre d'essai ; un miroir en échec passe la main au suivant
+    local -a package_order=()
+    local mirror downloaded=0 attempts
+    read -r -a package_order <<< "$(mirror_order "${PACKAGE_URLS[@]}")"
+    if [ ${#PACKAGE_URLS[@]} -gt 1 ] && [ ${#PACKAGE_URLS[@]} -eq ${#VERSION_URLS[@]} ] \
+        && ! mirror_waiting "${PACKAGE_URLS[$version_mirror]}"; then
+        local -a paired_order=("$version_mirror")
+        for i in "${package_order[@]}"; do
+            [ "$i" = "$version_mirror" ] || paired_order+=("$i")
+        done
+        package_order=("${paired_order[@]}")
     fi
-    debug_log "Commande téléchargement: $dl_cmd"
-    
-    if ! eval $dl_cmd; then 
-        echo -e "${ERROR_COLOR}Erreur: Téléchargement échoué.${RESET_STYLE}" >&2
-        rm -f "$target_file" 2>/dev/null
-        echo -e "${WARNING_COLOR}Poursuite de l'extraction normale.${RESET_STYLE}"
-        return 0
+
+    # Script complet : fichier partiel repris après coupure (y compris depuis un autre miroir),
+    # vérifié bloc par bloc en cas d'erreur
+    script_size=$(_json_extract "$remote_json" "script_size")
+    [[ "$script_size" =~ ^[0-9]+$ ]] || script_size=""
+    block_size=$(_json_extract "$remote_json" "block_size")
+    [[ "$block_size" =~ ^[0-9]+$ ]] || block_size=0
+    sums_file=$(mktemp "${TMPDIR:-/tmp}/nvb_blocks.XXXXXX") || sums_file=""
+    if [ -n "$sums_file" ]; then
+        printf '%s\n' "$remote_json" | awk '
+            index($0, "\"script_blocks\":") { inside = 1; next }
+            inside && /\]/ { exit }
+            inside && /"[0-9a-f]+"/ { line = $0; gsub(/[^0-9a-f]/, "", line); print line }' > "$sums_file"
     fi
 
-    # Vérification Checksum Script
-    if [ -n "$script_checksum" ] && [ "$script_checksum" != "null" ]; then
-        if command -v sha256sum &>/dev/null; then
-            echo "Vérification checksum script ($script_checksum)..."
-            local actual_checksum
-            actual_checksum=$(sha256sum "$target_file" | cut -d' ' -f1)
-            debug_log "Checksum calculé: $actual_checksum"
-            
-            if [ "$actual_checksum" == "$script_checksum" ]; then 
-                echo -e "${SUCCESS_COLOR}Checksum script OK.${RESET_STYLE}"
-            else 
-                echo -e "${ERROR_COLOR}ERREUR: Checksum script invalide!${RESET_STYLE}" >&2
-                debug_log "Attendu: $script_checksum"
-                rm -f "$target_file" 2>/dev/null
-                echo -e "${WARNING_COLOR}Poursuite de l'extraction normale.${RESET_STYLE}"
-                return 0
-            fi
+    for mirror in "${package_order[@]}"; do
+        PACKAGE_URL="${PACKAGE_URLS[$mirror]}"
+        # Magasin de blocs ou paquet différentiel : essayés sur le premier miroir uniquement
+        if [ "$mirror" = "${package_order[0]}" ] && [ "$FORCE_DOWNLOAD" -eq 0 ] \
+            && { apply_update_chunks "$remote_json" "$target_file" "$script_checksum" \
+                || apply_update_delta "$remote_json" "$target_file" "$script_checksum"; }; then
+            downloaded=1
         else
-            echo -e "${WARNING_COLOR}Avertissement: 'sha256sum' non trouvé, vérification ignorée.${RESET_STYLE}" >&2
+            echo -e "${INFO_COLOR}Téléchargement depuis $PACKAGE_URL...${RESET_STYLE}"
+            # Deux tentatives par miroir lorsqu'il en reste d'autres
+            attempts=$DOWNLOAD_ATTEMPTS
+            [ "$mirror" = "${package_order[${#package_order[@]}-1]}" ] || [ "$attempts" -le 2 ] || attempts=2
+            if DOWNLOAD_ATTEMPTS=$attempts download_resumable "$PACKAGE_URL" "$target_file" "$script_checksum" \
+                "$script_size" "$block_size" "$sums_file"; then
+                downloaded=1
+            fi
         fi
-    else
-        echo -e "${WARNING_COLOR}Avertissement: Checksum script distant absent.${RESET_STYLE}" >&2
+        if [ "$downloaded" -eq 1 ]; then
+            mirror_record "$PACKAGE_URL" ok
+            break
+        fi
+        mirror_record "$PACKAGE_URL" fail
+        [ ${#package_order[@]} -le 1 ] || warning "Avertissement: Miroir $PACKAGE_URL en échec."
+    done
+    rm -f "$sums_file"
+    if [ "$downloaded" -eq 0 ]; then
+        echo -e "${ERROR_COLOR}Erreur: Téléchargement échoué.${RESET_STYLE}" >&2
+        [ -z "$script_checksum" ] || [ ! -f "$target_file.part" ] || echo -e "${DETAIL_COLOR}Le fichier partiel est conservé pour une reprise: $target_file.part${RESET_STYLE}"
+        echo -e "${WARNING_COLOR}Poursuite de l'extraction normale.${RESET_STYLE}"
+        return 0
     fi
+    [ -z "$script_checksum" ] || echo -e "${SUCCESS_COLOR}Checksum script OK.${RESET_STYLE}"
 
     chmod +x "$target_file" 2>/dev/null
     update_success=1
@@ -587,7 +1591,13 @@ check_for_updates_and_download_if_needed() {
     
     # Mode de mise à jour selon configuration
     debug_log "Mode update configuré: $UPDATE_MODE (NO_AUTO_UPDATE=$NO_AUTO_UPDATE)"
-    if [[ "$UPDATE_MODE" == "auto-replace"* ]] && [ "$NO_AUTO_UPDATE" -eq 0 ]; then
+    if [[ "$UPDATE_MODE" == "auto-replace"* ]] && [ "$NO_AUTO_UPDATE" -eq 0 ] && [ "$manual_only" -eq 0 ]; then
+        if [ "$UPDATE_IN_BACKGROUND" -eq 1 ]; then
+            # Le payload est en cours de lecture par son chemin : le remplacement attend la fin de l'extraction
+            printf '%s|%s|%s\n' "$target_file" "$script_checksum" "$latest_version" > "$state_base.staged"
+            echo -e "${UPDATE_COLOR}Mise à jour $latest_version téléchargée, installée à la fin de l'exécution (ou au lancement suivant).${RESET_STYLE}"
+            return 0
+        fi
         # Afficher un message plus détaillé pour auto-replace-always
         if [[ "$UPDATE_MODE" == "auto-replace-always" ]]; then
             echo -e "${UPDATE_COLOR}Mode auto-replace-always - Installation automatique de la mise à jour...${RESET_STYLE}"
@@ -638,7 +1648,7 @@ check_for_updates_and_download_if_needed() {
         else
             echo -e "${ERROR_COLOR}Échec du remplacement. L'extraction va se poursuivre.${RESET_STYLE}" >&2
         fi
-    elif [ "$UPDATE_MODE" == "download-only" ]; then
+    elif [ "$UPDATE_MODE" == "download-only" ] || [ "$manual_only" -eq 1 ]; then
         echo "Mode Download-Only - Le script a été téléchargé à côté du script actuel."
         echo "Veuillez remplacer manuellement '$SCRIPT_PATH' par '$target_file' si vous le souhaitez."
     else
@@ -649,14 +1659,714 @@ check_for_updates_and_download_if_needed() {
     # Continuer avec l'extraction
     return 0
 }
+
+# Lance la vérification des mises à jour en arrière-plan, sans saisie et avec sa sortie dans un
+# journal : l'extraction n'attend pas le réseau, le résultat est traité par finish_background_update.
+start_background_update() {
+    UPDATE_JOB_LOG="$(update_state_base).log"
+    ( UPDATE_IN_BACKGROUND=1; check_for_updates_and_download_if_needed "$@" ) < /dev/null > "$UPDATE_JOB_LOG" 2>&1 &
+    UPDATE_JOB_PID=$!
+    debug_log "Vérification des mises à jour en arrière-plan (PID $UPDATE_JOB_PID, journal: $UPDATE_JOB_LOG)."
+}
+
+# Affiche le résultat de la vérification en arrière-plan et installe la mise à jour préparée.
+# Une tâche encore en cours (téléchargement) est détachée : elle se termine après ce script et
+# la mise à jour qu'elle prépare est installée à la prochaine exécution.
+finish_background_update() {
+    [ -n "$UPDATE_JOB_PID" ] || return 0
+    if kill -0 "$UPDATE_JOB_PID" 2>/dev/null; then
+        disown "$UPDATE_JOB_PID" 2>/dev/null || true
+        info "Vérification des mises à jour toujours en cours en arrière-plan (journal: $UPDATE_JOB_LOG)."
+        return 0
+    fi
+    wait "$UPDATE_JOB_PID" 2>/dev/null || true
+    cat "$UPDATE_JOB_LOG" 2>/dev/null || true
+    install_staged_update || true
+}
+
+# Installe la mise à jour préparée en arrière-plan (mode auto-replace) : le fichier téléchargé est
+# vérifié puis renommé sur ce script, l'ancienne version étant conservée en .bak. Le renommage
+# laisse intact le fichier que le processus en cours est en train de lire.
+install_staged_update() {
+    local staged target checksum version
+    staged="$(update_state_base).staged"
+    [ -f "$staged" ] || return 1
+    IFS='|' read -r target checksum version < "$staged" || true
+    rm -f "$staged"
+    [[ "$UPDATE_MODE" == "auto-replace"* ]] && [ "$NO_AUTO_UPDATE" -eq 0 ] || return 1
+    if [ ! -f "$target" ] || { [ -n "$checksum" ] && [ "$(sha256_file "$target")" != "$checksum" ]; }; then
+        warning "Avertissement: Mise à jour préparée introuvable ou invalide, ignorée."
+        return 1
+    fi
+    if cp "$SCRIPT_PATH" "$SCRIPT_PATH.bak"; then
+        chmod +x "$SCRIPT_PATH.bak" 2>/dev/null || true
+    else
+        warning "Avertissement: Échec création sauvegarde."
+    fi
+    if ! mv -f "$target" "$SCRIPT_PATH"; then
+        error "Échec de l'installation de la mise à jour $version."
+        return 1
+    fi
+    success "Mise à jour $version installée: $SCRIPT_PATH (sauvegarde: $SCRIPT_PATH.bak)"
+}
 # --- Fin Fonction Update ---
 debug_log "Définition fonctions injectées OK."
 # --- Fin Fonctions conditionnelles ---
 
+# --- Extraction des segments ---
+# Étapes intermédiaires du pipeline d'extraction : déchiffrement et/ou décompression parallèle
+payload_filters() {
+    if %%BASH_ENCRYPTION_ENABLED_BOOL%%; then
+        if [ ${#DECOMPRESSOR[@]} -gt 0 ]; then
+            decrypt_stream | "${DECOMPRESSOR[@]}"
+        else
+            decrypt_stream
+        fi
+    else
+        "${DECOMPRESSOR[@]}"
+    fi
+}
+
+# Source du pipeline d'extraction : octets du segment $1, hachés au passage dans le fichier $2 si fourni
+segment_source() {
+    local entry="$1" sum_file="${2:-}"
+    if [ -n "$sum_file" ]; then
+        payload_segment_stream "$entry" | hash_tee "$sum_file"
+    else
+        payload_segment_stream "$entry"
+    fi
+}
+
+# Décompresse un segment dans $2 en un seul pipeline : lecture de la région Base64 | base64 -d
+# [| sha256] [| déchiffrement] [| décompresseur parallèle] | tar. Les étapes tournent en parallèle
+# et seuls les fichiers extraits sont écrits sur disque. Retourne 3 si --only ne correspond à aucun fichier.
+extract_segment() {
+    local entry="$1" dest="$2" seg_id checksum err_file sum_file=""
+    local -a codes=()
+    IFS='|' read -r seg_id _ _ checksum _ <<< "$entry"
+    err_file="$SEGMENTS_DIR/${seg_id}.err"
+    # En mode thin, fetch_segment a déjà vérifié le segment avant de le fournir
+    if [ "$VERIFY_PAYLOAD" -eq 1 ] && [ "$PAYLOAD_MODE" != "thin" ]; then
+        sum_file="$SEGMENTS_DIR/${seg_id}.sha256"
+    fi
+    
+    local -a tar_args=("$TAR_EXTRACT_FLAGS" - -C "$dest")
+    if [ -n "$ONLY_PATTERN" ]; then
+        # GNU tar n'interprète les jokers qu'avec --wildcards (bsdtar le fait par défaut)
+        [[ "$(tar --version 2>/dev/null || true)" == *"GNU tar"* ]] && tar_args+=(--wildcards)
+        tar_args+=(-- "$ONLY_PATTERN")
+    elif [ -f "$SEGMENTS_DIR/${seg_id}.members" ]; then
+        # Extraction incrémentale : seuls les fichiers listés par plan_incremental sont écrits
+        [[ "$(tar --help 2>/dev/null || true)" == *"--verbatim-files-from"* ]] && tar_args+=(--verbatim-files-from)
+        tar_args+=(-T "$SEGMENTS_DIR/${seg_id}.members")
+    fi
+    debug_log "Segment $seg_id: tar ${tar_args[*]}"
+    
+    # --timings : chaque étape note l'instant où elle se termine
+    local -a source_timer=() filters_timer=() tar_timer=()
+    if [ "$TIMINGS" -eq 1 ]; then
+        timing_now > "$SEGMENTS_DIR/${seg_id}.start"
+        source_timer=(timed_stage "$SEGMENTS_DIR/${seg_id}.decode")
+        filters_timer=(timed_stage "$SEGMENTS_DIR/${seg_id}.filters")
+        tar_timer=(timed_stage "$SEGMENTS_DIR/${seg_id}.untar")
+    fi
+    
+    # Codes de sortie de chaque étape (lecture, [filtres,] tar) via PIPESTATUS
+    if %%BASH_ENCRYPTION_ENABLED_BOOL%% || [ ${#DECOMPRESSOR[@]} -gt 0 ]; then
+        if ! "${source_timer[@]}" segment_source "$entry" "$sum_file" | "${filters_timer[@]}" payload_filters | "${tar_timer[@]}" tar "${tar_args[@]}" 2> "$err_file"; then
+            codes=("${PIPESTATUS[@]}")
+        fi
+    else
+        if ! "${source_timer[@]}" segment_source "$entry" "$sum_file" | "${tar_timer[@]}" tar "${tar_args[@]}" 2> "$err_file"; then
+            codes=("${PIPESTATUS[@]}")
+        fi
+    fi
+    
+    if [ ${#codes[@]} -gt 0 ]; then
+        local read_code="${codes[0]}" tar_code="${codes[${#codes[@]}-1]}" filter_code=0
+        [ ${#codes[@]} -eq 3 ] && filter_code="${codes[1]}"
+        debug_log "Segment $seg_id: codes pipeline ${codes[*]}"
+        
+        if [ "$tar_code" -ne 0 ]; then
+            if [ -n "$ONLY_PATTERN" ] && grep -q "Not found in archive" "$err_file"; then
+                debug_log "Segment $seg_id: aucun fichier pour '$ONLY_PATTERN'."
+                return 3
+            fi
+            # Un tar interrompu coupe le tube : les étapes amont échouent alors aussi (SIGPIPE)
+            error "Erreur: Tar échoué pour le segment $seg_id (code: $tar_code)."
+            cat "$err_file" >&2
+            return 1
+        fi
+        # tar peut s'arrêter après le bloc de fin d'archive : un SIGPIPE (141) amont est alors sans effet
+        if [ "$filter_code" -ne 0 ] && [ "$filter_code" -ne 141 ]; then
+            error "Erreur: Déchiffrement/décompression du segment $seg_id échoué (code: $filter_code)."
+            return 1
+        fi
+        if [ "$read_code" -ne 0 ] && [ "$read_code" -ne 141 ]; then
+            error "Erreur: Lecture du segment $seg_id échouée (code: $read_code)."
+            return 1
+        fi
+    fi
+    
+    # Vérification d'intégrité : SHA256 calculé pendant l'extraction, comparé à l'index
+    if [ -n "$sum_file" ]; then
+        local waited=0 actual=""
+        while [ ! -s "$sum_file" ] && [ $waited -lt 50 ]; do sleep 0.1; waited=$((waited + 1)); done
+        actual=$(cat "$sum_file" 2>/dev/null || true)
+        if [ "$actual" != "$checksum" ]; then
+            error "Erreur: Intégrité du segment $seg_id invalide (SHA256 attendu ${checksum:0:16}..., obtenu ${actual:0:16}...)."
+            return 1
+        fi
+        debug_log "Segment $seg_id: SHA256 vérifié."
+    fi
+    return 0
+}
+
+# Extrait les segments donnés en parallèle (NVBUILDER_JOBS processus au plus) dans $1.
+# Retourne 3 si aucun segment ne contenait de fichier correspondant à --only.
+extract_payload_segments() {
+    local dest="$1"; shift
+    local max_jobs="${NVBUILDER_JOBS:-}" entry pid rc found=0 failed=0
+    [ -z "$max_jobs" ] && max_jobs=$(nproc 2>/dev/null || getconf _NPROCESSORS_ONLN 2>/dev/null || echo 2)
+    [[ "$max_jobs" =~ ^[1-9][0-9]*$ ]] || max_jobs=1
+    debug_log "Extraction de $# segment(s), $max_jobs tâche(s) simultanée(s)."
+    
+    local -a pids=()
+    for entry in "$@"; do
+        # File d'attente FIFO : attendre la plus ancienne tâche quand toutes les places sont prises
+        if [ "${#pids[@]}" -ge "$max_jobs" ]; then
+            rc=0; wait "${pids[0]}" || rc=$?
+            pids=("${pids[@]:1}")
+            case $rc in 0) found=1 ;; 3) ;; *) failed=1 ;; esac
+        fi
+        extract_segment "$entry" "$dest" &
+        pids+=("$!")
+    done
+    for pid in "${pids[@]}"; do
+        rc=0; wait "$pid" || rc=$?
+        case $rc in 0) found=1 ;; 3) ;; *) failed=1 ;; esac
+    done
+    
+    [ $failed -eq 0 ] || return 1
+    [ $found -eq 1 ] || return 3
+    return 0
+}
+
+# Extrait les segments sélectionnés dans $1 : les $2 premiers (contenu commun) puis les suivants
+# (plateforme), qui complètent ou remplacent le contenu commun.
+# Retourne 3 si aucun fichier ne correspond à --only, 1 en cas d'échec.
+extract_selection() {
+    local dest="$1" common_count="$2"; shift 2
+    local -a common=("${@:1:common_count}") platform=("${@:common_count+1}")
+    local extract_code=3 group_code
+    if [ ${#common[@]} -gt 0 ]; then
+        group_code=0; extract_payload_segments "$dest" "${common[@]}" || group_code=$?
+        [ $group_code -ne 3 ] && extract_code=$group_code
+    fi
+    if [ ${#platform[@]} -gt 0 ] && { [ $extract_code -eq 0 ] || [ $extract_code -eq 3 ]; }; then
+        [ "$DEBUG_MODE" -eq 1 ] && info "Segments ${TARGET_PLATFORM}..."
+        group_code=0; extract_payload_segments "$dest" "${platform[@]}" || group_code=$?
+        [ $group_code -ne 3 ] && extract_code=$group_code
+    fi
+    return $extract_code
+}
+
+# Affiche la racine du cache d'extraction (créée si besoin) ; échoue si elle n'est pas accessible
+extract_cache_root() {
+    local root="${NVBUILDER_EXTRACT_CACHE_DIR:-${XDG_CACHE_HOME:-/var/cache}/nvbuilder/extract}"
+    if mkdir -p "$root" 2>/dev/null && [ -w "$root" ]; then
+        echo "$root"
+        return 0
+    fi
+    # /var/cache n'est en général accessible qu'à root : repli sur le cache de l'utilisateur
+    [ -n "${NVBUILDER_EXTRACT_CACHE_DIR:-}${XDG_CACHE_HOME:-}" ] && return 1
+    root="$HOME/.cache/nvbuilder/extract"
+    mkdir -p "$root" 2>/dev/null && [ -w "$root" ] || return 1
+    echo "$root"
+}
+
+# Verrou du cache ($1 = -s partagé pour lire une entrée, -x exclusif pour la créer ou évincer)
+extract_cache_lock() {
+    if ! command -v flock >/dev/null 2>&1; then
+        debug_log "flock absent : cache d'extraction sans verrou (création atomique uniquement)."
+        return 0
+    fi
+    exec 9> "$EXTRACT_CACHE_ROOT/.lock"
+    flock "$1" 9
+}
+
+extract_cache_unlock() {
+    exec 9>&- 2>/dev/null || true
+}
+
+# Supprime les entrées les moins récemment utilisées tant que le cache dépasse EXTRACT_CACHE_MAX_MB
+# (0 : pas de limite). L'entrée $1 (celle qui vient d'être créée) est conservée.
+extract_cache_evict() {
+    local keep="$1" entry total=0 i
+    [ "$EXTRACT_CACHE_MAX_MB" -gt 0 ] || return 0
+    local -a entries=() sizes=()
+    while IFS= read -r entry; do
+        entry="${entry%/}"
+        entries+=("$entry")
+        sizes+=("$(du -sk "$entry" 2>/dev/null | cut -f1)")
+    done < <(ls -1dtr "$EXTRACT_CACHE_ROOT"/*/ 2>/dev/null || true)
+    for i in "${!entries[@]}"; do total=$((total + ${sizes[$i]:-0})); done
+    for i in "${!entries[@]}"; do
+        [ $total -le $((EXTRACT_CACHE_MAX_MB * 1024)) ] && break
+        [ "${entries[$i]}" = "$keep" ] && continue
+        debug_log "Cache: éviction de ${entries[$i]} (${sizes[$i]:-0} Ko)"
+        rm -rf "${entries[$i]}"
+        total=$((total - ${sizes[$i]:-0}))
+    done
+}
+
+# Copie peu coûteuse de $1 vers $2 : reflink (copie à l'écriture) si le système de fichiers le
+# permet, sinon copie complète. Pas de liens physiques : le script post-extraction pourrait
+# modifier les fichiers du cache.
+copy_from_cache() {
+    local src="$1" dest="$2"
+    if cp -a --reflink=always "$src/." "$dest/" 2>/dev/null; then
+        debug_log "Cache: copie reflink '$src' -> '$dest'"
+        return 0
+    fi
+    debug_log "Cache: reflink impossible, copie de '$src' vers '$dest'."
+    cp -a "$src/." "$dest/" 2>/dev/null || { (cd "$src" && tar cf - .) | (cd "$dest" && tar xpf -); }
+}
+
+# Extraction via le cache : l'entrée <ARCHIVE_CHECKSUM>[-<plateforme>] est créée au premier passage
+# (extraction dans un dossier temporaire renommé atomiquement), puis son contenu est copié dans $1.
+# Arguments suivants : ceux d'extract_selection.
+extract_with_cache() {
+    local dest="$1"; shift
+    local key cache_entry code=0
+    key="$ARCHIVE_CHECKSUM"
+    [ -n "$PAYLOAD_PLATFORMS" ] && key="${key}-${TARGET_PLATFORM}"
+    cache_entry="$EXTRACT_CACHE_ROOT/$key"
+    
+    extract_cache_lock -s
+    if [ -d "$cache_entry" ]; then
+        [ "$DEBUG_MODE" -eq 1 ] && info "Contenu trouvé dans le cache d'extraction : ${DETAIL_COLOR}$cache_entry${RESET_STYLE}"
+    else
+        # Verrou exclusif : une autre exécution a pu créer l'entrée entre-temps
+        extract_cache_unlock
+        extract_cache_lock -x
+        if [ ! -d "$cache_entry" ]; then
+            EXTRACT_CACHE_TMP="$EXTRACT_CACHE_ROOT/.tmp.${key}.$$"
+            rm -rf "$EXTRACT_CACHE_TMP"
+            if ! mkdir -p "$EXTRACT_CACHE_TMP"; then
+                extract_cache_unlock
+                return 1
+            fi
+            extract_selection "$EXTRACT_CACHE_TMP" "$@" || code=$?
+            if [ $code -eq 0 ] && ! mv "$EXTRACT_CACHE_TMP" "$cache_entry"; then
+                error "Erreur: Création de l'entrée de cache '$cache_entry' échouée."
+                code=1
+            fi
+            if [ $code -ne 0 ]; then
+                rm -rf "$EXTRACT_CACHE_TMP"; EXTRACT_CACHE_TMP=""
+                extract_cache_unlock
+                return $code
+            fi
+            EXTRACT_CACHE_TMP=""
+            debug_log "Cache: entrée créée $cache_entry"
+            extract_cache_evict "$cache_entry"
+        fi
+    fi
+    touch "$cache_entry" 2>/dev/null || true
+    copy_from_cache "$cache_entry" "$dest" || code=1
+    extract_cache_unlock
+    return $code
+}
+
+# Écrit sur stdout le manifeste des fichiers, une ligne 'segment|taille|mode|sha256|chemin' par fichier
+# (ordre des segments : contenu commun puis plateformes). Seule la petite région du manifeste est lue.
+manifest_stream() {
+    [ "$MANIFEST_LENGTH" -gt 0 ] || return 0
+    if [ -z "$PAYLOAD_BASE" ]; then
+        locate_payload || return 1
+    fi
+    read_payload_region 0 "$MANIFEST_LENGTH" | base64 -d | gzip -dc
+}
+
+# Affiche les entrées du manifeste appartenant aux segments donnés (une entrée plus tardive
+# remplace un même chemin)
+selected_manifest() {
+    local entry seg_id ids=" "
+    for entry in "$@"; do
+        IFS='|' read -r seg_id _ <<< "$entry"
+        ids+="$seg_id "
+    done
+    manifest_stream | awk -F'|' -v ids="$ids" 'index(ids, " " $1 " ") > 0'
+}
+
+# --list [MOTIF] : affiche taille, SHA256 et chemin des fichiers du manifeste, sans lire les segments.
+# Le motif accepte '*' et '?' (comme --only) ; un répertoire désigne tout son contenu.
+# Retourne 1 si aucun fichier ne correspond.
+list_contents() {
+    local regex="" platforms="" entry seg_id seg_platform
+    if [ "$MANIFEST_LENGTH" -eq 0 ]; then
+        error "Erreur: Aucun manifeste des fichiers dans ce script (payload chiffré)."
+        return 1
+    fi
+    if [ -n "$LIST_PATTERN" ]; then
+        # Motif -> expression régulière étendue : caractères spéciaux échappés, puis jokers
+        regex=$(printf '%s' "${LIST_PATTERN#./}" | sed -e 's/[].[^$\\+(){}|]/\\&/g' -e 's/\*/.*/g' -e 's/?/./g')
+        regex="^${regex%/}(/.*)?\$"
+    fi
+    if [ -n "$PAYLOAD_PLATFORMS" ]; then
+        for entry in "${PAYLOAD_SEGMENTS[@]}"; do
+            IFS='|' read -r seg_id _ _ _ _ seg_platform _ <<< "$entry"
+            platforms+="$seg_id=${seg_platform:-commun} "
+        done
+    fi
+    # Valeurs passées par l'environnement : awk -v interpréterait les barres obliques inverses
+    manifest_stream | LIST_REGEX="$regex" LIST_PLATFORMS="$platforms" awk -F'|' '
+        BEGIN {
+            re = ENVIRON["LIST_REGEX"]
+            n = split(ENVIRON["LIST_PLATFORMS"], pairs, " ")
+            for (i = 1; i <= n; i++) { split(pairs[i], kv, "="); plat[kv[1]] = kv[2] }
+        }
+        {
+            p = substr($0, length($1 $2 $3 $4) + 5)
+            if (re != "" && p !~ re) next
+            if (n > 0) printf "%12.0f  %-64s  [%s] %s\n", $2, $4, plat[$1], p
+            else printf "%12.0f  %-64s  %s\n", $2, $4, p
+            count++; total += $2
+        }
+        END {
+            printf "%d fichier(s), %.0f octets\n", count, total | "cat 1>&2"
+            exit (count > 0 ? 0 : 1)
+        }'
+}
+
+# Affiche 'type|taille|mode|chemin' pour chaque chemin (séparés par NUL sur l'entrée standard,
+# relatifs à $1) qui existe ; les liens symboliques ne sont pas suivis
+stat_files() {
+    local dir="$1"
+    if stat -c '%s' / >/dev/null 2>&1; then
+        (cd "$dir" && xargs -0 stat -c '%F|%s|%a|%n' -- 2>/dev/null) || true
+    else
+        (cd "$dir" && xargs -0 stat -f '%HT|%z|%Lp|%N' -- 2>/dev/null) || true
+    fi
+}
+
+# Affiche 'sha256  chemin' pour chaque chemin (séparés par NUL sur l'entrée standard, relatifs à $1)
+hash_files() {
+    local dir="$1" path
+    if command -v sha256sum &>/dev/null; then
+        (cd "$dir" && xargs -0 sha256sum -- 2>/dev/null) || true
+    elif command -v shasum &>/dev/null; then
+        (cd "$dir" && xargs -0 shasum -a 256 -- 2>/dev/null) || true
+    else
+        while IFS= read -r -d '' path; do
+            printf '%s  %s\n' "$(sha256_file "$dir/$path")" "$path"
+        done
+    fi
+}
+
+# Extraction incrémentale vers $1 : compare le manifeste des segments suivants ($SEGMENTS_DIR/manifest,
+# écrit au préalable) aux fichiers existants (type, taille et mode, puis SHA256) et écrit pour chaque
+# segment la liste des fichiers à réécrire ($SEGMENTS_DIR/<id>.members, absente si tout le segment
+# est à extraire). Définit INCR_KEEP (identifiants des segments à extraire), INCR_WRITTEN et INCR_SKIPPED.
+plan_incremental() {
+    local dest="$1"; shift
+    local manifest="$SEGMENTS_DIR/manifest" mask seg_id changed total
+    # Sans root, tar applique l'umask aux permissions extraites
+    mask=$(umask)
+    [ "$(id -u)" -eq 0 ] && mask=0
+    
+    # 1. Fichiers existants dont le type, la taille et le mode correspondent : seuls ceux-là sont hachés
+    cut -d'|' -f5- "$manifest" | tr '\n' '\0' | stat_files "$dest" > "$SEGMENTS_DIR/stat"
+    awk -F'|' -v mask="$mask" '
+        function oct(s,   i, n) { n = 0; for (i = 1; i <= length(s); i++) n = n * 8 + substr(s, i, 1); return n }
+        function andnot(a, b,   r, bit) {
+            r = 0; bit = 1
+            while (a > 0) { if (a % 2 == 1 && b % 2 == 0) r += bit; a = int(a / 2); b = int(b / 2); bit *= 2 }
+            return r
+        }
+        FNR == NR { p = substr($0, length($1 $2 $3 $4) + 5); size[p] = $2; mode[p] = $3; sum[p] = $4; next }
+        {
+            p = substr($0, length($1 $2 $3) + 4)
+            if (!(p in size) || sum[p] == "symlink" || tolower($1) !~ /^regular/) next
+            if ($2 == size[p] && oct($3) == andnot(oct(mode[p]), oct(mask))) print p
+        }' "$manifest" "$SEGMENTS_DIR/stat" | tr '\n' '\0' | hash_files "$dest" > "$SEGMENTS_DIR/hashes"
+    
+    # 2. Fichiers modifiés, répartis par segment (un chemin présent plusieurs fois ne compte qu'une fois)
+    rm -f "$SEGMENTS_DIR"/*.members
+    INCR_KEEP=" "; INCR_WRITTEN=0; INCR_SKIPPED=0; INCR_BYTES=0
+    while read -r seg_id changed total; do
+        if [ "$seg_id" = "skipped" ]; then
+            INCR_SKIPPED=$changed
+            continue
+        elif [ "$seg_id" = "bytes" ]; then
+            INCR_BYTES=$changed
+            continue
+        fi
+        INCR_WRITTEN=$((INCR_WRITTEN + changed))
+        if [ "$changed" -gt 0 ]; then
+            INCR_KEEP+="$seg_id "
+        fi
+        # Segment entièrement modifié : extraction complète, sans liste
+        if [ "$changed" -eq "$total" ]; then
+            rm -f "$SEGMENTS_DIR/${seg_id}.members"
+        fi
+    done < <(awk -F'|' -v hashes="$SEGMENTS_DIR/hashes" -v dir="$SEGMENTS_DIR" '
+        BEGIN {
+            while ((getline line < hashes) > 0) {
+                # sha256sum échappe les chemins contenant une barre oblique inverse : ils sont réécrits
+                if (substr(line, 1, 1) != "\\") h[substr(line, 67)] = substr(line, 1, 64)
+            }
+        }
+        FNR == 1 { pass++ }
+        pass == 1 { p = substr($0, length($1 $2 $3 $4) + 5); last[p] = FNR; total[$1]++; next }
+        {
+            p = substr($0, length($1 $2 $3 $4) + 5)
+            if (last[p] != FNR) next
+            expected = ($4 == "empty_file") ? "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855" : $4
+            if ((p in h) && h[p] == expected) { skipped++; next }
+            changed[$1]++; bytes += $2
+            print p > (dir "/" $1 ".members")
+        }
+        END {
+            for (s in total) print s, changed[s] + 0, total[s]
+            print "skipped", skipped + 0, 0
+            printf "bytes %.0f 0\n", bytes
+        }' "$manifest" "$manifest")
+    debug_log "Incrémental: segments à extraire [${INCR_KEEP}], $INCR_WRITTEN fichier(s) à écrire, $INCR_SKIPPED inchangé(s)."
+}
+
+# Supprime de $1 les fichiers et liens absents de $SEGMENTS_DIR/manifest (hors répertoires de travail
+# .nvb_temp_*), puis les répertoires devenus vides. Définit INCR_REMOVED.
+delete_removed_files() {
+    local dest="$1" path dir
+    INCR_REMOVED=0
+    while IFS= read -r path; do
+        rm -f -- "$dest/$path" || continue
+        INCR_REMOVED=$((INCR_REMOVED + 1))
+        dir="$path"
+        while [[ "$dir" == */* ]]; do
+            dir="${dir%/*}"
+            rmdir -- "$dest/$dir" 2>/dev/null || break
+        done
+    done < <(cd "$dest" && find . -path './.nvb_temp_*' -prune -o \( -type f -o -type l \) -print | \
+        awk -F'|' 'FNR == NR { keep[substr($0, length($1 $2 $3 $4) + 5)] = 1; next }
+                   { p = substr($0, 3); if (!(p in keep)) print p }' "$SEGMENTS_DIR/manifest" -)
+    debug_log "Incrémental: $INCR_REMOVED fichier(s) supprimé(s)."
+}
+
+# Affiche l'heure courante en millisecondes (précision à la seconde si date ne gère pas %N)
+now_ms() {
+    local t
+    t=$(date +%s%3N 2>/dev/null || true)
+    [[ "$t" =~ ^[0-9]+$ ]] || t="$(date +%s)000"
+    echo "$t"
+}
+
+# Horodatage en millisecondes pour --timings : horloge monotone (/proc/uptime, au centième
+# de seconde), insensible aux corrections d'heure (NTP) ; sans /proc, heure système
+# (EPOCHREALTIME de bash 5, sinon date). Les durées sont des différences entre deux horodatages
+timing_now() {
+    local up=""
+    if [ -r /proc/uptime ]; then
+        read -r up _ < /proc/uptime 2>/dev/null || up=""
+    fi
+    if [[ "$up" =~ ^([0-9]+)[.,]([0-9]{2}) ]]; then
+        echo $(( 10#${BASH_REMATCH[1]} * 1000 + 10#${BASH_REMATCH[2]} * 10 ))
+    elif [ -n "${EPOCHREALTIME:-}" ]; then
+        local t="${EPOCHREALTIME/[.,]/}"
+        echo $((10#$t / 1000))
+    else
+        now_ms
+    fi
+}
+
+# Début de phase (sans effet si --timings n'est pas actif)
+timing_start() {
+    [ "$TIMINGS" -eq 1 ] || return 0
+    TIMING_T0=$(timing_now)
+}
+
+# Fin de la phase démarrée par timing_start : $1 = nom, $2 = octets traités (optionnel)
+timing_end() {
+    [ "$TIMINGS" -eq 1 ] || return 0
+    TIMING_NAMES+=("$1")
+    TIMING_MS+=($(( $(timing_now) - TIMING_T0 )))
+    TIMING_BYTES+=("${2:-0}")
+}
+
+# Exécute "$@" (étape d'un pipeline) et écrit l'horodatage de sa fin dans le fichier $1
+timed_stage() {
+    local stamp_file="$1" rc=0; shift
+    "$@" || rc=$?
+    timing_now > "$stamp_file"
+    return $rc
+}
+
+# Relève les horodatages écrits par extract_segment pour les segments donnés (avant la suppression
+# de SEGMENTS_DIR) : 'id|octets|décodage|filtres|tar' en ms depuis le début du segment (-1 si absent)
+timing_collect_segments() {
+    [ "$TIMINGS" -eq 1 ] || return 0
+    local entry seg_id size start stage value
+    for entry in "$@"; do
+        IFS='|' read -r seg_id _ _ _ size _ <<< "$entry"
+        start=$(cat "$SEGMENTS_DIR/${seg_id}.start" 2>/dev/null || true)
+        [ -n "$start" ] || continue
+        local record="$seg_id|$size"
+        for stage in decode filters untar; do
+            value=$(cat "$SEGMENTS_DIR/${seg_id}.${stage}" 2>/dev/null || true)
+            if [ -n "$value" ]; then record+="|$((value - start))"; else record+="|-1"; fi
+        done
+        TIMING_SEGMENTS+=("$record")
+    done
+}
+
+# Affiche le débit en Mo/s (une décimale) pour $1 octets en $2 ms
+timing_rate() {
+    local ms="$2" rate
+    [ "$ms" -gt 0 ] || ms=1
+    rate=$(( $1 * 10000 / 1048576 / ms ))
+    echo "$((rate / 10)).$((rate % 10))"
+}
+
+# Résumé des phases sur la sortie d'erreur et, si demandé, fichier JSON (appelé une seule fois, à la sortie)
+timing_report() {
+    [ "$TIMINGS" -eq 1 ] && [ "$TIMING_REPORTED" -eq 0 ] && [ ${#TIMING_NAMES[@]} -gt 0 ] || return 0
+    TIMING_REPORTED=1
+    local i total seg_id size decode filters untar filters_label="décompression" json sep=""
+    %%BASH_ENCRYPTION_ENABLED_BOOL%% && filters_label="déchiffrement"
+    total=$(( $(timing_now) - TIMING_START ))
+    {
+        echo -e "${HEADER_COLOR}${HIGHLIGHT_STYLE}Durées des phases (ms) :${RESET_STYLE}"
+        for i in "${!TIMING_NAMES[@]}"; do
+            if [ "${TIMING_BYTES[$i]}" -gt 0 ]; then
+                printf '  %-14s %8d ms  %12d octets  %7s Mo/s\n' "${TIMING_NAMES[$i]}" "${TIMING_MS[$i]}" "${TIMING_BYTES[$i]}" "$(timing_rate "${TIMING_BYTES[$i]}" "${TIMING_MS[$i]}")"
+            else
+                printf '  %-14s %8d ms\n' "${TIMING_NAMES[$i]}" "${TIMING_MS[$i]}"
+            fi
+        done
+        # Décodage, déchiffrement/décompression et tar s'exécutent en parallèle : instant de fin de
+        # chaque étape depuis le début du segment
+        for i in "${TIMING_SEGMENTS[@]}"; do
+            IFS='|' read -r seg_id size decode filters untar <<< "$i"
+            printf '    segment %-5s %12d octets  décodage %d ms' "$seg_id" "$size" "$decode"
+            [ "$filters" -ge 0 ] && printf ', %s %d ms' "$filters_label" "$filters"
+            printf ', tar %d ms (%s Mo/s)\n' "$untar" "$(timing_rate "$size" "$untar")"
+        done
+        printf '  %-14s %8d ms\n' "total" "$total"
+    } >&2
+    
+    [ -n "$TIMINGS_JSON" ] || return 0
+    json="{\"script\": \"$SCRIPT_NAME\", \"build_version\": \"$BUILD_VERSION\", \"total_ms\": $total, \"phases\": ["
+    for i in "${!TIMING_NAMES[@]}"; do
+        json+="$sep{\"name\": \"${TIMING_NAMES[$i]}\", \"ms\": ${TIMING_MS[$i]}, \"bytes\": ${TIMING_BYTES[$i]}}"
+        sep=", "
+    done
+    json+="], \"segments\": ["; sep=""
+    for i in "${TIMING_SEGMENTS[@]}"; do
+        IFS='|' read -r seg_id size decode filters untar <<< "$i"
+        json+="$sep{\"id\": $seg_id, \"bytes\": $size, \"decode_ms\": $decode, \"filters_ms\": $filters, \"untar_ms\": $untar}"
+        sep=", "
+    done
+    json+="]}"
+    if printf '%s\n' "$json" > "$TIMINGS_JSON"; then
+        detail "Mesures écrites dans '$TIMINGS_JSON'." >&2
+    else
+        warning "Écriture de '$TIMINGS_JSON' impossible."
+    fi
+}
+
+# Pipeline de --selftest pour le segment $1 : octets du segment (en mode thin, téléchargés en flux
+# sans passer par le cache) | sha256 sur le descripteur 3 | [déchiffrement] [| décompresseur] | tar -t.
+# En cas d'échec, les codes de sortie des étapes sont écrits sur le descripteur 3.
+selftest_pipeline() {
+    local entry="$1" offset length checksum list_flags="${TAR_EXTRACT_FLAGS/x/t}"
+    IFS='|' read -r _ offset length checksum _ <<< "$entry"
+    if [ "$PAYLOAD_MODE" = "thin" ]; then
+        local url="${NVBUILDER_PAYLOAD_URL:-$PAYLOAD_URL}"
+        if %%BASH_ENCRYPTION_ENABLED_BOOL%% || [ ${#DECOMPRESSOR[@]} -gt 0 ]; then
+            download_stream "${url%/}/${checksum}.seg" | tee >(sha256_stream | sed 's/^/sha256:/' >&3) | payload_filters | tar "$list_flags" - > /dev/null \
+                || echo "codes:${PIPESTATUS[*]}" >&3
+        else
+            download_stream "${url%/}/${checksum}.seg" | tee >(sha256_stream | sed 's/^/sha256:/' >&3) | tar "$list_flags" - > /dev/null \
+                || echo "codes:${PIPESTATUS[*]}" >&3
+        fi
+    elif %%BASH_ENCRYPTION_ENABLED_BOOL%% || [ ${#DECOMPRESSOR[@]} -gt 0 ]; then
+        read_payload_region "$offset" "$length" | base64 -d | tee >(sha256_stream | sed 's/^/sha256:/' >&3) | payload_filters | tar "$list_flags" - > /dev/null \
+            || echo "codes:${PIPESTATUS[*]}" >&3
+    else
+        read_payload_region "$offset" "$length" | base64 -d | tee >(sha256_stream | sed 's/^/sha256:/' >&3) | tar "$list_flags" - > /dev/null \
+            || echo "codes:${PIPESTATUS[*]}" >&3
+    fi
+}
+
+# --selftest : vérifie chaque segment (toutes plateformes) en flux, sans fichier temporaire et en
+# mémoire constante ; affiche le débit par segment et au total. Retourne 1 si un segment est invalide.
+run_selftest() {
+    local entry seg_id checksum size out actual codes start elapsed rate failed=0 total_bytes=0 total_ms=0
+    header "Autotest du payload (${SEGMENT_COUNT} segment(s))"
+    if [ "$PAYLOAD_MODE" != "thin" ]; then
+        locate_payload || return 1
+    fi
+    if %%BASH_ENCRYPTION_ENABLED_BOOL%%; then
+        prompt_decryption_password "${PAYLOAD_SEGMENTS[0]}"
+    fi
+    select_decompressor
+    
+    for entry in "${PAYLOAD_SEGMENTS[@]}"; do
+        IFS='|' read -r seg_id _ _ checksum size _ <<< "$entry"
+        start=$(now_ms)
+        # La sortie capturée ne contient que le SHA256 et, en cas d'échec, les codes du pipeline
+        out=$(selftest_pipeline "$entry" 3>&1)
+        elapsed=$(( $(now_ms) - start ))
+        [ "$elapsed" -gt 0 ] || elapsed=1
+        actual=$(printf '%s\n' "$out" | sed -n 's/^sha256://p')
+        codes=$(printf '%s\n' "$out" | sed -n 's/^codes://p')
+        # Débit en Mo/s (payload décodé), avec une décimale
+        rate=$(( size * 10000 / 1048576 / elapsed ))
+        rate="$((rate / 10)).$((rate % 10))"
+        if [ -n "$codes" ]; then
+            error "  Segment $seg_id : ÉCHEC (codes pipeline: $codes)"
+            failed=$((failed + 1))
+        elif [ "$actual" != "$checksum" ]; then
+            error "  Segment $seg_id : ÉCHEC (SHA256 attendu ${checksum:0:16}..., obtenu ${actual:0:16}...)"
+            failed=$((failed + 1))
+        else
+            success "  Segment $seg_id : OK ($size octets, ${elapsed} ms, ${rate} Mo/s)"
+        fi
+        total_bytes=$((total_bytes + size)); total_ms=$((total_ms + elapsed))
+    done
+    
+    rate=$(( total_bytes * 10000 / 1048576 / (total_ms > 0 ? total_ms : 1) ))
+    rate="$((rate / 10)).$((rate % 10))"
+    if [ $failed -gt 0 ]; then
+        error "Autotest ÉCHOUÉ : $failed segment(s) invalide(s) sur ${SEGMENT_COUNT}."
+        return 1
+    fi
+    success "Autotest RÉUSSI : ${SEGMENT_COUNT} segment(s), $total_bytes octets en ${total_ms} ms (${rate} Mo/s, ${DECOMPRESSOR_LABEL})."
+    return 0
+}
+
+# Déplace le contenu extrait de $1 vers $2 (liens physiques si possible, sinon copie)
+commit_staged_extraction() {
+    local src="$1" dest="$2"
+    if cp -al --remove-destination "$src/." "$dest/" 2>/dev/null; then
+        return 0
+    fi
+    debug_log "Liens physiques impossibles, copie de '$src' vers '$dest'."
+    (cd "$src" && tar cf - .) | (cd "$dest" && tar xpf -)
+}
+debug_log "Définition fonctions extraction OK."
+
 debug_log "<<< Juste avant définition main() >>>"
 
 # --- Fonction principale ---
 function main {
+    # --list : sortie brute (exploitable par grep/awk), sans bannière
+    if [ "$LIST_CONTENTS" -eq 1 ]; then
+        get_script_path
+        list_contents
+        exit $?
+    fi
     echo -e "${INFO_COLOR}${HIGHLIGHT_STYLE}Démarrage de ${HIGHLIGHT_STYLE}${SCRIPT_NAME}${RESET} v${HIGHLIGHT_STYLE}%%BUILD_VERSION%%${RESET}"
     debug_log "Entrée dans main()..."
     get_script_path
@@ -664,11 +2374,14 @@ function main {
     
     # Définir les variables d'environnement immédiatement pour éviter les erreurs
     # Ces variables sont cruciales pour le fonctionnement du script et la gestion des erreurs
-    local WORK_DIR="" EXTRACT_DEST="" need_intermediate_temp=0
+    # (globales et non locales : cleanup() s'exécute aussi après le retour de main)
+    WORK_DIR=""; EXTRACT_DEST=""
+    local need_intermediate_temp=0
     export WORK_DIR EXTRACT_DEST
     
     # Installer le gestionnaire après avoir défini les variables cruciales
     trap cleanup EXIT TERM INT
+    [ "$TIMINGS" -eq 1 ] && TIMING_START=$(timing_now)
 
     # Afficher la bannière au début
     if [ "$SHOW_INFO" -eq 0 ]; then
@@ -689,16 +2402,30 @@ function main {
         display_info
         exit 0
     fi
+    
+    if [ "$SELFTEST" -eq 1 ]; then
+        run_selftest
+        exit $?
+    fi
 
     # Vérification explicite et visible des mises à jour
     debug_log "Appel vérification MàJ (si activé)..."
     if %%BASH_UPDATE_ENABLED_BOOL%%; then
         [ "$DEBUG_MODE" -eq 1 ] && update_info "Vérification des mises à jour activée..."
         if [ "$NO_UPDATE_CHECK" -eq 0 ]; then
-            if type check_for_updates_and_download_if_needed >/dev/null 2>&1; then
-                check_for_updates_and_download_if_needed "$@"
-            else
+            if ! type check_for_updates_and_download_if_needed >/dev/null 2>&1; then
                 [ "$DEBUG_MODE" -eq 1 ] && warning "Avertissement: Fonction de mise à jour non disponible."
+            elif [ "$UPDATE_BACKGROUND" = "true" ]; then
+                # Mise à jour préparée lors d'une exécution précédente : installation puis relance
+                if install_staged_update; then
+                    echo -e "${SUCCESS_COLOR}Relance du script avec la nouvelle version...${RESET_STYLE}"
+                    exec "$SCRIPT_PATH" --no-update-check ${SCRIPT_ARGS[@]+"${SCRIPT_ARGS[@]}"}
+                fi
+                start_background_update "$@"
+            else
+                timing_start
+                check_for_updates_and_download_if_needed "$@"
+                timing_end "update"
             fi
         else
             [ "$DEBUG_MODE" -eq 1 ] && warning "Vérification des mises à jour désactivée par option --no-update-check."
@@ -707,28 +2434,34 @@ function main {
         debug_log "Mises à jour HTTP désactivées dans la configuration."
     fi
 
+    # Espace nécessaire au contenu de la plateforme cible (contrôlé avant tout décodage)
+    detect_platform || exit 1
+    local content_bytes content_files need_kb
+    read -r content_bytes content_files <<< "$(content_size)"
+    need_kb=$(space_needed_kb "$content_bytes" "$content_files")
+    
     # Initialisation des répertoires de travail
     if [ -n "$TARGET_DIR" ]; then
         local target_dir_resolved
         if [[ "$TARGET_DIR" != /* ]]; then target_dir_resolved="$PWD/$TARGET_DIR"; else target_dir_resolved="$TARGET_DIR"; fi
         if ! mkdir -p "$target_dir_resolved"; then error "Erreur: Création dossier cible '$target_dir_resolved' échouée."; exit 1; fi
         EXTRACT_DEST=$(cd "$target_dir_resolved" && pwd)
+        # Zone intermédiaire dans la cible : le transfert final se fait par liens physiques, sans copie.
+        # En extraction incrémentale, l'espace est contrôlé après la comparaison (fichiers modifiés seulement).
+        if [ -z "$ONLY_PATTERN" ] && { [ "$MANIFEST_LENGTH" -eq 0 ] || [ "$INCREMENTAL" -eq 0 ]; }; then
+            require_free_space "$EXTRACT_DEST" "$need_kb" "l'extraction"
+        fi
         if ! WORK_DIR=$(mktemp -d "${EXTRACT_DEST}/.nvb_temp_XXXXXX"); then error "Erreur: Création temp dans '$EXTRACT_DEST' échouée."; exit 1; fi
         [ "$DEBUG_MODE" -eq 1 ] && info "Extraction vers '${DETAIL_COLOR}$EXTRACT_DEST${RESET_STYLE}' (via '${DEBUG_COLOR}$WORK_DIR${RESET_STYLE}')..."
         need_intermediate_temp=1
     elif [ "$EXTRACT_ONLY" -eq 1 ]; then
         local ts; ts=$(date +%Y%m%d_%H%M%S); local base; base="${SCRIPT_NAME%.sh}"; local ed; ed="./${base}_ext_${ts}_$$"
+        [ -n "$ONLY_PATTERN" ] || require_free_space "$PWD" "$need_kb" "l'extraction"
         if ! mkdir -p "$ed"; then error "Erreur: Création dossier extract '$ed' échouée."; exit 1; fi
-        EXTRACT_DEST=$(cd "$ed" && pwd); WORK_DIR="$EXTRACT_DEST"
+        EXTRACT_DEST=$(cd "$ed" && pwd); WORK_DIR="$EXTRACT_DEST"; EXTRACT_DEST_CREATED=1
         info "Extraction seule vers : ${DETAIL_COLOR}$EXTRACT_DEST${RESET_STYLE}"
     else
-        if ! WORK_DIR=$(mktemp -d "/tmp/nvb_${SCRIPT_NAME}_$.XXXXXX"); then 
-            warning "Avert: Création temp /tmp échouée, essai PWD..."
-            if ! WORK_DIR=$(mktemp -d "./nvb_temp_$.XXXXXX"); then 
-                error "Erreur: Création temp PWD échouée."
-                exit 1
-            fi
-        fi
+        create_work_dir "$need_kb" || exit 1
         EXTRACT_DEST="$WORK_DIR"
         [ "$DEBUG_MODE" -eq 1 ] && info "Extraction vers temp : ${DETAIL_COLOR}$WORK_DIR${RESET_STYLE}"
     fi
@@ -737,103 +2470,117 @@ function main {
     export WORK_DIR EXTRACT_DEST
     debug_log "WORK_DIR='$WORK_DIR', EXTRACT_DEST='$EXTRACT_DEST'"
 
-    # Recherche du marqueur d'archive
-    debug_log "Recherche marqueur..."
-    local archive_start_line
-    archive_start_line=$(find_archive_marker_line)
-    if [ -z "$archive_start_line" ]; then 
-        error "Erreur: Marqueur unique non trouvé ('# NVBUILDER_MARKER_LINE: $SCRIPT_MARKER_VALUE')."
-        exit 1
-    fi
-    local data_start_line=$((archive_start_line + 1))
-    debug_log "Marqueur trouvé: L$archive_start_line. Données: L$data_start_line."
-
-    # Extraction des données base64
-    debug_log "Préparation extraction B64..."
-    [ "$DEBUG_MODE" -eq 1 ] && info "Extraction B64 interne..."
-    local awk_output_file="$WORK_DIR/awk_output.tmp"
-    debug_log "Commande awk: awk \"NR >= $data_start_line\" \"$SCRIPT_PATH\" > \"$awk_output_file\""
-    if ! awk "NR >= $data_start_line" "$SCRIPT_PATH" > "$awk_output_file"; then 
-        error "Erreur: awk échoué ($?)."
-        exit 1
+    # Localisation du payload et sélection des segments
+    if [ "$PAYLOAD_MODE" = "thin" ]; then
+        debug_log "Payload thin: ${NVBUILDER_PAYLOAD_URL:-$PAYLOAD_URL}"
+    else
+        debug_log "Recherche marqueur..."
+        timing_start
+        locate_payload || exit 1
+        timing_end "locate"
     fi
     
-    debug_log "Vérification sortie awk:"
-    [ "$DEBUG_MODE" -eq 1 ] && ls -l "$awk_output_file" 2>/dev/null || true
-    local awk_file_size
-    awk_file_size=$(stat -f%z "$awk_output_file" 2>/dev/null || stat -c%s "$awk_output_file" 2>/dev/null || echo 0)
-    if [ "$awk_file_size" -eq 0 ]; then 
-        error "Erreur: Fichier awk vide."
+    # Les segments des autres plateformes ne sont jamais lus
+    local -a common_segments=() platform_segments=() selected_segments=()
+    local entry seg_platform seg_prefixes
+    for entry in "${PAYLOAD_SEGMENTS[@]}"; do
+        IFS='|' read -r _ _ _ _ _ seg_platform seg_prefixes <<< "$entry"
+        segment_matches_pattern "$seg_prefixes" || continue
+        if [ -z "$seg_platform" ]; then
+            common_segments+=("$entry")
+        elif [ "$seg_platform" = "$TARGET_PLATFORM" ]; then
+            platform_segments+=("$entry")
+        fi
+    done
+    selected_segments=("${common_segments[@]}" "${platform_segments[@]}")
+    if [ ${#selected_segments[@]} -eq 0 ]; then
+        error "Erreur: Aucun fichier ne correspond à '$ONLY_PATTERN'."
         exit 1
     fi
+    [ "$DEBUG_MODE" -eq 1 ] && info "Segments à extraire : ${#selected_segments[@]}/${SEGMENT_COUNT}"
     
-    if [ "$DEBUG_MODE" -eq 1 ]; then 
-        detail "Début(100o):"
-        head -c 100 "$awk_output_file"
-        echo ""
-        detail "Fin(100o):"
-        tail -c 100 "$awk_output_file"
-        echo ""
-    fi
-    
-    [ "$DEBUG_MODE" -eq 1 ] && info "Décodage B64..."
-    local target_decoded_file
-    local decoded_filename
+    SEGMENTS_DIR="$WORK_DIR/.nvb_segments"
+    if ! mkdir -p "$SEGMENTS_DIR"; then error "Erreur: Création '$SEGMENTS_DIR' échouée."; exit 1; fi
     
-    if %%BASH_ENCRYPTION_ENABLED_BOOL%%; then 
-        decoded_filename="$ENCRYPTED_TMP_FILENAME"
-    else 
-        decoded_filename="%%ARCHIVE_ORIGINAL_FILENAME%%"
+    # Avec --target-dir, le contenu est extrait dans une zone intermédiaire puis transféré
+    local extract_root="$EXTRACT_DEST"
+    if [ $need_intermediate_temp -eq 1 ]; then
+        extract_root="$WORK_DIR/staging"
+        mkdir -p "$extract_root"
     fi
     
-    target_decoded_file="$WORK_DIR/$decoded_filename"
-    debug_log "Commande base64: base64 -d < \"$awk_output_file\" > \"$target_decoded_file\""
-    
-    if ! base64 -d < "$awk_output_file" > "$target_decoded_file"; then 
-        error "Erreur: Échec décodage B64."
-        [ "$DEBUG_MODE" -eq 0 ] && rm -f "$awk_output_file"
-        rm -f "$target_decoded_file" 2>/dev/null
-        exit 1
+    # Extraction incrémentale (--target-dir) : seuls les fichiers absents ou modifiés de la cible sont
+    # extraits, les segments sans modification ne sont pas décodés
+    local incremental=0 manifest_ready=0
+    if [ $need_intermediate_temp -eq 1 ] && [ "$MANIFEST_LENGTH" -gt 0 ] && [ -z "$ONLY_PATTERN" ]; then
+        selected_manifest "${selected_segments[@]}" > "$SEGMENTS_DIR/manifest"
+        [ -s "$SEGMENTS_DIR/manifest" ] && manifest_ready=1
     fi
-    
-    if [ ! -s "$target_decoded_file" ]; then 
-        error "Erreur: Fichier vide après décodage B64."
-        exit 1
+    if [ $manifest_ready -eq 1 ] && [ "$INCREMENTAL" -eq 1 ]; then
+        incremental=1
+        [ "$DEBUG_MODE" -eq 1 ] && info "Comparaison avec le contenu de '${DETAIL_COLOR}$EXTRACT_DEST${RESET_STYLE}'..."
+        timing_start
+        plan_incremental "$EXTRACT_DEST"
+        timing_end "compare"
+        require_free_space "$EXTRACT_DEST" "$(space_needed_kb "$INCR_BYTES" "$INCR_WRITTEN")" "la mise à jour"
+        local -a kept_common=() kept_platform=()
+        for entry in "${common_segments[@]}"; do
+            [[ "$INCR_KEEP" == *" ${entry%%|*} "* ]] && kept_common+=("$entry")
+        done
+        for entry in "${platform_segments[@]}"; do
+            [[ "$INCR_KEEP" == *" ${entry%%|*} "* ]] && kept_platform+=("$entry")
+        done
+        common_segments=("${kept_common[@]}"); platform_segments=("${kept_platform[@]}")
+        selected_segments=("${common_segments[@]}" "${platform_segments[@]}")
+        [ "$DEBUG_MODE" -eq 1 ] && info "Segments modifiés : ${#selected_segments[@]}/${SEGMENT_COUNT}"
+    elif [ "$DELETE_REMOVED" -eq 1 ] && [ $manifest_ready -eq 0 ]; then
+        warning "Option --delete-removed ignorée (nécessite --target-dir, sans --only, et un manifeste des fichiers)."
     fi
-    
-    [ "$DEBUG_MODE" -eq 1 ] && success "Décodage B64 OK."
-    [ "$DEBUG_MODE" -eq 0 ] && rm -f "$awk_output_file"
 
-    # Déchiffrement si nécessaire
-    debug_log "Préparation déchiffrement..."
-    local original_pwd
-    original_pwd=$PWD
-    
-    if ! cd "$WORK_DIR"; then 
-        error "Erreur: cd '$WORK_DIR' échoué."
-        exit 1
+    # Déchiffrement : le mot de passe est validé sur le premier segment sélectionné
+    if %%BASH_ENCRYPTION_ENABLED_BOOL%% && [ ${#selected_segments[@]} -gt 0 ]; then
+        timing_start
+        prompt_decryption_password "${selected_segments[0]}"
+        timing_end "password"
     fi
-    
-    if %%BASH_ENCRYPTION_ENABLED_BOOL%%; then
-        %%BASH_DECRYPTION_LOGIC%%
-    fi
-    
-    cd "$original_pwd" # Revenir APRÈS le bloc if complet
 
     # --- Décompression Tar ---
-    local tar_input_src_fname
-    if %%BASH_ENCRYPTION_ENABLED_BOOL%%; then 
-        tar_input_src_fname="$DECRYPTED_TMP_FILENAME"
-    else 
-        tar_input_src_fname="%%ARCHIVE_ORIGINAL_FILENAME%%"
+    select_decompressor
+    [ "$VERIFY_PAYLOAD" -eq 0 ] && debug_log "Vérification d'intégrité désactivée (--no-verify)."
+    [ "$DEBUG_MODE" -eq 1 ] && info "Décompression de ${#selected_segments[@]} segment(s) (${DECOMPRESSOR_LABEL})..."
+    # Cache d'extraction (contenu complet uniquement : ignoré avec --only)
+    local use_cache=0
+    if [ "$EXTRACT_CACHE_ENABLED" = "true" ] && [ "$USE_EXTRACT_CACHE" -eq 1 ]; then
+        if [ -n "$ONLY_PATTERN" ]; then
+            debug_log "Cache d'extraction ignoré (--only)."
+        elif [ $incremental -eq 1 ]; then
+            debug_log "Cache d'extraction ignoré (extraction incrémentale)."
+        elif EXTRACT_CACHE_ROOT=$(extract_cache_root); then
+            use_cache=1
+        else
+            warning "Cache d'extraction inaccessible, extraction sans cache."
+        fi
     fi
     
-    [ "$DEBUG_MODE" -eq 1 ] && info "Décompression '${DETAIL_COLOR}$tar_input_src_fname${RESET_STYLE}'..."
-    debug_log "Commande Tar: (cd \"$WORK_DIR\" && tar \"$TAR_COMMAND_FLAGS\" \"$tar_input_src_fname\")"
-    
-    if ! (cd "$WORK_DIR" && tar "$TAR_COMMAND_FLAGS" "$tar_input_src_fname"); then 
-        local tar_exit_code=$?
-        error "Erreur: Tar échoué (code: $tar_exit_code)."
+    local extract_code=0 extract_bytes=0 seg_size
+    for entry in "${selected_segments[@]}"; do
+        IFS='|' read -r _ _ _ _ seg_size _ <<< "$entry"
+        extract_bytes=$((extract_bytes + seg_size))
+    done
+    timing_start
+    if [ ${#selected_segments[@]} -eq 0 ]; then
+        debug_log "Aucun fichier modifié : rien à extraire."
+    elif [ $use_cache -eq 1 ]; then
+        extract_with_cache "$extract_root" "${#common_segments[@]}" "${selected_segments[@]}" || extract_code=$?
+    else
+        extract_selection "$extract_root" "${#common_segments[@]}" "${selected_segments[@]}" || extract_code=$?
+    fi
+    timing_end "extract" "$extract_bytes"
+    timing_collect_segments "${selected_segments[@]}"
+    if [ $extract_code -eq 3 ]; then
+        error "Erreur: Aucun fichier ne correspond à '$ONLY_PATTERN'."
+        exit 1
+    elif [ $extract_code -ne 0 ]; then
         if [ "$DEBUG_MODE" -eq 1 ]; then
             detail "Contenu du répertoire de travail:"
             ls -lA "$WORK_DIR" >&2
@@ -841,21 +2588,32 @@ function main {
         exit 1
     fi
     
+    if [ $need_intermediate_temp -eq 1 ]; then
+        debug_log "Transfert '$extract_root' -> '$EXTRACT_DEST'"
+        timing_start
+        if ! commit_staged_extraction "$extract_root" "$EXTRACT_DEST"; then
+            error "Erreur: Transfert vers '$EXTRACT_DEST' échoué."
+            exit 1
+        fi
+        timing_end "commit"
+        if [ "$DELETE_REMOVED" -eq 1 ] && [ $manifest_ready -eq 1 ]; then
+            delete_removed_files "$EXTRACT_DEST"
+        fi
+        if [ $incremental -eq 1 ]; then
+            info "Fichiers écrits : $INCR_WRITTEN, inchangés : $INCR_SKIPPED$([ "$DELETE_REMOVED" -eq 1 ] && echo ", supprimés : $INCR_REMOVED")"
+        elif [ "$DELETE_REMOVED" -eq 1 ] && [ $manifest_ready -eq 1 ]; then
+            info "Fichiers supprimés : $INCR_REMOVED"
+        fi
+    fi
+    
     [ "$DEBUG_MODE" -eq 1 ] && success "Décompression OK."
+    # Mot de passe effacé avant le script post-extraction et la fin de la mise à jour en arrière-plan
+    %%BASH_DECRYPTION_CLEANUP%%
 
-    # --- Nettoyage tar source ---
+    # --- Nettoyage des segments ---
     if [ "$DEBUG_MODE" -eq 0 ]; then 
-        if [ -f "$WORK_DIR/$tar_input_src_fname" ]; then 
-            debug_log "Nettoyage $tar_input_src_fname"
-            rm -f "$WORK_DIR/$tar_input_src_fname"
-        fi
-        
-        if %%BASH_ENCRYPTION_ENABLED_BOOL%%; then 
-            if [ -f "$WORK_DIR/$ENCRYPTED_TMP_FILENAME" ]; then 
-                debug_log "Nettoyage $ENCRYPTED_TMP_FILENAME"
-                rm -f "$WORK_DIR/$ENCRYPTED_TMP_FILENAME"
-            fi
-        fi
+        debug_log "Nettoyage $SEGMENTS_DIR"
+        rm -rf "$SEGMENTS_DIR"
     fi
 
     # --- Exécution du script post-extraction ---
@@ -871,6 +2629,7 @@ function main {
         fi
         
         if [ -f "$EXTRACT_DEST/$POST_EXTRACTION_SCRIPT" ]; then
+            timing_start
             if [ "$DEBUG_MODE" -eq 1 ]; then
                 header "Exécution script: $POST_EXTRACTION_SCRIPT (pwd: $EXTRACT_DEST)"
                 (cd "$EXTRACT_DEST" && "./$POST_EXTRACTION_SCRIPT" "$@")
@@ -879,18 +2638,23 @@ function main {
                 (cd "$EXTRACT_DEST" && "./$POST_EXTRACTION_SCRIPT" "$@")
             fi
             script_exit=$?
+            timing_end "post_script"
             
             if [ $script_exit -ne 0 ]; then
                 warning "Script terminé avec code non-zéro: $script_exit"
-            else
-                [ "$DEBUG_MODE" -eq 1 ] && success "Script terminé avec succès!"
+            elif [ "$DEBUG_MODE" -eq 1 ]; then
+                success "Script terminé avec succès!"
             fi
         fi
     else
         success "Extraction terminée dans '$EXTRACT_DEST'!"
     fi
+
+    # Résultat de la vérification des mises à jour lancée en arrière-plan
+    finish_background_update
 }
 # --- Analyse des arguments ---
+SCRIPT_ARGS=("$@")  # Arguments d'origine, repris lors de la relance après l'installation d'une mise à jour
 while [ $# -gt 0 ]; do
     case "$1" in
         --extract-only) EXTRACT_ONLY=1; shift ;;
@@ -898,7 +2662,26 @@ while [ $# -gt 0 ]; do
             if [ -n "$2" ]; then TARGET_DIR="$2"; shift 2; 
             else error "Option --target-dir requiert un argument."; exit 1; fi ;;
         --target-dir=*) TARGET_DIR="${1#*=}"; shift ;;
+        --only) 
+            if [ -n "${2:-}" ]; then ONLY_PATTERN="$2"; shift 2; 
+            else error "Option --only requiert un argument."; exit 1; fi ;;
+        --only=*) ONLY_PATTERN="${1#*=}"; shift ;;
+        --platform) 
+            if [ -n "${2:-}" ]; then TARGET_PLATFORM="$2"; shift 2; 
+            else error "Option --platform requiert un argument."; exit 1; fi ;;
+        --platform=*) TARGET_PLATFORM="${1#*=}"; shift ;;
+        --no-verify) VERIFY_PAYLOAD=0; shift ;;
+        --no-cache) USE_EXTRACT_CACHE=0; shift ;;
+        --full) INCREMENTAL=0; shift ;;
+        --delete-removed) DELETE_REMOVED=1; shift ;;
         --info) SHOW_INFO=1; shift ;;
+        --selftest) SELFTEST=1; shift ;;
+        --timings) TIMINGS=1; shift ;;
+        --timings=*) TIMINGS=1; TIMINGS_JSON="${1#*=}"; shift ;;
+        --list)
+            LIST_CONTENTS=1
+            if [ -n "${2:-}" ] && [[ "$2" != -* ]]; then LIST_PATTERN="$2"; shift 2; else shift; fi ;;
+        --list=*) LIST_CONTENTS=1; LIST_PATTERN="${1#*=}"; shift ;;
         --debug) DEBUG_MODE=1; shift ;;
         --help|-h) print_help; exit 0 ;;
         --force-download) FORCE_DOWNLOAD=1; shift ;;
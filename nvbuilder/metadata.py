@@ -6,10 +6,11 @@ import sys
 import getpass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import json
 import logging
-from .constants import VERSION, DEFAULT_ENCRYPTION_TOOL, DEFAULT_UPDATE_MODE
+import os
+from .constants import VERSION, DEFAULT_ENCRYPTION_TOOL, DEFAULT_UPDATE_MODE, DEFAULT_OUTPUT_MODE
 from .utils import get_absolute_path
 
 logger = logging.getLogger("nvbuilder")
@@ -36,6 +37,9 @@ class MetadataManager:
         update_enabled = self.config.get('update', {}).get('enabled', False)
         update_mode = self.config.get('update', {}).get('mode', DEFAULT_UPDATE_MODE)
         need_root = self.config.get('output', {}).get('need_root', False)
+        content_cfg = self.config.get('content', './content')
+        if isinstance(content_cfg, dict):
+            content_cfg = ", ".join(f"{plat}={path}" for plat, path in content_cfg.items())
         
         # Log d'avertissement pour la configuration chiffrement + mises à jour
         if update_enabled and encryption_enabled:
@@ -59,10 +63,12 @@ class MetadataManager:
             "encrypted_archive_checksum_sha256": None,
             # --- Champs pour mises à jour sécurisées ---
             "script_checksum_sha256": None,  # Hash du fichier .sh final
+            "script_size": None,
+            "script_blocks": None,  # Checksums par bloc du script (reprise des téléchargements)
             "password_check_token_b64": None,  # Jeton chiffré en base64
             "token_encryption_params": None,  # Params utilisés pour chiffrer jeton
             # --- Autres métadonnées ---
-            "content_source_dir": str(self.config.get('content', './content')),
+            "content_source_dir": str(content_cfg),
             "post_extraction_script": self.config.get('script', 'install.sh'),
             "update_enabled": update_enabled,
             "update_mode": update_mode if update_enabled else None,
@@ -70,7 +76,16 @@ class MetadataManager:
             "encryption_tool": None,
             "need_root": need_root,
             "archive_size": 0,
-            "encrypted_archive_path": None
+            "encrypted_size": None,
+            "encrypted_archive_path": None,
+            "segmentation": None,
+            "segments": [],  # Index du payload (un élément par segment embarqué)
+            "platforms": [],  # Plateformes disposant de segments dédiés
+            "output_mode": self.config.get('output', {}).get('mode', DEFAULT_OUTPUT_MODE),
+            "payload_url": self.config.get('output', {}).get('payload_url') or None,
+            "payload_dir": None,  # Répertoire de publication des segments (mode thin)
+            "artifacts": {},  # Artefacts additionnels écrits à partir du même flux
+            "variant": self.config.get('_variant')  # Nom de la variante (section 'variants')
         }
         
         if metadata["encryption_enabled"]:
@@ -90,6 +105,22 @@ class MetadataManager:
         """Ajoute un fichier à la liste des fichiers exclus."""
         self.data['files_excluded'].append(file_info)
         
+    def add_artifact(self, kind: str, path: Path, size: int, checksum: Optional[str]):
+        """Enregistre un artefact additionnel (archive, archive chiffrée, manifeste)."""
+        self.data['artifacts'][kind] = {'path': str(path), 'size': size, 'checksum_sha256': checksum}
+
+    def import_archive_data(self, source: 'MetadataManager'):
+        """
+        Reprend les métadonnées de l'archive produite pour une autre configuration.
+        
+        Utilisé par les variantes : l'archive est créée une seule fois puis partagée,
+        seules les données d'en-tête et de chiffrement restent propres à chaque variante.
+        """
+        for key in ('files_included', 'files_excluded', 'archive_checksum_sha256',
+                    'archive_size', 'segmentation', 'platforms'):
+            self.data[key] = source.data.get(key)
+        self.data['artifacts'] = dict(source.data['artifacts'])
+
     def get(self, key: str, default: Any = None) -> Any:
         """Récupère une valeur depuis les métadonnées."""
         return self.data.get(key, default)
@@ -109,8 +140,8 @@ class MetadataManager:
         
         # Ajouter la taille de l'archive chiffrée si disponible
         enc_path = self.data.get('encrypted_archive_path')
-        public_meta['encrypted_size'] = None
-        if enc_path and Path(enc_path).exists():
+        public_meta['encrypted_size'] = self.data.get('encrypted_size')
+        if public_meta['encrypted_size'] is None and enc_path and Path(enc_path).exists():
             try:
                 public_meta['encrypted_size'] = Path(enc_path).stat().st_size
             except OSError:
@@ -143,6 +174,41 @@ class MetadataManager:
             if self.debug_mode:
                 logger.warning(f"Génération {metadata_output_path} échouée: {e}")
 
+    def write_checksums_file(self, scripts: List[Tuple[str, Path]]):
+        """
+        Écrit le manifeste 'output.artifacts.checksums' au format sha256sum.
+        
+        Les checksums proviennent du build (aucun fichier n'est relu) et les chemins
+        sont relatifs au manifeste, pour une vérification par 'sha256sum -c'.
+        
+        Args:
+            scripts: Scripts générés (checksum, chemin), un par variante
+        """
+        checksums_path_str = self.config.get('output', {}).get('artifacts', {}).get('checksums')
+        if not checksums_path_str:
+            return
+        
+        config_dir = self.config.get('_config_dir', Path('.'))
+        checksums_path = get_absolute_path(checksums_path_str, config_dir)
+        entries = list(scripts)
+        for kind in ('archive', 'encrypted_archive'):
+            artifact = self.data['artifacts'].get(kind)
+            if artifact:
+                entries.append((artifact['checksum_sha256'], Path(artifact['path'])))
+        
+        try:
+            checksums_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(checksums_path, 'w', encoding='utf-8') as f:
+                for checksum, path in entries:
+                    f.write(f"{checksum}  {os.path.relpath(path, checksums_path.parent)}\n")
+            self.add_artifact('checksums', checksums_path, checksums_path.stat().st_size, None)
+            
+            if self.debug_mode:
+                logger.info(f"Manifeste checksums généré: {checksums_path}")
+        except Exception as e:
+            if self.debug_mode:
+                logger.error(f"Err génération manifeste '{checksums_path}': {e}")
+
     def write_version_file(self):
         """Génère le fichier version.json pour les mises à jour."""
         version_file_path_str = self.config.get('update', {}).get('version_file_path')
@@ -163,6 +229,8 @@ class MetadataManager:
                 "build_version": self.build_version,
                 "generated_at": self.data['created_at'],
                 "script_checksum_sha256": self.data.get('script_checksum_sha256'),
+                "script_size": self.data.get('script_size'),
+                "script_blocks": self.data.get('script_blocks'),
                 "password_check_token_b64": self.data.get('password_check_token_b64') if self.data['encryption_enabled'] else None,
                 "token_encryption_params": self.data.get('token_encryption_params') if self.data['encryption_enabled'] else None,
             }
@@ -180,10 +248,32 @@ class MetadataManager:
                 "build_python_version": self.data.get('python_version'),
                 "archive_checksum_sha256": self.data.get('archive_checksum_sha256'),
                 "encrypted_archive_checksum_sha256": self.data.get('encrypted_archive_checksum_sha256') if self.data['encryption_enabled'] else None,
+                "segments_count": len(self.data.get('segments', [])) or None,
+                "platforms": self.data.get('platforms') or None,
+                "output_mode": self.data.get('output_mode'),
+                "payload_url": self.data.get('payload_url') if self.data.get('output_mode') == 'thin' else None,
             }
             
             # Ajouter les informations d'archive
             v_data["archive_info"] = archive_info
+            
+            # Paquet différentiel, indexé par la version de build à partir de laquelle il s'applique
+            delta = self.data.get('update_delta')
+            if delta:
+                v_data["deltas"] = {delta['from_build_version']: {
+                    "path": delta['path'],
+                    "size": delta['size'],
+                    "checksum_sha256": delta['checksum_sha256'],
+                }}
+
+            # Magasin de blocs : index du build courant, relatif au répertoire du script publié
+            chunks = self.data.get('update_chunks')
+            if chunks:
+                v_data["chunks"] = {
+                    "index": chunks['index'],
+                    "store": chunks['store'],
+                    "count": chunks['count'],
+                }
 
             # Filtrer les valeurs None pour un JSON plus propre
             v_data_final = {k: v for k, v in v_data.items() if v is not None}
@@ -191,9 +281,18 @@ class MetadataManager:
             if archive_info_final:
                 v_data_final["archive_info"] = archive_info_final
 
-            # Écrire le fichier JSON
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(v_data_final, f, indent=2, ensure_ascii=False)
+            # Représentation stable (clés triées) : un contenu identique n'est pas réécrit, le serveur
+            # conserve donc ETag et Last-Modified et peut répondre 304 aux vérifications conditionnelles
+            content = json.dumps(v_data_final, indent=2, ensure_ascii=False, sort_keys=True) + "\n"
+            if output_path.is_file() and output_path.read_text(encoding='utf-8') == content:
+                if self.debug_mode:
+                    logger.debug(f"Fichier version inchangé: {output_path}")
+                return
+            
+            # Écriture atomique : le serveur ne publie jamais un fichier partiel
+            tmp_path = output_path.with_name(output_path.name + '.tmp')
+            tmp_path.write_text(content, encoding='utf-8')
+            os.replace(tmp_path, output_path)
                 
             if self.debug_mode:
                 logger.info(f"Fichier version généré: {output_path}")
@@ -0,0 +1,365 @@
+# nvbuilder/publisher.py
+"""Dépôt de mises à jour local : publication versionnée des scripts générés."""
+
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from .constants import (
+    CHUNK_STORE_DIRNAME, DEFAULT_PUBLISH_KEEP, PUBLISH_MANIFEST_FILENAME, PUBLISH_RELEASES_DIRNAME
+)
+from .chunker import prune_chunk_store
+from .delta import read_script_layout
+from .exceptions import BuildProcessError, ConfigError
+from .utils import get_absolute_path
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+logger = logging.getLogger("nvbuilder")
+
+FICLONE = 0x40049409  # ioctl Linux : clone (reflink) d'un fichier sur btrfs, XFS...
+BUILD_VERSION_NAME = re.compile(r"\d+")
+DELTA_NAME = re.compile(r".+_\d+_(\d+)\.delta")
+CHUNK_INDEX_NAME = re.compile(r".+_(\d+)\.chunks")
+
+
+class Publisher:
+    """
+    Publie les scripts d'un build dans un dépôt servi aux scripts générés.
+
+    Disposition du dépôt (les URLs 'update.version_url' et 'update.package_url'
+    pointent vers sa racine) :
+
+        <repo>/<script>.sh, <version>.json        publication courante
+        <repo>/<script>_<de>_<vers>.delta          paquets différentiels
+        <repo>/<script>_<version>.chunks, chunks/  index et magasin de blocs
+        <repo>/releases/<version>/                 scripts, métadonnées et fichiers
+                                                   de version de chaque publication
+
+    Chaque fichier est écrit sous un nom temporaire puis renommé, et le fichier de
+    version, qui annonce la publication, est remplacé en dernier : un client ne lit
+    jamais un fichier partiel ni une version dont les fichiers ne sont pas en place.
+    """
+
+    def __init__(self, config: Dict[str, Any], repo_dir: Optional[str] = None, debug_mode: bool = False):
+        """
+        Initialise la publication vers le dépôt configuré.
+
+        Args:
+            config: Configuration principale (section 'publish')
+            repo_dir: Répertoire du dépôt (remplace 'publish.repo_dir')
+            debug_mode: Affiche le détail des fichiers publiés
+        """
+        self.config = config
+        self.publish_cfg = config.get('publish', {})
+        self.debug_mode = debug_mode
+        repo_dir = repo_dir or self.publish_cfg.get('repo_dir')
+        if not repo_dir:
+            raise ConfigError("Dépôt de publication non défini ('publish.repo_dir' ou --repo).")
+        self.repo_dir = get_absolute_path(repo_dir, config.get('_config_dir', Path('.')))
+        self.releases_dir = self.repo_dir / PUBLISH_RELEASES_DIRNAME
+        self.link = self.publish_cfg.get('link', True)
+        self.stats = {'reflink': 0, 'hardlink': 0, 'copy': 0, 'skipped': 0}
+
+    # --- Copie des fichiers ---
+
+    def _clone(self, source: Path, target: Path) -> str:
+        """Crée 'target' à partir de 'source' : clone, lien physique ou copie. Retourne la méthode."""
+        if self.link and source.stat().st_dev == target.parent.stat().st_dev:
+            if HAS_FCNTL and sys.platform.startswith('linux'):
+                try:
+                    with open(source, 'rb') as src, open(target, 'wb') as dst:
+                        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                    shutil.copymode(source, target)
+                    return 'reflink'
+                except OSError:
+                    target.unlink(missing_ok=True)
+            try:
+                # Les fichiers publiés ne sont jamais réécrits en place (remplacés par renommage)
+                os.link(source, target)
+                return 'hardlink'
+            except OSError:
+                pass
+        shutil.copyfile(source, target)
+        shutil.copymode(source, target)
+        return 'copy'
+
+    def _place(self, source: Path, target: Path):
+        """Installe 'source' sous 'target' en une fois (fichier temporaire puis renommage)."""
+        if target.exists() and os.path.samefile(source, target):
+            self.stats['skipped'] += 1
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            self.stats[self._clone(source, tmp_path)] += 1
+            os.replace(tmp_path, target)
+        except OSError as e:
+            raise BuildProcessError(f"Publication de '{source}' vers '{target}' échouée: {e}") from e
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _write(self, target: Path, content: str):
+        """Écrit un petit fichier texte en une fois, sans le modifier si son contenu est identique."""
+        if target.is_file() and target.read_text(encoding='utf-8') == content:
+            self.stats['skipped'] += 1
+            return
+        tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        try:
+            tmp_path.write_text(content, encoding='utf-8')
+            os.replace(tmp_path, target)
+        except OSError as e:
+            tmp_path.unlink(missing_ok=True)
+            raise BuildProcessError(f"Écriture de '{target}' échouée: {e}") from e
+
+    # --- Sources du build ---
+
+    def _collect(self, variant_configs: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Rassemble les fichiers produits par le dernier build de chaque variante.
+
+        Returns:
+            Tuple: Version de build et, par script : chemins du script, de ses métadonnées
+            et de son fichier de version, contenu du fichier de version
+
+        Raises:
+            ConfigError: Sans 'update.version_file_path' ou si deux variantes publient le même nom
+            BuildProcessError: Si un fichier manque ou ne correspond pas au même build
+        """
+        entries: List[Dict[str, Any]] = []
+        names: Dict[str, str] = {}
+        build_version = None
+        for cfg in variant_configs:
+            label = f"Variante '{cfg['_variant']}': " if cfg.get('_variant') else ""
+            base_dir = cfg.get('_config_dir', Path('.'))
+            version_file = cfg.get('update', {}).get('version_file_path')
+            if not version_file:
+                raise ConfigError(f"{label}'update.version_file_path' requis pour publier (fichier annonçant la publication).")
+            script_path = get_absolute_path(cfg['output']['path'], base_dir)
+            version_path = get_absolute_path(version_file, base_dir)
+            for name in (script_path.name, version_path.name):
+                if name in names or name in (PUBLISH_RELEASES_DIRNAME, CHUNK_STORE_DIRNAME):
+                    raise ConfigError(f"{label}nom '{name}' déjà utilisé dans le dépôt de publication.")
+                names[name] = label
+
+            layout = read_script_layout(script_path) if script_path.is_file() else None
+            if not layout:
+                raise BuildProcessError(f"{label}script '{script_path}' absent ou illisible (build requis avant publication).")
+            try:
+                version_data = json.loads(version_path.read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                raise BuildProcessError(f"{label}fichier de version '{version_path}' illisible: {e}") from e
+            if version_data.get('build_version') != layout['build_version'] or \
+               version_data.get('script_size') not in (None, script_path.stat().st_size):
+                raise BuildProcessError(f"{label}'{version_path.name}' ne correspond pas au script '{script_path.name}' "
+                                        f"(build {version_data.get('build_version')} / {layout['build_version']}).")
+            if build_version and layout['build_version'] != build_version:
+                raise BuildProcessError(f"{label}scripts issus de builds différents ({build_version} / {layout['build_version']}).")
+            build_version = layout['build_version']
+
+            entries.append({
+                'script': script_path,
+                'metadata': script_path.with_suffix('.json'),
+                'version_file': version_path,
+                'version_data': version_data,
+            })
+        if not entries:
+            raise ConfigError("Aucun script à publier.")
+        return build_version, entries
+
+    # --- Publication ---
+
+    def _stage_release(self, build_version: str, entries: List[Dict[str, Any]]):
+        """Crée 'releases/<version>' : rempli sous un nom temporaire puis renommé."""
+        release_dir = self.releases_dir / build_version
+        if release_dir.is_dir():
+            # Publication déjà présente : acceptée seulement si les scripts sont identiques
+            manifest = self._read_manifest(build_version)
+            published = {item['script']: item['script_checksum_sha256'] for item in manifest['scripts']}
+            for entry in entries:
+                if published.get(entry['script'].name) != entry['version_data'].get('script_checksum_sha256'):
+                    raise BuildProcessError(f"Publication {build_version} déjà présente avec un contenu différent "
+                                            f"('{entry['script'].name}').")
+            return
+
+        staging_dir = self.releases_dir / f".{build_version}.partial"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        staging_dir.mkdir(parents=True)
+        scripts = []
+        for entry in entries:
+            self._place(entry['script'], staging_dir / entry['script'].name)
+            shutil.copyfile(entry['version_file'], staging_dir / entry['version_file'].name)
+            if entry['metadata'].is_file():
+                shutil.copyfile(entry['metadata'], staging_dir / entry['metadata'].name)
+            scripts.append({
+                'script': entry['script'].name,
+                'version_file': entry['version_file'].name,
+                'script_checksum_sha256': entry['version_data'].get('script_checksum_sha256'),
+                'script_size': entry['script'].stat().st_size,
+            })
+        manifest = {
+            'build_version': build_version,
+            'published_at': datetime.now().isoformat(),
+            'scripts': scripts,
+        }
+        (staging_dir / PUBLISH_MANIFEST_FILENAME).write_text(
+            json.dumps(manifest, indent=2, ensure_ascii=False, sort_keys=True) + "\n", encoding='utf-8')
+        os.rename(staging_dir, release_dir)
+
+    def _publish_update_files(self, entries: List[Dict[str, Any]]):
+        """Place à la racine du dépôt les paquets différentiels et les blocs annoncés par les fichiers de version."""
+        for entry in entries:
+            source_dir = entry['script'].parent
+            for delta in entry['version_data'].get('deltas', {}).values():
+                self._place(source_dir / delta['path'], self.repo_dir / delta['path'])
+
+            chunks = entry['version_data'].get('chunks')
+            if not chunks:
+                continue
+            index_path = source_dir / chunks['index']
+            # Blocs d'abord : l'index n'apparaît qu'une fois tous ses blocs présents
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    checksums = {line.split()[1] for line in f if line.startswith("chunk ")}
+            except OSError as e:
+                raise BuildProcessError(f"Index de blocs illisible '{index_path}': {e}") from e
+            for checksum in checksums:
+                target = self.repo_dir / chunks['store'] / checksum[:2] / checksum
+                if not target.is_file():
+                    self._place(source_dir / chunks['store'] / checksum[:2] / checksum, target)
+            self._place(index_path, self.repo_dir / chunks['index'])
+
+    def _read_manifest(self, build_version: str) -> Dict[str, Any]:
+        """Lit le manifeste d'une publication conservée."""
+        manifest_path = self.releases_dir / build_version / PUBLISH_MANIFEST_FILENAME
+        try:
+            return json.loads(manifest_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise BuildProcessError(f"Publication {build_version} introuvable ou illisible: {e}") from e
+
+    def activate(self, build_version: str):
+        """
+        Fait d'une publication conservée la publication courante (également utilisé pour revenir en arrière).
+
+        Les scripts sont remplacés d'abord, les fichiers de version ensuite.
+        """
+        manifest = self._read_manifest(build_version)
+        release_dir = self.releases_dir / build_version
+        for item in manifest['scripts']:
+            self._place(release_dir / item['script'], self.repo_dir / item['script'])
+        for item in manifest['scripts']:
+            content = (release_dir / item['version_file']).read_text(encoding='utf-8')
+            self._write(self.repo_dir / item['version_file'], content)
+        self._write(self.releases_dir / "current", build_version + "\n")
+
+    def current(self) -> Optional[str]:
+        """Version de la publication courante (None si le dépôt est vide)."""
+        try:
+            return (self.releases_dir / "current").read_text(encoding='utf-8').strip() or None
+        except OSError:
+            return None
+
+    def releases(self) -> List[str]:
+        """Versions publiées et conservées, de la plus ancienne à la plus récente."""
+        if not self.releases_dir.is_dir():
+            return []
+        return sorted(p.name for p in self.releases_dir.iterdir()
+                      if p.is_dir() and BUILD_VERSION_NAME.fullmatch(p.name))
+
+    def _prune(self) -> List[str]:
+        """
+        Applique la rétention ('publish.keep', 'publish.max_age_days') puis supprime les paquets
+        différentiels, index et blocs qui ne servent plus aucune publication conservée.
+
+        La publication courante n'est jamais supprimée.
+
+        Returns:
+            List: Versions supprimées
+        """
+        keep = self.publish_cfg.get('keep', DEFAULT_PUBLISH_KEEP)
+        max_age_days = self.publish_cfg.get('max_age_days', 0)
+        current = self.current()
+        releases = self.releases()
+        removed = []
+        for position, version in enumerate(reversed(releases)):
+            if version == current:
+                continue
+            expired = False
+            if max_age_days:
+                try:
+                    built_at = datetime.strptime(version, "%Y%m%d%H%M%S").timestamp()
+                except ValueError:
+                    built_at = (self.releases_dir / version).stat().st_mtime
+                expired = time.time() - built_at > max_age_days * 86400
+            if (keep and position >= keep) or expired:
+                shutil.rmtree(self.releases_dir / version)
+                removed.append(version)
+
+        kept = set(releases) - set(removed)
+        for path in self.repo_dir.iterdir():
+            match = DELTA_NAME.fullmatch(path.name) or CHUNK_INDEX_NAME.fullmatch(path.name)
+            if match and path.is_file() and match.group(1) not in kept:
+                path.unlink(missing_ok=True)
+        prune_chunk_store(self.repo_dir)
+        return removed
+
+    def _lock(self):
+        """Verrou exclusif du dépôt (une seule publication à la fois). Retourne le fichier verrouillé."""
+        self.repo_dir.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.repo_dir / ".publish.lock", 'w')
+        if HAS_FCNTL:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                raise BuildProcessError(f"Publication déjà en cours dans '{self.repo_dir}'.")
+        return lock_file
+
+    def publish(self, variant_configs: List[Dict[str, Any]], release: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Publie le dernier build (ou réactive une publication conservée) puis applique la rétention.
+
+        Args:
+            variant_configs: Configurations des scripts à publier (une par variante)
+            release: Version de build conservée à réactiver (retour arrière), None pour publier le build
+
+        Returns:
+            Dict: 'build_version', 'repo_dir', 'removed' (versions supprimées) et
+            'files' (nombre de fichiers par méthode : reflink, hardlink, copy, skipped)
+        """
+        lock_file = self._lock()
+        try:
+            self.releases_dir.mkdir(exist_ok=True)
+            # Restes d'une publication interrompue
+            for stale in self.releases_dir.glob(".*.partial"):
+                shutil.rmtree(stale, ignore_errors=True)
+            for stale in self.repo_dir.glob(".*.tmp"):
+                stale.unlink(missing_ok=True)
+
+            if release:
+                build_version = release
+            else:
+                build_version, entries = self._collect(variant_configs)
+                self._stage_release(build_version, entries)
+                self._publish_update_files(entries)
+            self.activate(build_version)
+            removed = self._prune()
+        finally:
+            lock_file.close()
+
+        if self.debug_mode:
+            logger.info(f"Publication {build_version} -> {self.repo_dir} ({self.stats}), "
+                        f"supprimées: {', '.join(removed) or 'aucune'}")
+        return {'build_version': build_version, 'repo_dir': self.repo_dir, 'removed': removed, 'files': dict(self.stats)}
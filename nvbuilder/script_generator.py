@@ -3,13 +3,17 @@
 
 import logging
 import base64
+import gzip
 import os
+import shutil
+import threading
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 import re
+import shlex
 
-from .constants import TEMPLATE_FILENAME, ARCHIVE_MARKER
-from .utils import read_file_binary, get_absolute_path
+from .constants import TEMPLATE_FILENAME, ARCHIVE_MARKER, B64_CHUNK_SIZE, DEFAULT_PLATFORM_PROBE, DEFAULT_OUTPUT_MODE, THIN_SEGMENT_EXTENSION, DEFAULT_EXTRACT_CACHE_MAX_MB, DEFAULT_WORKDIR_RAM_FRACTION, DEFAULT_UPDATE_CHECK_INTERVAL, DEFAULT_UPDATE_CONNECT_TIMEOUT, DEFAULT_UPDATE_MAX_TIME, DEFAULT_UPDATE_MIRROR_RACE, MIRROR_BACKOFF_BASE, MIRROR_BACKOFF_MAX
+from .utils import get_absolute_path, url_list
 from .exceptions import TemplateError, BuildProcessError
 
 # Import des couleurs sémantiques
@@ -25,27 +29,31 @@ logger = logging.getLogger("nvbuilder")
 class ScriptGenerator:
     """Classe responsable de la génération du script Bash auto-extractible final."""
 
-    def __init__(self, config: Dict[str, Any], metadata: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], metadata: Dict[str, Any], show_progress: bool = True):
         """
         Initialise le générateur de script.
         
         Args:
             config: Configuration du build
             metadata: Métadonnées du build
+            show_progress: Affiche la progression (désactivé pour les variantes générées en parallèle)
         """
         self.config = config
         self.metadata = metadata
         self.package_dir = Path(__file__).parent.resolve()
         self.debug_mode = config.get('debug_mode', False)
+        self.output_mode = config.get('output', {}).get('mode', DEFAULT_OUTPUT_MODE)
+        self.show_progress = show_progress
 
-    def generate(self, archive_to_embed_path: Path, archive_original_filename: str, 
+    def generate(self, segments: List[Dict[str, Any]], archive_extension: str,
                 tar_command_flags: str, bash_snippets: Dict[str, str]) -> Path:
         """
-        Génère le script final en intégrant l'archive et en remplaçant les placeholders.
+        Génère le script final en intégrant les segments et en remplaçant les placeholders.
         
         Args:
-            archive_to_embed_path: Chemin vers l'archive à intégrer (compressée ou chiffrée)
-            archive_original_filename: Nom du fichier d'archive original (pour extraction)
+            segments: Segments à intégrer, dans l'ordre (clé 'embed_path' : fichier
+                      compressé ou chiffré à encoder)
+            archive_extension: Extension des archives tar (ex: '.tar.gz')
             tar_command_flags: Options pour la commande tar
             bash_snippets: Fragments de code bash à injecter dans le template
             
@@ -59,8 +67,12 @@ class ScriptGenerator:
         # Charger le template
         template_content = self._load_template()
         
-        # Encoder l'archive en base64
-        archive_base64 = self._encode_archive(archive_to_embed_path)
+        # Manifeste des fichiers : première région, placée avant les segments
+        manifest_entries = self._build_file_manifest()
+        manifest_region = self._encode_manifest(manifest_entries)
+        
+        # Construire l'index du payload (positions des régions Base64)
+        payload_index = self._build_payload_index(segments, len(manifest_region) + 1 if manifest_region else 0)
         
         # Préparer le chemin de sortie
         output_config = self.config.get('output', {})
@@ -69,16 +81,71 @@ class ScriptGenerator:
         output_path = get_absolute_path(output_filename, config_dir)
         
         # Préparer les remplacements
-        replacements = self._prepare_replacements(archive_original_filename, tar_command_flags, bash_snippets)
+        replacements = self._prepare_replacements(archive_extension, tar_command_flags, bash_snippets, payload_index)
+        replacements["%%MANIFEST_LENGTH%%"] = str(len(manifest_region))
+        replacements["%%MANIFEST_FILES%%"] = str(len(manifest_entries))
+        replacements["%%PAYLOAD_BYTES%%"] = str(sum(seg['embed_path'].stat().st_size for seg in segments))
+        replacements["%%CONTENT_SIZES%%"] = shlex.quote(self._content_sizes(segments))
         
         # Appliquer les remplacements au template
         final_script_content = self._apply_replacements(template_content, replacements)
         
-        # Écrire le script final
-        self._write_script(output_path, final_script_content, archive_base64)
+        if self.output_mode == 'thin':
+            # Mode thin : le script ne contient que l'en-tête, les segments sont publiés à côté
+            self._publish_segments(segments, output_path)
+            self._write_script(output_path, final_script_content, [], manifest_region)
+        else:
+            # Écrire le script final (l'encodage Base64 se fait au fil de l'écriture)
+            self._write_script(output_path, final_script_content, [seg['embed_path'] for seg in segments], manifest_region)
         
         return output_path
 
+    def get_payload_dir(self, output_path: Path) -> Path:
+        """
+        Retourne le répertoire de publication des segments en mode thin.
+        
+        Args:
+            output_path: Chemin du script généré
+            
+        Returns:
+            Path: 'output.payload_dir' ou, par défaut, '<script>_payload' à côté du script
+        """
+        payload_dir = self.config.get('output', {}).get('payload_dir')
+        if payload_dir:
+            return get_absolute_path(payload_dir, self.config.get('_config_dir', Path('.')))
+        return output_path.parent / f"{output_path.stem}_payload"
+
+    def _publish_segments(self, segments: List[Dict[str, Any]], output_path: Path):
+        """
+        Copie les segments (compressés ou chiffrés) dans le répertoire de publication.
+        
+        Les fichiers sont nommés d'après leur SHA256 : ils sont immuables et
+        peuvent être conservés dans un cache côté cible d'un build à l'autre.
+        
+        Args:
+            segments: Segments à publier
+            output_path: Chemin du script généré
+            
+        Raises:
+            BuildProcessError: Si la copie échoue
+        """
+        payload_dir = self.get_payload_dir(output_path)
+        if self.debug_mode:
+            logger.info(f"Publication de {len(segments)} segment(s) -> {payload_dir}")
+        
+        try:
+            payload_dir.mkdir(parents=True, exist_ok=True)
+            for seg in segments:
+                target = payload_dir / f"{seg['payload_checksum_sha256']}{THIN_SEGMENT_EXTENSION}"
+                if target.exists() and target.stat().st_size == seg['embed_path'].stat().st_size:
+                    continue
+                # Nom temporaire propre au thread : plusieurs variantes peuvent publier en même temps
+                tmp_target = target.with_name(f"{target.name}.{threading.get_ident()}.tmp")
+                shutil.copyfile(seg['embed_path'], tmp_target)
+                os.replace(tmp_target, target)
+        except Exception as e:
+            raise BuildProcessError(f"Publication des segments dans '{payload_dir}' échouée: {e}") from e
+
     def _load_template(self) -> str:
         """
         Charge le contenu du template Bash depuis le fichier template.
@@ -120,53 +187,120 @@ class ScriptGenerator:
                 e = TemplateError(f"Lecture template '{template_path}' échouée: {e}")
             raise e
 
-    def _encode_archive(self, archive_path: Path) -> bytes:
+    def _build_payload_index(self, segments: List[Dict[str, Any]], base_offset: int = 0) -> List[str]:
         """
-        Lit l'archive et l'encode en Base64.
+        Construit les entrées de l'index du payload.
+        
+        Chaque segment occupe une région Base64 terminée par un saut de ligne.
+        Les positions sont relatives au début du payload (ligne suivant le marqueur)
+        et se déduisent de la taille des fichiers, sans les encoder au préalable.
         
         Args:
-            archive_path: Chemin vers l'archive à encoder
+            segments: Segments à intégrer
+            base_offset: Position de la première région de segment (après le manifeste)
             
         Returns:
-            bytes: Données encodées en base64
-            
-        Raises:
-            BuildProcessError: Si l'encodage échoue
+            List[str]: Entrées 'id|offset|longueur_b64|sha256|taille|plateforme|préfixes'
+                       (plateforme vide pour le contenu commun)
         """
+        entries = []
+        offset = base_offset
+        for seg in segments:
+            size = seg['embed_path'].stat().st_size
+            # En mode thin, aucune région n'est intégrée au script
+            b64_length = 4 * ((size + 2) // 3) if self.output_mode != 'thin' else 0
+            prefixes = ",".join(seg.get('prefixes') or ['*'])
+            entries.append(f"{seg['id']}|{offset}|{b64_length}|{seg['payload_checksum_sha256']}|{size}|{seg.get('platform', '')}|{prefixes}")
+            if self.output_mode != 'thin':
+                offset += b64_length + 1
+        
         if self.debug_mode:
-            logger.info(f"Encodage Base64 de '{archive_path.name}'...")
-        else:
-            print(f"{INFO_COLOR}{HIGHLIGHT_STYLE}Préparation de l'archive...  ", end=" ", flush=True)
+            for entry in entries:
+                logger.debug(f"Index payload: {entry}")
         
-        try:
-            # Lire l'archive en binaire
-            archive_data = read_file_binary(archive_path)
-            
-            # Encoder en base64
-            encoded_data = base64.b64encode(archive_data)
-            
-            # Log du succès
-            size_mb = len(encoded_data)/1024/1024
-            
+        return entries
+
+    def _build_file_manifest(self) -> List[str]:
+        """
+        Construit le manifeste des fichiers (extraction incrémentale et --list).
+        
+        Le manifeste n'est pas intégré lorsque le payload est chiffré (il exposerait
+        en clair la liste et les empreintes des fichiers) ni lorsqu'un chemin contient
+        un saut de ligne (le script le traite ligne par ligne).
+        
+        Returns:
+            List[str]: Entrées 'segment|taille|mode_octal|sha256|chemin', dans l'ordre des segments
+                       (sha256 vaut 'symlink' ou 'empty_file' pour les liens et fichiers vides)
+        """
+        if self.metadata.get('encryption_enabled', False):
+            return []
+        files = self.metadata.get('files_included') or []
+        if any('\n' in f['path'] or 'mode' not in f for f in files):
             if self.debug_mode:
-                logger.info(f"•  Encodage Base64 {SUCCESS_COLOR}OK{RESET_STYLE} (Taille: {size_mb:.2f} Mo)")
-            else:
-                print(f"{SUCCESS_COLOR}OK{RESET_STYLE}")
+                logger.warning("Manifeste des fichiers non intégré (chemin non supporté).")
+            return []
+        return [f"{f['segment']}|{f['size']}|{f['mode']:o}|{f['checksum_sha256']}|{f['path']}"
+                for f in sorted(files, key=lambda f: f['segment'])]
+
+    def _content_sizes(self, segments: List[Dict[str, Any]]) -> str:
+        """
+        Résume la taille du contenu extrait par plateforme (contrôle d'espace disque côté cible).
+        
+        Args:
+            segments: Segments intégrés
             
-            return encoded_data
+        Returns:
+            str: Entrées 'plateforme:octets:fichiers' séparées par des espaces ('-' pour le contenu commun)
+        """
+        sizes: Dict[str, List[int]] = {}
+        for seg in segments:
+            totals = sizes.setdefault(seg.get('platform') or '-', [0, 0])
+            totals[0] += seg.get('uncompressed_size', 0)
+            totals[1] += seg.get('files_count', 0)
+        return " ".join(f"{plat}:{size}:{count}" for plat, (size, count) in sizes.items())
+
+    def _encode_manifest(self, entries: List[str]) -> bytes:
+        """
+        Encode le manifeste en région Base64 (gzip), lisible sans décoder le payload.
+        
+        Args:
+            entries: Entrées du manifeste
             
-        except Exception as e:
-            raise BuildProcessError(f"Erreur encodage B64 {archive_path}: {e}") from e
+        Returns:
+            bytes: Région Base64 sur une seule ligne (vide sans manifeste)
+        """
+        if not entries:
+            return b''
+        data = ("\n".join(entries) + "\n").encode('utf-8')
+        return base64.b64encode(gzip.compress(data, compresslevel=9))
+
+    def _encode_region(self, source_path: Path, out_file):
+        """
+        Encode un fichier en Base64 par blocs et l'écrit dans le script ouvert.
+        
+        Args:
+            source_path: Fichier (segment) à encoder
+            out_file: Fichier de sortie ouvert en mode binaire
+        """
+        with open(source_path, 'rb') as src:
+            while True:
+                # Taille de bloc multiple de 3 : pas de padding intermédiaire
+                chunk = src.read(B64_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out_file.write(base64.b64encode(chunk))
+        out_file.write(b'\n')
 
-    def _prepare_replacements(self, archive_original_filename: str, 
-                            tar_command_flags: str, bash_snippets: Dict[str, str]) -> Dict[str, str]:
+    def _prepare_replacements(self, archive_extension: str, tar_command_flags: str,
+                            bash_snippets: Dict[str, str], payload_index: List[str]) -> Dict[str, str]:
         """
         Prépare le dictionnaire de remplacements pour les placeholders du template.
         
         Args:
-            archive_original_filename: Nom du fichier d'archive original
+            archive_extension: Extension des archives tar
             tar_command_flags: Options pour la commande tar
             bash_snippets: Fragments de code bash à injecter
+            payload_index: Entrées de l'index du payload
             
         Returns:
             Dict[str, str]: Dictionnaire de remplacements
@@ -188,14 +322,20 @@ class ScriptGenerator:
         enc_tool = self.metadata.get('encryption_tool') or "N/A"
         upd_enabled = self.metadata.get('update_enabled', False)
         upd_mode = self.metadata.get('update_mode', 'check-only')
-        url_display = self.config.get('update', {}).get('version_url', '') or 'N/A'
+        url_display = ', '.join(url_list(self.config.get('update', {}).get('version_url'))) or 'N/A'
         
         # Paramètre pour les droits d'administrateur
         need_root = self.config.get('output', {}).get('need_root', False)
         
+        # Cache d'extraction et répertoire de travail côté cible
+        extract_cache = self.config.get('output', {}).get('extract_cache') or {}
+        work_dir_cfg = self.config.get('output', {}).get('work_dir') or {}
+        
         # Information de mise à jour
-        version_url = self.config.get('update', {}).get('version_url', '')
-        package_url = self.config.get('update', {}).get('package_url', '')
+        version_urls = url_list(self.config.get('update', {}).get('version_url'))
+        package_urls = url_list(self.config.get('update', {}).get('package_url'))
+        version_url = version_urls[0] if version_urls else ''
+        package_url = package_urls[0] if package_urls else ''
         
         # Construire le dictionnaire de remplacements
         replacements = {
@@ -210,16 +350,35 @@ class ScriptGenerator:
             # Variables de mise à jour (nouvelles variables directes)
             "%%UPDATE_VERSION_URL%%": version_url,
             "%%UPDATE_PACKAGE_URL%%": package_url,
+            "%%UPDATE_VERSION_URLS%%": " ".join(shlex.quote(url) for url in version_urls),
+            "%%UPDATE_PACKAGE_URLS%%": " ".join(shlex.quote(url) for url in package_urls),
+            "%%UPDATE_MIRROR_RACE%%": str(int(self.config.get('update', {}).get('mirror_race', DEFAULT_UPDATE_MIRROR_RACE))),
+            "%%MIRROR_BACKOFF_BASE%%": str(MIRROR_BACKOFF_BASE),
+            "%%MIRROR_BACKOFF_MAX%%": str(MIRROR_BACKOFF_MAX),
             "%%UPDATE_MODE%%": upd_mode,
+            "%%UPDATE_CHECK_INTERVAL%%": str(int(self.config.get('update', {}).get('check_interval', DEFAULT_UPDATE_CHECK_INTERVAL))),
+            "%%UPDATE_CONNECT_TIMEOUT%%": str(int(self.config.get('update', {}).get('connect_timeout', DEFAULT_UPDATE_CONNECT_TIMEOUT))),
+            "%%UPDATE_MAX_TIME%%": str(int(self.config.get('update', {}).get('max_time', DEFAULT_UPDATE_MAX_TIME))),
+            "%%UPDATE_BACKGROUND_BOOL%%": "true" if self.config.get('update', {}).get('background') else "false",
             
             # Configuration archive et extraction
             "%%ARCHIVE_MARKER%%": ARCHIVE_MARKER,
             "%%TAR_COMMAND_FLAGS%%": tar_command_flags,
+            "%%COMPRESSION_METHOD%%": comp_method,
             "%%POST_EXTRACTION_SCRIPT%%": post_script,
             "%%CONTENT_SOURCE_DIR%%": self.metadata.get('content_source_dir', 'N/A'),
             "%%ARCHIVE_CHECKSUM%%": self.metadata.get('archive_checksum_sha256', 'N/A'),
             "%%ENCRYPTED_CHECKSUM%%": self.metadata.get('encrypted_archive_checksum_sha256', 'N/A'),
-            "%%ARCHIVE_ORIGINAL_FILENAME%%": archive_original_filename,
+            "%%ARCHIVE_EXTENSION%%": archive_extension,
+            "%%PAYLOAD_INDEX%%": "\n".join(f"    {shlex.quote(entry)}" for entry in payload_index),
+            "%%SEGMENT_COUNT%%": str(len(payload_index)),
+            "%%PAYLOAD_MODE%%": self.output_mode,
+            "%%PAYLOAD_URL%%": self.config.get('output', {}).get('payload_url', '') or '',
+            "%%PAYLOAD_PLATFORMS%%": shlex.quote(" ".join(self.metadata.get('platforms') or [])),
+            "%%EXTRACT_CACHE_BOOL%%": "true" if extract_cache.get('enabled') else "false",
+            "%%EXTRACT_CACHE_MAX_MB%%": str(int(extract_cache.get('max_size_mb', DEFAULT_EXTRACT_CACHE_MAX_MB))),
+            "%%WORKDIR_RAM_PERCENT%%": str(int(round(100 * work_dir_cfg.get('ram_fraction', DEFAULT_WORKDIR_RAM_FRACTION)))),
+            "%%PLATFORM_PROBE%%": shlex.quote(self.config.get('payload', {}).get('platform_probe', DEFAULT_PLATFORM_PROBE)),
             
             # Informations d'affichage
             "%%COMPRESSION_DISPLAY%%": comp_display,
@@ -233,7 +392,7 @@ class ScriptGenerator:
             
             # Snippets bash
             "%%BASH_ENCRYPTION_VARS%%": bash_snippets.get("encryption_vars", ""),
-            "%%BASH_DECRYPTION_LOGIC%%": bash_snippets.get("decryption_logic", ""),
+            "%%BASH_DECRYPTION_FUNCTIONS%%": bash_snippets.get("decryption_functions", ""),
             "%%BASH_DECRYPTION_CLEANUP%%": bash_snippets.get("decryption_cleanup", "")
         }
         
@@ -271,21 +430,23 @@ class ScriptGenerator:
         
         return final_content
 
-    def _write_script(self, output_path: Path, script_content: str, archive_base64: bytes):
+    def _write_script(self, output_path: Path, script_content: str, region_sources: List[Path],
+                      manifest_region: bytes = b''):
         """
-        Écrit le script final et ajoute les données Base64 de l'archive.
+        Écrit le script final, la région du manifeste puis une région Base64 par segment.
         
         Args:
             output_path: Chemin où écrire le script
             script_content: Contenu du script (partie texte)
-            archive_base64: Données de l'archive encodées en base64
+            region_sources: Fichiers des segments, dans l'ordre de l'index
+            manifest_region: Région Base64 du manifeste des fichiers (vide si absent)
             
         Raises:
             BuildProcessError: Si l'écriture échoue
         """
         if self.debug_mode:
             logger.info(f"Écriture script -> {output_path}")
-        else:
+        elif self.show_progress:
             print(f"{INFO_COLOR}{HIGHLIGHT_STYLE}Génération du script final...", end=" ", flush=True)
         
         try:
@@ -307,18 +468,27 @@ class ScriptGenerator:
                         logger.error(f"FIN ATTENDUE:\n{expected_ending}\nFIN REELLE:\n{script_content[-100:]}")
                     raise BuildProcessError("Contenu final script ne finit pas par marqueur unique.")
             
-            # Écrire le contenu du script suivi des données base64 et d'un saut de ligne final
-            with open(output_path, 'wb') as f:
-                f.write(script_content.encode('utf-8'))
-                f.write(archive_base64)
-                f.write(b'\n')
-            
-            # Rendre le script exécutable
-            os.chmod(output_path, 0o755)
+            # Écrire le contenu du script suivi des régions base64 (une ligne par segment).
+            # Le script précédent est remplacé en une fois : une copie publiée par lien physique
+            # (nvbuilder publish) n'est jamais réécrite
+            tmp_path = output_path.with_name(f"{output_path.name}.{threading.get_ident()}.tmp")
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(script_content.encode('utf-8'))
+                    if manifest_region:
+                        f.write(manifest_region + b'\n')
+                    for source_path in region_sources:
+                        self._encode_region(source_path, f)
+                
+                # Rendre le script exécutable
+                os.chmod(tmp_path, 0o755)
+                os.replace(tmp_path, output_path)
+            finally:
+                tmp_path.unlink(missing_ok=True)
             
             if self.debug_mode:
                 logger.info(f"•  Écriture script {SUCCESS_COLOR}OK{RESET_STYLE}")
-            else:
+            elif self.show_progress:
                 print(f"{SUCCESS_COLOR}OK{RESET_STYLE}")
             
         except Exception as e:
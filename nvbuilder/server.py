@@ -0,0 +1,395 @@
+# nvbuilder/server.py
+"""Serveur HTTP léger pour les points de mise à jour (version.json, scripts, paquets, blocs)."""
+
+import email.utils
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+import urllib.parse
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from .constants import (
+    CHUNK_STORE_DIRNAME, DEFAULT_SERVE_HOST, DEFAULT_SERVE_PORT, DEFAULT_SERVE_METRICS_INTERVAL,
+    PUBLISH_MANIFEST_FILENAME, PUBLISH_RELEASES_DIRNAME, VERSION
+)
+from .exceptions import NvBuilderError
+from .colors import INFO_COLOR, DETAIL_COLOR, PATH_COLOR, HIGHLIGHT_STYLE, RESET_STYLE
+
+logger = logging.getLogger("nvbuilder")
+
+READ_BLOCK_SIZE = 1024 * 1024
+SHA256_NAME = re.compile(r"[0-9a-f]{64}")
+RANGE_HEADER = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class ChecksumIndex:
+    """
+    SHA256 des fichiers servis, utilisés comme ETag forts.
+
+    Les checksums enregistrés à la publication sont repris sans relire les fichiers :
+    blocs du magasin (nommés par leur SHA256) et scripts listés dans le manifeste
+    'release.json' de chaque publication (ainsi que leur copie courante à la racine,
+    lorsqu'elle est un lien physique vers le fichier publié).
+    Les autres fichiers sont hachés une fois, puis tant que leur inode, leur taille
+    et leur date de modification ne changent pas.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock = threading.Lock()
+        self._computed: Dict[Tuple[int, int, int, int], str] = {}
+        self._manifests: Dict[Path, Tuple[int, Dict[str, Tuple[int, str]]]] = {}
+
+    def _recorded_scripts(self, release_dir: Path) -> Dict[str, Tuple[int, str]]:
+        """Scripts d'une publication : {nom: (taille, sha256)} (lu à nouveau si le manifeste change)."""
+        manifest_path = release_dir / PUBLISH_MANIFEST_FILENAME
+        try:
+            mtime = manifest_path.stat().st_mtime_ns
+        except OSError:
+            return {}
+        with self._lock:
+            cached = self._manifests.get(manifest_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        scripts = {}
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+            for item in manifest.get('scripts', []):
+                if item.get('script_checksum_sha256'):
+                    scripts[item['script']] = (item.get('script_size'), item['script_checksum_sha256'])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Manifeste illisible '{manifest_path}': {e}")
+        with self._lock:
+            self._manifests[manifest_path] = (mtime, scripts)
+        return scripts
+
+    def _recorded(self, path: Path, st: os.stat_result) -> Optional[str]:
+        """Checksum enregistré pour le fichier (None si aucun ne s'applique)."""
+        relative = path.relative_to(self.root).parts
+        if len(relative) == 3 and relative[0] == CHUNK_STORE_DIRNAME and SHA256_NAME.fullmatch(relative[2]):
+            return relative[2]
+        if len(relative) == 3 and relative[0] == PUBLISH_RELEASES_DIRNAME:
+            release_dir = path.parent
+        elif len(relative) == 1:
+            try:
+                current = (self.root / PUBLISH_RELEASES_DIRNAME / "current").read_text(encoding='utf-8').strip()
+            except OSError:
+                return None
+            release_dir = self.root / PUBLISH_RELEASES_DIRNAME / current
+            # Copie courante d'un script : reconnue seulement si elle est liée au fichier publié
+            try:
+                if not os.path.samestat(st, (release_dir / path.name).stat()):
+                    return None
+            except OSError:
+                return None
+        else:
+            return None
+        size, checksum = self._recorded_scripts(release_dir).get(path.name, (None, None))
+        return checksum if size == st.st_size else None
+
+    def checksum(self, path: Path, st: os.stat_result) -> str:
+        """SHA256 du fichier servi."""
+        recorded = self._recorded(path, st)
+        if recorded:
+            return recorded
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if key in self._computed:
+                return self._computed[key]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                digest.update(block)
+        with self._lock:
+            self._computed[key] = digest.hexdigest()
+        return self._computed[key]
+
+
+class ServerMetrics:
+    """Compteurs de requêtes et de débit, affichés périodiquement."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.active = 0
+        self.statuses: Dict[int, int] = {}
+        self._last = (self.started_at, 0, 0)
+
+    def record(self, status: int, sent: int):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += sent
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def connection(self, delta: int):
+        with self._lock:
+            self.active += delta
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Compteurs cumulés et débit depuis l'appel précédent."""
+        with self._lock:
+            now = time.monotonic()
+            last_time, last_requests, last_bytes = self._last
+            elapsed = max(now - last_time, 1e-6)
+            self._last = (now, self.requests, self.bytes_sent)
+            return {
+                'uptime_s': round(now - self.started_at, 1),
+                'requests': self.requests,
+                'bytes_sent': self.bytes_sent,
+                'active_connections': self.active,
+                'statuses': dict(sorted(self.statuses.items())),
+                'requests_per_s': round((self.requests - last_requests) / elapsed, 2),
+                'throughput_mb_s': round((self.bytes_sent - last_bytes) / elapsed / (1024 * 1024), 2),
+            }
+
+
+class UpdateRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET/HEAD de fichiers du répertoire servi.
+
+    ETag fort (SHA256), 'If-None-Match'/'If-Modified-Since' (304), plage unique
+    'Range' (206/416, 'If-Range'), envoi par 'sendfile' et connexions persistantes.
+    Les fichiers cachés (temporaires, verrou de publication) et les répertoires ne sont pas servis.
+    """
+
+    server_version = f"nvbuilder/{VERSION}"
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.metrics.connection(1)
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            self.server.metrics.connection(-1)
+
+    def log_message(self, format: str, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _resolve(self) -> Optional[Path]:
+        """Fichier demandé, None s'il est hors du répertoire servi, caché ou absent."""
+        url_path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        parts = [p for p in url_path.split('/') if p]
+        if any(p.startswith('.') for p in parts):
+            return None
+        path = self.server.root.joinpath(*parts)
+        try:
+            path.resolve().relative_to(self.server.root)
+        except ValueError:
+            return None
+        return path if path.is_file() else None
+
+    def _reply(self, status: int, headers: Dict[str, str], path: Optional[Path] = None):
+        """Réponse sans corps."""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header('Content-Length', '0')
+        self.end_headers()
+        self.record_transfer(path, status, 0)
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        """Validateurs conditionnels : 'If-None-Match' prioritaire sur 'If-Modified-Since'."""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            candidates = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in candidates or any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in candidates)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return int(mtime) <= email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range(self, size: int, etag: str) -> Optional[Tuple[int, int]]:
+        """
+        Plage demandée (début, fin incluse), None pour le fichier entier.
+
+        Raises:
+            ValueError: Plage non satisfiable
+        """
+        header = self.headers.get('Range')
+        if not header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range.strip() != etag:
+            return None
+        match = RANGE_HEADER.fullmatch(header.strip())
+        if not match or match.group(1) == match.group(2) == '':
+            return None  # Syntaxe inconnue ou plages multiples : fichier entier
+        first, last = match.groups()
+        if first == '':
+            length = int(last)
+            if length == 0:
+                raise ValueError(header)
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            raise ValueError(header)
+        return start, end
+
+    def _serve(self, send_body: bool):
+        path = self._resolve()
+        if path is None:
+            self._reply(HTTPStatus.NOT_FOUND, {})
+            return
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self._reply(HTTPStatus.NOT_FOUND, {})
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            etag = f'"{self.server.checksums.checksum(path, st)}"'
+            validators = {
+                'ETag': etag,
+                'Last-Modified': email.utils.formatdate(st.st_mtime, usegmt=True),
+                'Cache-Control': self._cache_control(path),
+            }
+            if self._not_modified(etag, st.st_mtime):
+                self._reply(HTTPStatus.NOT_MODIFIED, validators, path)
+                return
+            try:
+                byte_range = self._range(st.st_size, etag)
+            except ValueError:
+                self._reply(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                            dict(validators, **{'Content-Range': f"bytes */{st.st_size}"}), path)
+                return
+
+            start, end = byte_range or (0, st.st_size - 1)
+            length = end - start + 1 if st.st_size else 0
+            status = HTTPStatus.PARTIAL_CONTENT if byte_range else HTTPStatus.OK
+            self.send_response(status)
+            for name, value in validators.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', mimetypes.guess_type(path.name)[0] or 'application/octet-stream')
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            if byte_range:
+                self.send_header('Content-Range', f"bytes {start}-{end}/{st.st_size}")
+            self.end_headers()
+
+            sent = 0
+            if send_body and length:
+                self.wfile.flush()
+                try:
+                    sent = self.send_body(f, start, length)
+                except OSError as e:
+                    # Client déconnecté en cours de transfert (reprise par Range côté client)
+                    self.close_connection = True
+                    logger.debug(f"Transfert de '{path.name}' interrompu: {e}")
+            self.record_transfer(path, status, sent)
+
+    def send_body(self, f, start: int, length: int) -> int:
+        """Envoie 'length' octets du fichier à partir de 'start'. Retourne le nombre d'octets envoyés."""
+        # socket.sendfile : os.sendfile lorsque disponible, envoi par blocs sinon
+        return self.connection.sendfile(f, start, length)
+
+    def record_transfer(self, path: Optional[Path], status: int, sent: int):
+        """Comptabilise une réponse (path: None pour une réponse sans fichier)."""
+        self.server.metrics.record(status, sent)
+
+    def _cache_control(self, path: Path) -> str:
+        """Blocs du magasin immuables (nommés par leur contenu), revalidation pour le reste."""
+        if path.parent.parent.name == CHUNK_STORE_DIRNAME and SHA256_NAME.fullmatch(path.name):
+            return "public, max-age=31536000, immutable"
+        return "no-cache"
+
+
+class UpdateServer(ThreadingHTTPServer):
+    """
+    Serveur des points de mise à jour d'un répertoire de publication (nvbuilder publish).
+
+    Utilisable comme serveur local dans des tests :
+
+        with UpdateServer(repo_dir, port=0) as server:
+            server.start()
+            ... server.url ...
+    """
+
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, root: Path, host: str = DEFAULT_SERVE_HOST, port: int = DEFAULT_SERVE_PORT,
+                 handler_class=UpdateRequestHandler):
+        self.root = Path(root).resolve()
+        if not self.root.is_dir():
+            raise NvBuilderError(f"Répertoire à servir introuvable: {self.root}")
+        self.checksums = ChecksumIndex(self.root)
+        self.metrics = ServerMetrics()
+        self._thread: Optional[threading.Thread] = None
+        super().__init__((host, port), handler_class)
+
+    @property
+    def url(self) -> str:
+        """URL de base du serveur (port effectif si 'port=0')."""
+        host, port = self.server_address[:2]
+        if host in ('0.0.0.0', '::', ''):
+            host = '127.0.0.1'
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'UpdateServer':
+        """Démarre le serveur dans un thread (arrêté par shutdown() ou à la sortie du bloc 'with')."""
+        self._thread = threading.Thread(target=self.serve_forever, name="nvbuilder-serve", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        if self._thread:
+            self.shutdown()
+            self._thread.join()
+        super().__exit__(*args)
+
+
+def format_metrics(metrics: ServerMetrics) -> str:
+    """Ligne de compteurs du serveur (débit depuis l'affichage précédent)."""
+    snapshot = metrics.snapshot()
+    statuses = ", ".join(f"{code}: {count}" for code, count in snapshot['statuses'].items()) or "-"
+    return (f"Requêtes: {snapshot['requests']} ({snapshot['requests_per_s']}/s) [{statuses}] - "
+            f"envoyé: {snapshot['bytes_sent'] / (1024 * 1024):.1f} Mo ({snapshot['throughput_mb_s']} Mo/s) - "
+            f"connexions actives: {snapshot['active_connections']}")
+
+
+def serve(root: Path, host: str = DEFAULT_SERVE_HOST, port: int = DEFAULT_SERVE_PORT,
+          metrics_interval: int = DEFAULT_SERVE_METRICS_INTERVAL):
+    """
+    Sert un répertoire de publication jusqu'à interruption (Ctrl+C).
+
+    Args:
+        root: Répertoire servi
+        host: Adresse d'écoute
+        port: Port d'écoute
+        metrics_interval: Secondes entre deux affichages des compteurs (0 : jamais)
+    """
+    with UpdateServer(root, host, port) as server:
+        server.start()
+        print(f"{INFO_COLOR}Service de {PATH_COLOR}{server.root}{INFO_COLOR} sur {HIGHLIGHT_STYLE}{server.url}{RESET_STYLE} "
+              f"(Ctrl+C pour arrêter)", flush=True)
+        try:
+            while True:
+                time.sleep(metrics_interval or 3600)
+                if metrics_interval:
+                    print(f"{DETAIL_COLOR}{time.strftime('%H:%M:%S')} {format_metrics(server.metrics)}{RESET_STYLE}", flush=True)
+        finally:
+            print(f"{DETAIL_COLOR}{format_metrics(server.metrics)}{RESET_STYLE}", flush=True)
@@ -7,7 +7,7 @@ import fnmatch
 import os
 import yaml
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 import base64  # Pour encoder/décoder en Base64
 import subprocess  # Pour exécuter des commandes externes
@@ -22,6 +22,7 @@ except ImportError:
     Style.RESET_ALL = ""
 
 from .exceptions import ToolNotFoundError, EncryptionError
+from .cipher import encrypt_bytes, in_process_supported
 # Importer constantes nécessaires pour chiffrement jeton
 from .constants import (
     DEFAULT_OPENSSL_CIPHER, 
@@ -56,6 +57,160 @@ def calculate_checksum(file_path: Path) -> str:
         logger.error(f"Checksum impossible pour {file_path}: {e}")
         return "checksum_error"
 
+def calculate_checksum_multi(file_paths: List[Path]) -> str:
+    """
+    Calcule le checksum SHA256 de la concaténation ordonnée de plusieurs fichiers.
+    
+    Args:
+        file_paths: Chemins des fichiers, dans l'ordre de concaténation
+        
+    Returns:
+        str: Checksum hexadécimal
+    """
+    sha256_hash = hashlib.sha256()
+    buffer_size = 65536
+    try:
+        for file_path in file_paths:
+            with open(file_path, 'rb') as f:
+                while True:
+                    data = f.read(buffer_size)
+                    if not data:
+                        break
+                    sha256_hash.update(data)
+        return sha256_hash.hexdigest()
+    except Exception as e:
+        logger.error(f"Checksum impossible pour {file_paths}: {e}")
+        return "checksum_error"
+
+def calculate_block_checksums(file_path: Path, block_size: int) -> Tuple[str, List[str]]:
+    """
+    Calcule en une lecture le SHA256 d'un fichier et celui de chacun de ses blocs.
+    
+    Args:
+        file_path: Chemin du fichier
+        block_size: Taille des blocs (le dernier peut être plus court)
+        
+    Returns:
+        Tuple: (checksum du fichier, checksums des blocs dans l'ordre)
+    """
+    sha256_hash = hashlib.sha256()
+    block_sums: List[str] = []
+    buffer_size = 65536
+    try:
+        with open(file_path, 'rb') as f:
+            while True:
+                block_hash, remaining = hashlib.sha256(), block_size
+                while remaining:
+                    data = f.read(min(buffer_size, remaining))
+                    if not data:
+                        break
+                    sha256_hash.update(data)
+                    block_hash.update(data)
+                    remaining -= len(data)
+                if remaining == block_size:
+                    break
+                block_sums.append(block_hash.hexdigest())
+                if remaining:
+                    break
+        return sha256_hash.hexdigest(), block_sums
+    except Exception as e:
+        logger.error(f"Checksum impossible pour {file_path}: {e}")
+        return "checksum_error", []
+
+class HashingFile:
+    """Fichier binaire en écriture qui calcule son SHA256 et sa taille au fil de l'eau."""
+
+    def __init__(self, file_path: Optional[Path]):
+        """
+        Ouvre (tronque) le fichier cible.
+        
+        Args:
+            file_path: Chemin du fichier à écrire (None : SHA256 et taille seulement, rien n'est écrit)
+        """
+        self.path = file_path
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = None
+        if file_path is not None:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(file_path, 'wb')
+
+    def write(self, data: bytes) -> int:
+        if self._file:
+            self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        if self._file:
+            self._file.flush()
+
+    def close(self):
+        if self._file and not self._file.closed:
+            self._file.close()
+
+    def hexdigest(self) -> str:
+        """Retourne le SHA256 des données écrites jusqu'ici."""
+        return self._hash.hexdigest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class TeeWriter:
+    """
+    Objet fichier en écriture qui duplique chaque bloc vers plusieurs sorties.
+    
+    Utilisé comme fileobj de tarfile (ou pour recopier la sortie d'un outil de
+    chiffrement) afin de produire plusieurs artefacts à partir d'un seul flux.
+    Les sorties ne sont pas fermées par le TeeWriter.
+    """
+
+    def __init__(self, outputs: List[Any]):
+        """
+        Args:
+            outputs: Objets disposant d'une méthode write(bytes)
+        """
+        self.outputs = [o for o in outputs if o is not None]
+        self.position = 0
+
+    def write(self, data: bytes) -> int:
+        for output in self.outputs:
+            output.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        for output in self.outputs:
+            if hasattr(output, 'flush'):
+                output.flush()
+
+def open_artifact(config: Dict[str, Any], kind: str) -> Optional[HashingFile]:
+    """
+    Ouvre l'artefact 'output.artifacts.<kind>' s'il est configuré.
+    
+    Args:
+        config: Configuration du build
+        kind: Type d'artefact ('archive', 'encrypted_archive')
+        
+    Returns:
+        Optional[HashingFile]: Fichier ouvert en écriture, ou None si non configuré
+    """
+    artifact_path = config.get('output', {}).get('artifacts', {}).get(kind)
+    if not artifact_path:
+        return None
+    path = get_absolute_path(artifact_path, config.get('_config_dir', Path('.')))
+    if config.get('debug_mode', False):
+        logger.info(f"Artefact '{kind}' -> {path}")
+    return HashingFile(path)
+
 def check_tool_availability(tool_name: str) -> str:
     """
     Vérifie si un outil externe est disponible dans le PATH.
@@ -166,6 +321,45 @@ def get_absolute_path(path_str: str, base_dir: Path) -> Path:
     path = Path(path_str)
     return (base_dir / path).resolve() if not path.is_absolute() else path.resolve()
 
+def merge_dicts(default: Dict, loaded: Dict) -> Dict:
+    """
+    Fusionne récursivement deux dictionnaires.
+    
+    Args:
+        default: Dictionnaire de base (non modifié, copie superficielle)
+        loaded: Valeurs prioritaires
+        
+    Returns:
+        Dict: Dictionnaire fusionné
+    """
+    merged = default.copy() # Commencer avec une copie des défauts
+    # Parcourir les clés chargées
+    for key, loaded_value in loaded.items():
+        default_value = merged.get(key)
+        # Si la clé existe dans les deux et ce sont des dictionnaires -> fusion récursive
+        if isinstance(loaded_value, dict) and isinstance(default_value, dict):
+            merged[key] = merge_dicts(default_value, loaded_value)
+        # Sinon (clé nouvelle, ou pas des dictionnaires) -> remplacer par la valeur chargée
+        else:
+            merged[key] = loaded_value
+    return merged
+
+def url_list(value: Any) -> List[str]:
+    """
+    Normalise une URL de mise à jour configurée seule ou sous forme de liste de miroirs.
+    
+    Args:
+        value: Chaîne ou liste de chaînes (les entrées vides sont ignorées)
+        
+    Returns:
+        List[str]: URLs dans l'ordre de préférence
+    """
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [url.strip() for url in value if isinstance(url, str) and url.strip()]
+
 def _get_nested(data: Dict, keys: List[str], default: Any = None) -> Any:
     """
     Récupère une valeur imbriquée dans un dictionnaire.
@@ -315,7 +509,11 @@ def encrypt_string_to_base64(plaintext: str, password: str, tool: str,
     plaintext_bytes = plaintext.encode('utf-8')
 
     try:
-        if tool == "openssl":
+        if tool == "openssl" and in_process_supported(cipher):
+            # Chiffrement interne, même format que 'openssl enc' (pas de processus)
+            ciphertext = encrypt_bytes(plaintext_bytes, password, cipher, iterations)
+
+        elif tool == "openssl":
             # Utiliser une variable d'environnement pour le mot de passe
             env['NVBUILDER_TOKEN_PASS'] = password
             # Chiffrer depuis stdin vers stdout
@@ -0,0 +1,106 @@
+# tests/support.py
+"""Outils communs des tests : serveurs de mise à jour locaux, builds et fonctions Bash du modèle."""
+
+import contextlib
+import io
+import re
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from nvbuilder.builder import NvBuilder
+from nvbuilder.server import UpdateServer, UpdateRequestHandler
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+TEMPLATE_PATH = REPO_ROOT / "nvbuilder" / "extractor_template.sh"
+HAS_SHELL_TOOLS = bool(shutil.which("bash") and shutil.which("curl"))
+
+
+class StandInHandler(UpdateRequestHandler):
+    """Requêtes enregistrées, latence, réponses en erreur et corps coupés (voir StandInServer)."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('Range')))
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_status and (not server.fail_paths or self.path.endswith(server.fail_paths)):
+            self._reply(server.fail_status, {})
+            return
+        super().do_GET()
+
+    def send_body(self, f, start: int, length: int) -> int:
+        with self.server.lock:
+            cut = self.server.cuts > 0
+            if cut:
+                self.server.cuts -= 1
+        if not cut:
+            return super().send_body(f, start, length)
+        # Connexion fermée après la moitié du corps annoncé
+        self.close_connection = True
+        return super().send_body(f, start, length // 2)
+
+
+class StandInServer(UpdateServer):
+    """
+    Serveur de mise à jour local pour les tests.
+
+    Args:
+        root: Répertoire servi
+        latency: Délai (s) avant chaque réponse
+        fail_status: Code renvoyé à la place des fichiers (aucun par défaut)
+        fail_paths: Suffixes des chemins concernés par fail_status (tous si vide)
+        cuts: Nombre de réponses dont le corps est coupé à mi-parcours
+    """
+
+    def __init__(self, root: Path, latency: float = 0, fail_status: Optional[int] = None,
+                 fail_paths: Tuple[str, ...] = (), cuts: int = 0):
+        self.latency = latency
+        self.fail_status = fail_status
+        self.fail_paths = fail_paths
+        self.cuts = cuts
+        self.requests: List[Tuple[str, Optional[str]]] = []
+        self.lock = threading.Lock()
+        super().__init__(root, '127.0.0.1', 0, StandInHandler)
+
+    def requested(self, suffix: str) -> List[Optional[str]]:
+        """En-têtes Range des requêtes dont le chemin se termine par 'suffix' (None : sans Range)."""
+        with self.lock:
+            return [byte_range for path, byte_range in self.requests if path.endswith(suffix)]
+
+
+def build_script(work_dir: Path, config: Dict[str, Any], password: str = "") -> Tuple[Path, NvBuilder]:
+    """Écrit la configuration (YAML) dans work_dir et génère le script. Retourne son chemin et le builder."""
+    import yaml
+    config_path = work_dir / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config, sort_keys=False), encoding='utf-8')
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        builder = NvBuilder(str(config_path))
+        builder._prompt_password = lambda label=None: password
+        script_path = builder.build()
+    if not script_path:
+        raise AssertionError(f"Build échoué:\n{output.getvalue()}")
+    return Path(script_path), builder
+
+
+def template_functions(*names: str) -> str:
+    """Source des fonctions Bash 'names' du modèle de script (définies au premier niveau)."""
+    text = TEMPLATE_PATH.read_text(encoding='utf-8')
+    sources = []
+    for name in names:
+        match = re.search(rf"^{re.escape(name)}\(\) \{{(?:[^\n]*\}}\n|.*?^\}}\n)", text, re.S | re.M)
+        if not match:
+            raise AssertionError(f"Fonction '{name}' absente du modèle")
+        sources.append(match.group(0))
+    return "".join(sources)
+
+
+def run_bash(script: str, cwd: Path, env: Optional[Dict[str, str]] = None,
+             timeout: float = 60) -> subprocess.CompletedProcess:
+    """Exécute un script Bash (mode strict du script généré)."""
+    return subprocess.run(['bash', '-c', "set -euo pipefail\n" + script], cwd=cwd, env=env,
+                          capture_output=True, text=True, timeout=timeout)
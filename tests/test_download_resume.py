@@ -0,0 +1,86 @@
+# tests/test_download_resume.py
+"""Téléchargement des mises à jour (download_resumable) : reprise par Range et vérification par blocs."""
+
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests.support import HAS_SHELL_TOOLS, StandInServer, run_bash, template_functions
+
+BLOCK_SIZE = 16 * 1024
+FUNCTIONS = template_functions('info', 'warning', 'file_size', 'sha256_stream', 'truncate_file',
+                               'verified_blocks', 'download_range', 'download_resumable')
+PRELUDE = """
+CURL_LIMITS=(--connect-timeout 5 --speed-limit 1 --speed-time 20)
+WGET_LIMITS=(--connect-timeout=5 --read-timeout=20)
+INFO_COLOR="" WARNING_COLOR="" RESET_STYLE=""
+"""
+CALL = 'download_resumable "$URL" "$TARGET" "$EXPECTED" "$SIZE" "$BLOCK_SIZE" "$SUMS_FILE"\n'
+
+
+@unittest.skipUnless(HAS_SHELL_TOOLS, "bash et curl requis")
+class DownloadResumableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = Path(tempfile.mkdtemp(prefix="nvb_test_resume_"))
+        self.served = self.work_dir / 'served'
+        self.served.mkdir()
+        self.content = random.Random(7).randbytes(10 * BLOCK_SIZE + 123)
+        (self.served / 'app.sh').write_bytes(self.content)
+        self.sums_file = self.work_dir / 'blocks.sha256'
+        self.sums_file.write_text("".join(
+            hashlib.sha256(self.content[i:i + BLOCK_SIZE]).hexdigest() + "\n"
+            for i in range(0, len(self.content), BLOCK_SIZE)))
+        self.target = self.work_dir / 'app_new.sh'
+        self.part = Path(f"{self.target}.part")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def download(self, server: StandInServer, expected: str, attempts: int = 3):
+        env = dict(os.environ, URL=f"{server.url}/app.sh", TARGET=str(self.target), EXPECTED=expected,
+                   SIZE=str(len(self.content)), BLOCK_SIZE=str(BLOCK_SIZE), SUMS_FILE=str(self.sums_file))
+        return run_bash(PRELUDE + f"DOWNLOAD_ATTEMPTS={attempts}\n" + FUNCTIONS + CALL, self.work_dir, env)
+
+    def test_resumes_with_range_after_dropped_connection(self):
+        with StandInServer(self.served, cuts=1) as server:
+            server.start()
+            result = self.download(server, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(self.target.read_bytes(), self.content)
+        self.assertFalse(self.part.exists())
+        # Deuxième requête à partir des octets déjà reçus
+        ranges = server.requested('/app.sh')
+        self.assertEqual(len(ranges), 2)
+        self.assertIn(ranges[0], (None, "bytes=0-"))
+        self.assertEqual(ranges[1], f"bytes={len(self.content) // 2}-")
+
+    def test_corrupted_part_truncated_after_last_valid_block(self):
+        expected = hashlib.sha256(self.content).hexdigest()
+        part = bytearray(self.content[:4 * BLOCK_SIZE])
+        part[2 * BLOCK_SIZE + 100] ^= 0xFF
+        self.part.write_bytes(part)
+        Path(f"{self.part}.id").write_text(expected + "\n")
+        with StandInServer(self.served) as server:
+            server.start()
+            result = self.download(server, expected)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(self.target.read_bytes(), self.content)
+        # Suite du fichier partiel, puis reprise après les deux blocs valides (jamais depuis le début)
+        self.assertEqual(server.requested('/app.sh'), [f"bytes={4 * BLOCK_SIZE}-", f"bytes={2 * BLOCK_SIZE}-"])
+
+    def test_target_only_created_when_checksum_matches(self):
+        with StandInServer(self.served) as server:
+            server.start()
+            result = self.download(server, hashlib.sha256(b"autre contenu").hexdigest(), attempts=2)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertFalse(self.target.exists())
+        self.assertIn("Checksum invalide", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
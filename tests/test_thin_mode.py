@@ -0,0 +1,91 @@
+# tests/test_thin_mode.py
+"""Mode thin : segments téléchargés depuis payload_url, mis en cache et vérifiés à chaque exécution."""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests.support import HAS_SHELL_TOOLS, StandInServer, build_script
+
+
+@unittest.skipUnless(HAS_SHELL_TOOLS, "bash et curl requis")
+class ThinModeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = Path(tempfile.mkdtemp(prefix="nvb_test_thin_"))
+        content = cls.work_dir / 'content'
+        for name in ('bin', 'data', 'lib'):
+            (content / name).mkdir(parents=True)
+            (content / name / f"{name}.bin").write_bytes(os.urandom(20000))
+        (content / 'start.sh').write_text("#!/bin/bash\necho 'application lancée'\n", encoding='utf-8')
+        os.chmod(content / 'start.sh', 0o755)
+        cls.script_path, _ = build_script(cls.work_dir, {
+            'content': './content',
+            'script': 'start.sh',
+            'output': {'path': 'build/app.sh', 'mode': 'thin', 'payload_dir': 'build/payload',
+                       'payload_url': 'http://127.0.0.1:9/payload'},
+            'payload': {'segmentation': 'directory'},
+        })
+        cls.payload_dir = cls.work_dir / 'build' / 'payload'
+        cls.segments = sorted(p.name for p in cls.payload_dir.glob('*.seg'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.run_dir = Path(tempfile.mkdtemp(prefix="run_", dir=self.work_dir))
+        self.cache_dir = self.run_dir / 'cache'
+        shutil.copy2(self.script_path, self.run_dir / 'app.sh')
+        self.server = StandInServer(self.payload_dir).start()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+
+    def run_script(self) -> subprocess.CompletedProcess:
+        env = dict(os.environ, NVBUILDER_PAYLOAD_URL=self.server.url, NVBUILDER_CACHE_DIR=str(self.cache_dir))
+        result = subprocess.run(['bash', 'app.sh'], cwd=self.run_dir, env=env, stdin=subprocess.DEVNULL,
+                                capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn("application lancée", result.stdout)
+        return result
+
+    def downloads(self) -> dict:
+        return {name: len(self.server.requested(f"/{name}")) for name in self.segments}
+
+    def cached(self, name: str) -> Path:
+        return self.cache_dir / 'payloads' / name
+
+    def test_first_run_downloads_and_caches(self):
+        self.assertGreater(len(self.segments), 1)
+        self.run_script()
+        self.assertEqual(self.downloads(), {name: 1 for name in self.segments})
+        for name in self.segments:
+            self.assertEqual(self.cached(name).read_bytes(), (self.payload_dir / name).read_bytes())
+
+    def test_second_run_uses_cache(self):
+        self.run_script()
+        self.run_script()
+        self.assertEqual(self.downloads(), {name: 1 for name in self.segments})
+
+    def test_tampered_cache_entry_downloaded_again(self):
+        self.run_script()
+        tampered = self.segments[0]
+        data = bytearray(self.cached(tampered).read_bytes())
+        data[len(data) // 2] ^= 0xFF
+        self.cached(tampered).write_bytes(data)
+
+        result = self.run_script()
+        self.assertIn("Segment en cache corrompu", result.stdout + result.stderr)
+        expected = {name: 1 for name in self.segments}
+        expected[tampered] = 2
+        self.assertEqual(self.downloads(), expected)
+        self.assertEqual(self.cached(tampered).read_bytes(), (self.payload_dir / tampered).read_bytes())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# tests/test_update_mirrors.py
+"""Course entre miroirs de version.json, pénalité des miroirs en échec et repli du téléchargement."""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from tests.support import HAS_SHELL_TOOLS, StandInServer, build_script
+
+
+@unittest.skipUnless(HAS_SHELL_TOOLS, "bash et curl requis")
+class MirrorRaceTest(unittest.TestCase):
+    """
+    Trois miroirs : 'slow' (lent mais valide), 'failing' (erreur 500) et 'good' (version.json
+    valide, mais script en erreur). La course doit retenir 'good', pénaliser 'failing' et
+    télécharger le script depuis 'slow'.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = Path(tempfile.mkdtemp(prefix="nvb_test_mirrors_"))
+        cls.servers = {}
+        for name, options in (('slow', {'latency': 1.0}),
+                              ('failing', {'fail_status': 500}),
+                              ('good', {'fail_status': 500, 'fail_paths': ('/app.sh',)})):
+            root = cls.work_dir / name
+            root.mkdir()
+            cls.servers[name] = StandInServer(root, **options).start()
+        names = list(cls.servers)
+        cls.version_urls = [f"{cls.servers[n].url}/version.json" for n in names]
+
+        content = cls.work_dir / 'content'
+        content.mkdir()
+        (content / 'start.sh').write_text("#!/bin/bash\necho 'application lancée'\n", encoding='utf-8')
+        os.chmod(content / 'start.sh', 0o755)
+        script_path, builder = build_script(cls.work_dir, {
+            'content': './content',
+            'script': 'start.sh',
+            'output': {'path': 'build/app.sh'},
+            'update': {
+                'enabled': True,
+                'mode': 'auto-replace-always',
+                'version_url': cls.version_urls,
+                'package_url': [f"{cls.servers[n].url}/app.sh" for n in names],
+                'version_file_path': 'build/version.json',
+                'max_time': 20,
+            },
+        })
+
+        # Même script annoncé comme version suivante sur chaque miroir
+        version = json.loads((cls.work_dir / 'build' / 'version.json').read_text(encoding='utf-8'))
+        version['build_version'] = str(int(builder.build_version) + 1)
+        for name in names:
+            (cls.work_dir / name / 'version.json').write_text(json.dumps(version), encoding='utf-8')
+            shutil.copy2(script_path, cls.work_dir / name / 'app.sh')
+
+        cls.run_dir = cls.work_dir / 'run'
+        cls.run_dir.mkdir()
+        shutil.copy2(script_path, cls.run_dir / 'app.sh')
+        env = dict(os.environ, XDG_CACHE_HOME=str(cls.run_dir / 'cache'))
+        cls.started = time.time()
+        cls.result = subprocess.run(['bash', 'app.sh'], cwd=cls.run_dir, env=env, stdin=subprocess.DEVNULL,
+                                    capture_output=True, text=True, timeout=120)
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers.values():
+            server.__exit__(None, None, None)
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def state_file(self, suffix: str) -> Path:
+        found = list((self.run_dir / 'cache').rglob(f"*{suffix}"))
+        self.assertEqual(len(found), 1, f"{suffix}: {found}\n{self.result.stdout}{self.result.stderr}")
+        return found[0]
+
+    def test_update_installed(self):
+        self.assertEqual(self.result.returncode, 0, self.result.stderr)
+        self.assertIn("Checksum script OK", self.result.stdout)
+        self.assertIn("application lancée", self.result.stdout)
+
+    def test_fastest_valid_mirror_wins(self):
+        state = dict(line.split('=', 1) for line in self.state_file('.state').read_text().splitlines() if '=' in line)
+        self.assertEqual(state['mirror'], f"{self.servers['good'].url}/version.json")
+
+    def test_failing_mirror_backoff_recorded(self):
+        entries = {line.split()[0]: line.split()[1:] for line in self.state_file('.mirrors').read_text().splitlines()}
+        failures, retry_at = entries[f"{self.servers['failing'].url}/version.json"]
+        self.assertEqual(failures, "1")
+        self.assertGreater(int(retry_at), self.started)
+        self.assertNotIn(f"{self.servers['slow'].url}/version.json", entries)
+
+    def test_package_falls_back_to_next_mirror(self):
+        # Script demandé d'abord au miroir retenu (en erreur), puis au suivant dans l'ordre de la liste
+        self.assertTrue(self.servers['good'].requested('/app.sh'))
+        self.assertTrue(self.servers['slow'].requested('/app.sh'))
+        self.assertFalse(self.servers['failing'].requested('/app.sh'))
+        self.assertTrue((self.run_dir / 'app.sh').is_file())
+
+
+if __name__ == "__main__":
+    unittest.main()